@@ -1,90 +1,108 @@
-import os 
-import requests
-import base64
-
-from dotenv import load_dotenv
-from flask import Flask, session, request, render_template, flash, redirect, url_for, g, current_app, jsonify
-from flask_wtf import FlaskForm, CSRFProtect
-from flask_debugtoolbar import DebugToolbarExtension
-from flask_login import LoginManager, login_user, logout_user, current_user, login_required
-
-from models import db, connect_db, User, Comment, Like, Follower, Post
-from forms import PostForm, LoginForm, SignupForm, CommentForm, SearchForm
-
-CURR_USER_KEY = "curr_user"
-
-load_dotenv()
-
-#Initialize Flask app and configuration
-app = Flask(__name__)
-# app.app_context().push()
-
-app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('SUPABASE_DB_URL', 'postgresql:///muse_db')
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['SQLALCHEMY_ECHO'] = True
+import logging
+from datetime import timedelta
 
-app.config['DEBUG_TB_INTERCEPT_REDIRECTS'] = True
-#app.config['DEBUG'] = True
-app.config['PROPAGATE_EXCEPTIONS'] = True
-app.config['SECRET_KEY'] = os.getenv('SECRET_KEY')
+import click
 
-SPOTIFY_CLIENT_ID = os.getenv('SPOTIFY_CLIENT_ID')
-SPOTIFY_CLIENT_SECRET = os.getenv('SPOTIFY_CLIENT_SECRET')
-
-
-connect_db(app)
-toolbar = DebugToolbarExtension(app)
-
-#Initialize extensions
-login_manager = LoginManager(app)
-login_manager.login_view = 'login' # redirect to login if user is not authenticated
-csrf = CSRFProtect(app)
+from flask import Flask, Blueprint, request, render_template, flash, redirect, url_for, g, current_app, jsonify, abort
+from flask_wtf import CSRFProtect
+from sqlalchemy.orm import joinedload
+from flask_login import LoginManager, login_user, logout_user, current_user, login_required
 
+from models import db, connect_db, User, Comment, Like, Follower, Post, increment, reconcile_counters, bump_versions
+from forms import PostForm, LoginForm, SignupForm, CommentForm, SearchForm
+from feed import get_feed_page
+from profiles import get_profile_summary, get_profile_posts, get_liked_posts, get_followers, get_following
+import timeline
+import trending
+import migrate
+import jobs
+import seed
+from spotify import autocomplete, autocomplete_stats, client as spotify_client, token_manager, spotify_flight
+from catalog import hydrate
+from fragments import render_card, invalidate_card, card_cache
+from search import search_users as find_users, user_index
+from identity import load_identity, invalidate_user, user_cache
+from passwords import hasher, PasswordHasherBusy
+import metrics
+import replicas
+from metrics import registry, log_event
+from conditional import conditional, stats as conditional_stats
+from budget import query_budget, stats as budget_stats
+from config import get_config
+
+# Extensions and routes are created unbound and attached to each app in create_app()
+login_manager = LoginManager()
+login_manager.login_view = 'main.login' # redirect to login if user is not authenticated
+csrf = CSRFProtect()
+
+bp = Blueprint('main', __name__, cli_group=None)
 
 
 ########################################################################################################
 
-# Retrieves the user by their ID, Flask-login needs to maintain the user session across requests
+# Retrieves the user by their ID, Flask-login needs to maintain the user session across requests.
+# Called at most once per request; the user usually comes from a short-lived cache (see identity.py)
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    return load_identity(int(user_id))
+
+def wants_json():
+    """True when the client asked for JSON (the fetch() calls in comment.js) rather than a page."""
+    accept = request.accept_mimetypes
+    return accept.accept_json and not accept.accept_html
 
 """Authentication routes"""
 
-@app.before_request
-def add_user_to_g():
-    """If we're logged in, add curr user to Flask global."""
-    if CURR_USER_KEY in session:
-        g.user = User.query.get(session[CURR_USER_KEY])
+@bp.app_errorhandler(PasswordHasherBusy)
+def password_hasher_busy(error):
+    """The password hashing pool is full: ask the client to retry instead of queueing more work."""
+    flash('We are handling a lot of logins right now. Please try again in a moment.', 'warning')
+    form = SignupForm() if request.endpoint == 'main.signup' else LoginForm()
+    template = 'signup.html' if request.endpoint == 'main.signup' else 'login.html'
+    return render_template(template, form=form), 503, {'Retry-After': '2'}
 
-    else:
-        g.user = None
+@bp.app_template_global()
+def post_card(post, form):
+    """A post card for the current user; the parts every viewer sees come from a cache (see fragments.py)."""
+    return render_card(post, form, current_user.id)
+
+@bp.before_app_request
+def add_user_to_g():
+    """If we're logged in, add curr user to Flask global (the same object as current_user)."""
+    if request.endpoint == 'static':
+        return
+    g.user = current_user._get_current_object() if current_user.is_authenticated else None
 
-@app.route('/')
+@bp.route('/')
 def root():
     """Redirect to the login page if user is not logged in."""
     if current_user.is_authenticated:  # check if there's a user in Flask's global object
-        return redirect(url_for('feed'))  #redirect to the homepage if logged in 
-    return redirect(url_for('login'))  #redirect to login if not authenticated
+        return redirect(url_for('main.feed'))  #redirect to the homepage if logged in 
+    return redirect(url_for('main.login'))  #redirect to login if not authenticated
 
-@app.route('/login', methods=['GET', 'POST'])
+@bp.route('/login', methods=['GET', 'POST'])
 def login():
     """handle user login"""
     form = LoginForm()
     if form.validate_on_submit():
         user = User.authenticate(form.username.data, form.password.data)
         if user:
+            if db.session.is_modified(user):  # password rehashed with the current bcrypt cost
+                db.session.commit()
+                invalidate_user(user.id)
             login_user(user)
-            print(f"Logged in user: {user.username}")
-            return redirect(url_for('feed'))  # Redirect to user feed after login
+            metrics.logins.inc(outcome='success')
+            log_event('login', user_id=user.id)
+            return redirect(url_for('main.feed'))  # Redirect to user feed after login
         else:
             form.username.errors = ['Invalid username/password.']
-            print("Login failed: Invalid username/password.")
+            metrics.logins.inc(outcome='failure')
+            log_event('login_failed', level=logging.WARNING, username=form.username.data)
             
     return render_template('login.html', form=form)
             
 
-@app.route('/signup', methods=['GET', 'POST'] )
+@bp.route('/signup', methods=['GET', 'POST'] )
 def signup():
     """handle user signup"""
     form = SignupForm()
@@ -110,101 +128,29 @@ def signup():
                            password=password)
         
         db.session.commit()  #save new user to the database
+        user_index.add(user)  #make the new user searchable right away
 
         login_user(user)  #login the user after signup
 
         flash('Account created successfully!', 'success')
-        return redirect(url_for('feed'))
+        return redirect(url_for('main.feed'))
 
     return render_template('signup.html', form=form)
         
 
-@app.route('/logout')
+@bp.route('/logout')
 @login_required
 def logout():
     """Logs user out and redirects to homepage."""
+    invalidate_user(current_user.id)
     logout_user()
     return redirect("/login")
 
 #######################################################################################################
 
 
-# Spotify API Client Credentials Flow #
-
-def get_spotify_access_token():
-    """Get an access token using Spotify's Client Credentials Flow"""
-
-    auth_url = "https://accounts.spotify.com/api/token"
-
-    headers ={
-       'Content-Type': 'application/x-www-form-urlencoded'
-    }
-
-    data = {
-        'grant_type': 'client_credentials',  # Required parameter
-        'client_id': SPOTIFY_CLIENT_ID,      # Your Client ID
-        'client_secret': SPOTIFY_CLIENT_SECRET # Your Client Secret
-    }
-
-    response = requests.post(auth_url, headers=headers, data=data)
-    
-    if response.status_code == 200:
-        token_info = response.json()
-        return token_info.get('access_token')
-    else:
-        print(f"Error getting Spotify token: {response.status_code}")
-        return None
-
-# Store spotify access token globally
-spotify_access_token = get_spotify_access_token()
-    
-def search_spotify_api(query, search_type='track'):
-    """Search for songs or playlists using the Spotify API."""
-    global spotify_access_token
-    
-    # If the token expires, get a new one
-    if not spotify_access_token:
-        spotify_access_token = get_spotify_access_token()
-
-    headers = {
-        'Authorization': f'Bearer {spotify_access_token}'
-    }
-    params = {
-        'q': query,
-        'type': search_type,
-        'limit': 10
-    }
-
-    response = requests.get('https://api.spotify.com/v1/search', headers=headers, params=params)
-    if response.status_code == 200:
-        return response.json()
-    else:
-        print(f"Error searching Spotify: {response.status_code}")
-        return None
-
-
-def get_spotify_item(spotify_id, item_type='track'):
-    """Fetching the details of the selected song or playlist from Spotify API"""
-    access_token = get_spotify_access_token()
-
-    if item_type == 'track':
-        url = f"https://api.spotify.com/v1/tracks/{spotify_id}"
-    elif item_type == 'playlist':
-        url = f"https://api.spotify.com/v1/playlists/{spotify_id}"
-
-    headers = {
-        "Authorization": f"Bearer {access_token}"
-    }
-
-    response = requests.get(url, headers=headers)
-
-    if response.status_code == 200:
-        return response.json()
-    else:
-        raise Exception(f"Failed to fetch item from Sotify API: {response.status_code}")
-
 # Search Spotify route
-@app.route('/search_spotify', methods=['GET'])
+@bp.route('/search_spotify', methods=['GET'])
 def search_spotify():
     """Return Spotify search results in real-time as the user types."""
     search_query = request.args.get('query', '')
@@ -212,29 +158,10 @@ def search_spotify():
     if not search_query:
         return jsonify({'error': 'No search query provided'}), 400
 
-    # Spotify API request
-    spotify_url = 'https://api.spotify.com/v1/search'
-
-    headers = {
-        'Authorization': f'Bearer {get_spotify_access_token()}'  # Ensure SPOTIFY_TOKEN is defined somewhere
-    }
-
-    params = {
-        'q': search_query,
-        'type': 'track,playlist',
-        'limit': 5  # Limit to 5 results
-    }
-
-    response = requests.get(spotify_url, headers=headers, params=params)
-
-    if response.status_code == 200:
-        data = response.json()
+    # Spotify API request (results are cached per query and shared between users)
+    results = autocomplete(search_query)
 
-        # Process Spotify API response for tracks and playlists
-        tracks = [{'id': item['id'], 'name': item['name'], 'artist': item['artists'][0]['name']} for item in data.get('tracks', {}).get('items', [])]
-        playlists = [{'id': item['id'], 'name': item['name']} for item in data.get('playlists', {}).get('items', [])]
-
-        results = {'tracks': tracks, 'playlists': playlists}
+    if results is not None:
         return jsonify(results)
     else:
         return jsonify({'error': 'Failed to fetch data from Spotify API'}), 500
@@ -249,105 +176,200 @@ def search_spotify():
 # profile unfollowing
 
 
-@app.route('/profile/<int:user_id>')
+@bp.route('/profile/<int:user_id>')
 @login_required
+@query_budget(statements=10)
+@conditional('user_id')  # 304 from the viewer's and profile owner's versions, before the queries below
 def user_profile(user_id):
-    """Display user profile with posts, followers, following, and likes"""
-    user = User.query.get_or_404(user_id)
-    
-    # Get the user's posts
-    user_posts = Post.query.filter_by(user_id=user_id).all()
-    
-    # Get liked posts by the user
-    liked_posts = Post.query.join(Like, Like.post_id == Post.id).filter(Like.user_id == user_id).all()
+    """Display user profile with the header counts, follow state and the first page of posts"""
+    # counts and follow state in one query; more posts load on scroll from /profile/<id>/posts/page
+    profile = get_profile_summary(user_id, current_user.id)
+    if profile is None:
+        abort(404)
 
-    # Get followers and following counts
-    followers_count = user.followers.count()
-    following_count = user.followed.count()
-    likes_count = len(liked_posts)  # Count liked posts
+    posts, next_cursor = get_profile_posts(user_id, current_user.id)
+    hydrate(posts)
 
     return render_template('user_profile.html',
-                           user=user,
-                           user_posts=user_posts,
-                           followers_count=followers_count,
-                           following_count=following_count,
-                           likes_count=likes_count,  # Pass likes count to the template
-                           liked_posts=liked_posts)
+                           user=profile,
+                           posts=posts,
+                           form=PostForm(),
+                           next_url=url_for('main.profile_posts_page', user_id=user_id, cursor=next_cursor) if next_cursor else None)
 
+# header counts and follow state as JSON
+@bp.route('/profile/<int:user_id>/summary')
+@login_required
+@query_budget(statements=3)
+def profile_summary(user_id):
+    """Return the profile header for the user as JSON."""
+    profile = get_profile_summary(user_id, current_user.id)
+    if profile is None:
+        abort(404)
+    return jsonify(profile.to_dict())
+
+# next page of the user's posts for infinite scroll
+@bp.route('/profile/<int:user_id>/posts/page')
+@login_required
+@query_budget(statements=8)
+def profile_posts_page(user_id):
+    """Return the next page of the user's posts as JSON, with the rendered post cards."""
+    try:
+        posts, next_cursor = get_profile_posts(user_id, current_user.id, cursor=request.args.get('cursor'))
+    except ValueError:
+        return jsonify({'error': 'Invalid cursor'}), 400
 
+    next_url = url_for('main.profile_posts_page', user_id=user_id, cursor=next_cursor) if next_cursor else None
+    return post_page_response(posts, next_cursor, next_url)
 
 # followers of current user
-@app.route('/profile/<int:user_id>/followers')
+@bp.route('/profile/<int:user_id>/followers')
 @login_required
+@query_budget(statements=5)
 def user_followers(user_id):
-    """ Show list of followers for the user"""
+    """ Show the first page of followers for the user"""
     user = User.query.get_or_404(user_id)
-    followers = User.query.join(Follower, Follower.follower_id == User.id).filter(Follower.followed_id == user_id).all()
+    followers, next_cursor = get_followers(user_id, current_user.id)
 
-    return render_template('followers.html', user=user, followers=followers)
+    return render_template('followers.html', user=user, followers=followers,
+                           next_url=url_for('main.followers_page', user_id=user_id, cursor=next_cursor) if next_cursor else None)
 
 # following of current user
-@app.route('/profile/<int:user_id>/following')
+@bp.route('/profile/<int:user_id>/following')
 @login_required
+@query_budget(statements=5)
 def user_following(user_id):
-    """Show list of people the user is following"""
+    """Show the first page of people the user is following"""
     user = User.query.get_or_404(user_id)
-    following = User.query.join(Follower, Follower.followed_id == User.id).filter(Follower.follower_id == user.id).all()
+    following, next_cursor = get_following(user_id, current_user.id)
 
-    return render_template('following.html', user=user, following=following)
+    return render_template('following.html', user=user, following=following,
+                           next_url=url_for('main.following_page', user_id=user_id, cursor=next_cursor) if next_cursor else None)
+
+# next pages of the follower and following lists for infinite scroll
+@bp.route('/profile/<int:user_id>/followers/page')
+@login_required
+@query_budget(statements=5)
+def followers_page(user_id):
+    """Return the next page of the user's followers as JSON, with the rendered rows."""
+    try:
+        entries, next_cursor = get_followers(user_id, current_user.id, cursor=request.args.get('cursor'))
+    except ValueError:
+        return jsonify({'error': 'Invalid cursor'}), 400
+
+    next_url = url_for('main.followers_page', user_id=user_id, cursor=next_cursor) if next_cursor else None
+    return follow_page_response(entries, next_cursor, next_url)
+
+@bp.route('/profile/<int:user_id>/following/page')
+@login_required
+@query_budget(statements=5)
+def following_page(user_id):
+    """Return the next page of users the user follows as JSON, with the rendered rows."""
+    try:
+        entries, next_cursor = get_following(user_id, current_user.id, cursor=request.args.get('cursor'))
+    except ValueError:
+        return jsonify({'error': 'Invalid cursor'}), 400
+
+    next_url = url_for('main.following_page', user_id=user_id, cursor=next_cursor) if next_cursor else None
+    return follow_page_response(entries, next_cursor, next_url)
+
+
+def follow_page_response(entries, next_cursor, next_url):
+    """JSON for one page of a follower or following list, with the rows rendered for infinite scroll."""
+    rows = [render_template('_follow_row.html', entry=entry) for entry in entries]
+    return jsonify({
+        'users': [entry.to_dict() for entry in entries],
+        'html': ''.join(rows),
+        'next_cursor': next_cursor,
+        'next_url': next_url
+    })
 
 # handle the following users of other users
-@app.route('/follow/<int:user_id>', methods=["POST"])
+@bp.route('/follow/<int:user_id>', methods=["POST"])
 @login_required
 def follow_user(user_id):
     """Follow a user."""
 
     user_to_follow = User.query.get_or_404(user_id)
 
-    if current_user.is_following(user_to_follow):
+    # follow() is a single insert that does nothing if we already follow them
+    followed = current_user.follow(user_to_follow)
+    if followed:
+        timeline.enqueue_backfill(current_user, user_to_follow)  # show their recent posts in our feed
+        db.session.commit()
+
+    if wants_json():
+        return follow_state_response(user_to_follow, following=True)
+
+    if not followed:
         flash(f'You are already following {user_to_follow.username}', 'warning')
     else:
-        current_user.follow(user_to_follow)
-        db.session.commit()
         flash(f'You are now following {user_to_follow.username}', 'success')
-
-    return redirect(url_for('user_profile', user_id=user_id))
+    return redirect(url_for('main.user_profile', user_id=user_id))
 
 #handle unfollowing user of other users
-@app.route('/unfollow/<int:user_id>', methods=["POST"])
+@bp.route('/unfollow/<int:user_id>', methods=["POST"])
 @login_required
 def unfollow_user(user_id):
     """Unfollow a user."""
 
     user_to_unfollow = User.query.get_or_404(user_id)
 
-    if not current_user.is_following(user_to_unfollow):
+    unfollowed = current_user.unfollow(user_to_unfollow)
+    if unfollowed:
+        timeline.prune(current_user, user_to_unfollow)  # drop their posts from our feed
+        db.session.commit()
+
+    if wants_json():
+        return follow_state_response(user_to_unfollow, following=False)
+
+    if not unfollowed:
         flash(f'You are not following {user_to_unfollow.username}', 'warning')
     else:
-        current_user.unfollow(user_to_unfollow)
-        db.session.commit()
         flash(f'You have unfollowed {user_to_unfollow.username}', 'success')
+    return redirect(url_for('main.user_profile', user_id=user_id))
+
 
-    return redirect(url_for('user_profile', user_id=user_id))
+def follow_state_response(user, following):
+    """JSON for a follow or unfollow: the new state and the user's follower count (re-read after the commit)."""
+    return jsonify({'user_id': user.id,
+                    'following': following,
+                    'follower_count': user.follower_count})
 
 # current user likes
-@app.route('/profile/<int:user_id>/likes')
+@bp.route('/profile/<int:user_id>/likes')
 @login_required
+@query_budget(statements=10)
+@conditional('user_id')
 def user_likes(user_id):
-    """Show all posts liked by the user"""
+    """Show the first page of posts liked by the user"""
     user = User.query.get_or_404(user_id)
-    
-    # Get the liked posts
-    liked_posts = Post.query.join(Like, Like.post_id == Post.id).filter(Like.user_id == user_id).all()
 
-    return render_template('liked_posts.html', user=user, liked_posts=liked_posts)
+    liked_posts, next_cursor = get_liked_posts(user_id, current_user.id)
+    hydrate(liked_posts)
+
+    return render_template('liked_posts.html', user=user, liked_posts=liked_posts, form=PostForm(),
+                           next_url=url_for('main.liked_posts_page', user_id=user_id, cursor=next_cursor) if next_cursor else None)
+
+# next page of liked posts for infinite scroll
+@bp.route('/profile/<int:user_id>/likes/page')
+@login_required
+@query_budget(statements=8)
+def liked_posts_page(user_id):
+    """Return the next page of posts liked by the user as JSON, with the rendered post cards."""
+    try:
+        posts, next_cursor = get_liked_posts(user_id, current_user.id, cursor=request.args.get('cursor'))
+    except ValueError:
+        return jsonify({'error': 'Invalid cursor'}), 400
+
+    next_url = url_for('main.liked_posts_page', user_id=user_id, cursor=next_cursor) if next_cursor else None
+    return post_page_response(posts, next_cursor, next_url)
 
 
 ####################################################################################
 
 """ Post Routes """
 
-@app.route('/add_post', methods=['GET', 'POST'])
+@bp.route('/add_post', methods=['GET', 'POST'])
 @login_required
 def add_post():
     """Allow the user to add a post with a song or playlist."""
@@ -369,65 +391,88 @@ def add_post():
         )
 
         db.session.add(post)  # Add the new post to the session
-        db.session.commit()   # Commit the session to save changes
+        db.session.flush()    # Assign the post ID before fanning out
+        timeline.enqueue_fan_out(post)  # Copy the post into followers' timelines in the background
+        bump_versions([current_user.id])
+        trending.record_post(post)
+        jobs.enqueue('warm_catalog', key=f"warm_catalog:{post.id}", post_id=post.id)  # album art etc. before anyone scrolls to it
+        db.session.commit()   # Commit the session to save changes (and the jobs with it)
 
         flash('Post added!', 'success')  # Flash a success message
-        return redirect(url_for('feed'))  # Redirect to the feed or another page
+        return redirect(url_for('main.feed'))  # Redirect to the feed or another page
 
     return render_template('add_post.html', form=form)  # Render the form if not submitted or invalid
 
 # delete a post
-@app.route('/delete_post/<int:post_id>', methods=['POST'])
+@bp.route('/delete_post/<int:post_id>', methods=['POST'])
 @login_required
 def delete_post(post_id):
     """Delete a post from the database."""
-    print("Delete post route hit")
     post = Post.query.get_or_404(post_id)  # Retrieve the post by ID
     
    # Ensure that only the post's author can delete it
     if post.author != current_user:
         flash('You do not have permission to delete this post.', 'danger')
-        return redirect(url_for('feed'))
+        return redirect(url_for('main.feed'))
     
     # remove associated likes and comment first
     Comment.query.filter_by(post_id=post.id).delete()
+    (User.query
+     .filter(User.id.in_(db.session.query(Like.user_id).filter(Like.post_id == post.id)))
+     .update({User.liked_count: User.liked_count - 1}, synchronize_session=False))
+    bump_versions(db.session.query(Like.user_id).filter(Like.post_id == post.id))  # their liked posts pages
     Like.query.filter_by(post_id=post.id).delete()
+    timeline.remove_post(post)
 
     db.session.delete(post)  # Remove the post from the session
     db.session.commit()       # Commit the changes to the database
+    invalidate_card(post_id)
+    log_event('post_deleted', post_id=post_id, user_id=current_user.id)
 
     flash('Post deleted!', 'success')  # Flash a success message
-    return redirect(url_for('feed'))  # Redirect to the feed
+    return redirect(url_for('main.feed'))  # Redirect to the feed
 
 # lika a post
-@app.route('/post/<int:post_id>/like', methods=['POST'])
+@bp.route('/post/<int:post_id>/like', methods=['POST'])
 @login_required
 def like_post(post_id):
     """Like a post."""
     post = Post.query.get_or_404(post_id)
     
-    if not current_user.has_liked_post(post):
-        like = Like(user_id=current_user.id, post_id=post.id)
-        db.session.add(like)
+    if current_user.like_post(post):  # no-op if already liked; also bumps the like counters
+        trending.record_like(post)
         db.session.commit()
-    
-    return redirect(request.referrer or url_for('feed'))
+        invalidate_card(post.id)
+
+    if wants_json():
+        return like_state_response(post, liked=True)
+    return redirect(request.referrer or url_for('main.feed'))
 
 # unlike a post
-@app.route('/post/<int:post_id>/unlike', methods=['POST'])
+@bp.route('/post/<int:post_id>/unlike', methods=['POST'])
 @login_required
 def unlike_post(post_id):
     """Unlike a post."""
     post = Post.query.get_or_404(post_id)
     
-    if current_user.has_liked_post(post):
-        Like.query.filter_by(user_id=current_user.id, post_id=post.id).delete()
+    if current_user.unlike_post(post):  # also lowers the like counters
+        trending.record_like(post, -1)
         db.session.commit()
+        invalidate_card(post.id)
+
+    if wants_json():
+        return like_state_response(post, liked=False)
+    return redirect(request.referrer or url_for('main.feed'))
 
-    return redirect(request.referrer or url_for('feed'))
+
+def like_state_response(post, liked):
+    """JSON for a like or unlike: the new state and the post's like count (re-read after the commit)."""
+    return jsonify({'post_id': post.id,
+                    'liked': liked,
+                    'like_count': post.like_count})
 
 # add comments
-@app.route('/post/<int:post_id>/comment', methods=['POST'])
+@bp.route('/post/<int:post_id>/comment', methods=['POST'])
 @login_required
 def add_comment(post_id):
     """Add a comment to a post."""
@@ -436,21 +481,40 @@ def add_comment(post_id):
 
     comment_text = request.form.get('comment')
 
-    if form.validate_on_submit():
-        comment = Comment(content=form.content.data, user_id=current_user.id, post_id=post.id)
-        
-        db.session.add(comment)
-        db.session.commit()
+    if not form.validate_on_submit():
+        if wants_json():
+            return jsonify({'errors': form.errors}), 400
+        return redirect(request.referrer or url_for('main.feed'))
 
-    return redirect(request.referrer or url_for('feed'))
+    comment = Comment(content=form.content.data, user_id=current_user.id, post_id=post.id)
+
+    db.session.add(comment)
+    increment(Post.comment_count, post.id)
+    bump_versions([current_user.id, post.user_id])
+    db.session.commit()
+    invalidate_card(post.id)
+
+    if wants_json():
+        return jsonify({'post_id': post.id,
+                        'comment': {'id': comment.id,
+                                    'content': comment.content,
+                                    'username': current_user.username},
+                        'comment_count': post.comment_count})
+    return redirect(request.referrer or url_for('main.feed'))
 
 #view comments
-@app.route('/post/<int:post_id>/comments')
+@bp.route('/post/<int:post_id>/comments')
 @login_required
+@query_budget(statements=4)
 def view_comments(post_id):
     """View all comments for a specific post."""
     post = Post.query.get_or_404(post_id)
-    comments = post.comments
+    # commenters in the same query, rather than one query per comment in the template
+    comments = (Comment.query
+                .filter_by(post_id=post.id)
+                .options(joinedload(Comment.user))
+                .order_by(Comment.id)
+                .all())
     return render_template('view_comments.html', post=post, comments=comments)
 
 #####################################################################################
@@ -458,21 +522,60 @@ def view_comments(post_id):
  #Fetch all post from users the current user is following, including their own posts
 
 """ Feed Route """
-@app.route('/feed')
+@bp.route('/feed')
 @login_required
+@query_budget(statements=10)
+@conditional()
 def feed():
     """Display posts from the current user and followed users"""
 
-    # Retrieve the IDs of the followed users
-    followed_user_ids = [f.followed_id for f in current_user.followed]
+    # Fetch the first page of posts from followed users and the current user, with
+    # author and like/comment data loaded in the same query (no per-post lookups in the template)
+    posts, next_cursor = get_feed_page(current_user)
+    hydrate(posts)  # album art, duration and previews from the local Spotify catalog
+
+    form = PostForm()
+    return render_template('feed.html', posts=posts, form=form, next_cursor=next_cursor)
+
+# next page of the feed for infinite scroll
+@bp.route('/feed/page')
+@login_required
+@query_budget(statements=8)
+def feed_page():
+    """Return the next page of feed posts as JSON, with the rendered post cards."""
+    cursor = request.args.get('cursor')
+
+    try:
+        posts, next_cursor = get_feed_page(current_user, cursor=cursor)
+    except ValueError:
+        return jsonify({'error': 'Invalid cursor'}), 400
+
+    next_url = url_for('main.feed_page', cursor=next_cursor) if next_cursor else None
+    return post_page_response(posts, next_cursor, next_url)
+
 
-    # Create a query to fetch posts from followed users and the current user
-    posts = Post.query.filter(
-        (Post.user_id.in_(followed_user_ids)) | (Post.user_id == current_user.id)
-    ).order_by(Post.timestamp.desc()).all()
+def post_page_response(posts, next_cursor, next_url):
+    """JSON for one page of post cards: the post data plus the cards rendered for infinite scroll."""
+    hydrate(posts)
 
     form = PostForm()
-    return render_template('feed.html', posts=posts, form=form)
+    cards = [post_card(post, form) for post in posts]
+
+    return jsonify({
+        'posts': [{'id': post.id,
+                   'author': post.author_username,
+                   'spotify_id': post.spotify_id,
+                   'spotify_name': post.spotify_name,
+                   'artist_name': post.artist_name,
+                   'caption': post.caption,
+                   'timestamp': post.timestamp.isoformat(),
+                   'like_count': post.like_count,
+                   'comment_count': post.comment_count,
+                   'liked_by_me': bool(post.liked_by_me)} for post in posts],
+        'html': ''.join(cards),
+        'next_cursor': next_cursor,
+        'next_url': next_url
+    })
 
 
 
@@ -480,17 +583,208 @@ def feed():
 ######################################################################################
 
 """ Searching users routes"""
-@app.route('/search', methods=['GET'])
+@bp.route('/search', methods=['GET'])
 @login_required
+@query_budget(statements=4)
 def search_users():
+    """Show one page of users matching the search, best matches first."""
     query = request.args.get('query', '')  # Get the query from the URL parameters
+    page = request.args.get('page', 1, type=int)
     
-    if query:  # Ensure the query is not empty
-        results = User.query.filter(User.username.ilike(f'%{query}%')).all()
-        return render_template('search_results.html', results=results, query=query)
+    if query.strip():  # Ensure the query is not empty
+        results, has_next = find_users(query, page=max(page, 1))
+        return render_template('search_results.html', results=results, query=query,
+                               page=max(page, 1), has_next=has_next)
     
     flash('Please enter a search term.', 'warning')  # Handle empty search
-    return redirect(url_for('feed'))
+    return redirect(url_for('main.feed'))
+
+
+######################################################################################
+
+""" Trending """
+
+# leaderboards come from time-bucketed counters and are cached for a minute (see trending.py)
+@bp.route('/trending')
+@login_required
+@query_budget(statements=6)
+def trending_page():
+    """Show the tracks and playlists with the most posts and likes over a window (1h, 24h or 7d)."""
+    window = request.args.get('window', trending.DEFAULT_WINDOW)
+    try:
+        items = trending.get_trending(window)
+    except KeyError:
+        abort(404)
+    hydrate(items)  # album art from the local catalog
+
+    return render_template('trending.html', items=items, window=window, windows=trending.WINDOWS)
+
+# the same leaderboard as JSON
+@bp.route('/trending/top')
+@login_required
+@query_budget(statements=2)
+def trending_top():
+    """Return the top items of a window as JSON, best first."""
+    window = request.args.get('window', trending.DEFAULT_WINDOW)
+    limit = request.args.get('limit', 20, type=int)
+    try:
+        items = trending.get_trending(window, limit)
+    except KeyError:
+        return jsonify({'error': 'Unknown window', 'windows': list(trending.WINDOWS)}), 400
+
+    return jsonify({'window': window, 'items': [item.to_dict() for item in items]})
+
+
+######################################################################################
+
+""" Monitoring """
+
+registry.collector('autocomplete', autocomplete_stats)
+registry.collector('spotify_client', spotify_client.stats)
+registry.collector('spotify_token', token_manager.stats)
+registry.collector('spotify_flight', spotify_flight.stats)
+registry.collector('user_cache', user_cache.stats)
+registry.collector('password_pool', hasher.stats)
+registry.collector('jobs', jobs.queue_stats)
+registry.collector('conditional_get', conditional_stats)
+registry.collector('post_cards', card_cache.stats)
+registry.collector('replicas', replicas.health.stats)
+registry.collector('query_budget', budget_stats)
+registry.collector('trending', trending.stats)
+
+
+######################################################################################
+
+""" CLI commands """
+@bp.cli.group('db')
+def db_commands():
+    """Manage the database schema."""
+
+@db_commands.command('upgrade')
+def db_upgrade():
+    """Apply pending schema migrations."""
+    applied = migrate.upgrade(db.engine)
+    print(f"Applied {len(applied)} migration(s)." if applied else "Database is up to date.")
+
+@db_commands.command('status')
+def db_status():
+    """List migrations that have not been applied yet."""
+    pending = migrate.pending_migrations(db.engine)
+    for version, module in pending:
+        print(f"pending: {version}")
+    if not pending:
+        print("Database is up to date.")
+
+@bp.cli.command('rebuild-timelines')
+def rebuild_timelines():
+    """Rebuild every user's materialised feed timeline from posts and follows."""
+    user_ids = [user_id for (user_id,) in db.session.query(User.id)]
+    for user_id in user_ids:
+        timeline.rebuild_timeline(User.query.get(user_id))
+        db.session.commit()
+    print("Timelines rebuilt.")
+
+@bp.cli.command('calibrate-passwords')
+def calibrate_passwords():
+    """Show the bcrypt cost this machine would pick for the configured target time."""
+    rounds = hasher.calibrate()
+    print(f"bcrypt cost {rounds} for a {current_app.config['PASSWORD_HASH_TARGET_MS']} ms target")
+
+@bp.cli.command('seed')
+@click.option('--users', default=seed.DEFAULT_SIZES['users'], show_default=True)
+@click.option('--follows', default=seed.DEFAULT_SIZES['follows'], show_default=True)
+@click.option('--posts', default=seed.DEFAULT_SIZES['posts'], show_default=True)
+@click.option('--likes', default=seed.DEFAULT_SIZES['likes'], show_default=True)
+@click.option('--comments', default=seed.DEFAULT_SIZES['comments'], show_default=True)
+@click.option('--tracks', default=seed.DEFAULT_SIZES['tracks'], show_default=True, help='Catalog tracks the posts share.')
+@click.option('--alpha', default=seed.ALPHA, show_default=True, help='Pareto shape; lower is more skewed.')
+@click.option('--seed', 'seed_value', default=1, show_default=True, help='Random seed, for repeatable datasets.')
+def seed_command(users, follows, posts, likes, comments, tracks, alpha, seed_value):
+    """Fill the database with a synthetic power-law dataset."""
+    written = seed.generate(users=users, follows=follows, posts=posts, likes=likes,
+                            comments=comments, tracks=tracks, alpha=alpha, seed=seed_value)
+    for table, count in written.items():
+        print(f"{table}: {count}")
+
+@bp.cli.command('reconcile-counters')
+def reconcile_counters_command():
+    """Recompute like, comment and follow counters from the underlying rows."""
+    drift = reconcile_counters()
+    db.session.commit()
+    for counter, fixed in drift.items():
+        print(f"{counter}: {fixed} rows fixed")
+
+@bp.cli.group('trending')
+def trending_commands():
+    """Maintain the trending leaderboard."""
+
+@trending_commands.command('prune')
+def trending_prune():
+    """Delete activity buckets older than the longest trending window."""
+    deleted = trending.prune()
+    db.session.commit()
+    print(f"Deleted {deleted} old bucket(s).")
+
+@bp.cli.group('jobs')
+def jobs_commands():
+    """Run and inspect background jobs."""
+
+@jobs_commands.command('work')
+@click.option('--once', is_flag=True, help='Exit when the queue is empty.')
+@click.option('--batch', default=jobs.BATCH_SIZE, show_default=True, help='Jobs claimed per poll.')
+@click.option('--poll-interval', default=jobs.POLL_INTERVAL, show_default=True, help='Seconds between polls of an empty queue.')
+def jobs_work(once, batch, poll_interval):
+    """Run queued jobs until interrupted."""
+    jobs.work(batch=batch, poll_interval=poll_interval, once=once)
+
+@jobs_commands.command('stats')
+def jobs_stats():
+    """Show queue depth and job latency."""
+    for name, value in jobs.queue_stats().items():
+        print(f"{name}: {value}")
+
+@jobs_commands.command('retry-dead')
+@click.option('--kind', default=None, help='Only retry dead jobs of this kind.')
+def jobs_retry_dead(kind):
+    """Requeue jobs that ran out of attempts."""
+    print(f"Requeued {jobs.retry_dead(kind)} job(s).")
+
+@jobs_commands.command('purge')
+@click.option('--days', default=7, show_default=True, help='Delete finished jobs older than this.')
+def jobs_purge(days):
+    """Delete old finished jobs."""
+    print(f"Deleted {jobs.purge(timedelta(days=days))} job(s).")
+
+
+######################################################################################
+
+def create_app(config=None):
+    """Build the app for a config profile ('development', 'testing', 'production' or a Config subclass; see config.py).
+
+    Nothing here talks to the network or the database: engines, the Spotify
+    token and the bcrypt cost are all set up on first use, and the schema is
+    managed by `flask db upgrade`.
+    """
+    app = Flask(__name__)
+    app.config.from_object(get_config(config))
+
+    logging.basicConfig(level=app.config['LOG_LEVEL'], format='%(asctime)s %(name)s %(levelname)s %(message)s')
+
+    # registered first so the time spent loading the user is counted too
+    metrics.instrument(app)
+    connect_db(app)
+    replicas.init_app(app)
+    if app.config['DEBUG_TOOLBAR']:
+        from flask_debugtoolbar import DebugToolbarExtension
+        DebugToolbarExtension(app)
+    hasher.configure(workers=app.config['PASSWORD_HASH_WORKERS'],
+                     target_seconds=app.config['PASSWORD_HASH_TARGET_MS'] / 1000,
+                     rounds=app.config['PASSWORD_HASH_ROUNDS'])
 
+    login_manager.init_app(app)
+    csrf.init_app(app)
+    app.register_blueprint(bp)
+    return app
 
 
+app = create_app()
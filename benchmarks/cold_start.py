@@ -0,0 +1,93 @@
+"""Cold-start cost of the app: what a new gunicorn worker, CLI call or test run pays.
+
+Starts a fresh interpreter per run and times importing `app` (which builds the
+module-level app), building another app with create_app(), and serving the
+first request. It also counts the network connections and SQL statements made
+before the first request, which should both be zero.
+
+    python benchmarks/cold_start.py
+    python benchmarks/cold_start.py --runs 20 --config development
+"""
+
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = r'''
+import json, socket, sys, time
+started = time.perf_counter()
+
+connections = []
+connect = socket.socket.connect
+def counting_connect(sock, address):
+    connections.append(address)
+    return connect(sock, address)
+socket.socket.connect = counting_connect
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+statements = []
+event.listen(Engine, 'before_cursor_execute', lambda *args: statements.append(args[2]))
+
+sys.path.insert(0, ROOT)
+import app as module
+imported = time.perf_counter()
+
+second = module.create_app(CONFIG)
+created = time.perf_counter()
+before_request = (len(connections), len(statements))
+
+second.test_client().get('/login')
+served = time.perf_counter()
+
+print(json.dumps({
+    'import_ms': (imported - started) * 1000,
+    'create_app_ms': (created - imported) * 1000,
+    'first_request_ms': (served - created) * 1000,
+    'connections': before_request[0],
+    'sql_statements': before_request[1],
+}))
+'''
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def probe(config, env):
+    """Run one fresh interpreter and return its timings (plus the whole process's wall time)."""
+    code = PROBE.replace('ROOT', repr(ROOT)).replace('CONFIG', repr(config))
+    output = subprocess.run([sys.executable, '-c', code], env=env, cwd=ROOT,
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--config', default='production', help="config profile to start with")
+    args = parser.parse_args()
+
+    env = dict(os.environ,
+               APP_CONFIG=args.config,
+               SUPABASE_DB_URL=os.getenv('SUPABASE_DB_URL', 'sqlite://'),
+               SECRET_KEY=os.getenv('SECRET_KEY', 'benchmark'))
+
+    runs = [probe(args.config, env) for _ in range(args.runs)]
+
+    print(f"{'phase':<18} {'p50 ms':>9} {'p95 ms':>9}")
+    for phase in ('import_ms', 'create_app_ms', 'first_request_ms'):
+        values = [run[phase] for run in runs]
+        print(f"{phase[:-3]:<18} {percentile(values, 0.5):>9.1f} {percentile(values, 0.95):>9.1f}")
+
+    print(f"\nbefore the first request: {max(run['connections'] for run in runs)} network connection(s), "
+          f"{max(run['sql_statements'] for run in runs)} SQL statement(s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,229 @@
+"""Latency and query counts of the main pages and actions on a seeded database.
+
+Seeds a power-law dataset (see seed.py), then drives each endpoint through the
+Flask test client as a mix of signed-in users (popular profiles are viewed
+more often) and reports p50/p95 latency and SQL statements per request.
+
+    python benchmarks/endpoints.py                              # throwaway SQLite file
+    python benchmarks/endpoints.py --save benchmarks/baseline.json
+    python benchmarks/endpoints.py --baseline benchmarks/baseline.json --threshold 0.25
+    python benchmarks/endpoints.py --url postgresql:///muse_bench --users 20000 --posts 500000
+
+With --baseline the run exits with status 1 if an endpoint's p95 is more than
+`threshold` slower than the baseline's, or if it issues more SQL statements
+per request than the baseline did. Compare runs made on the same machine with
+the same sizes and seed. The target database must be empty.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+ENDPOINTS = ('feed', 'profile', 'likes', 'search', 'like', 'unlike', 'follow', 'unfollow')
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+class Bench:
+    """Signed-in requests against the app with per-request timing and SQL counts."""
+
+    def __init__(self, app, db):
+        self.client = app.test_client()
+        self.statements = 0
+
+        from sqlalchemy import event
+        with app.app_context():
+            event.listen(db.engine, 'before_cursor_execute', self._count)
+
+    def _count(self, *args):
+        self.statements += 1
+
+    def request(self, viewer_id, method, url):
+        """Make one request as `viewer_id`. Returns (seconds, SQL statements, status)."""
+        with self.client.session_transaction() as sess:
+            sess['_user_id'] = str(viewer_id)
+
+        headers = {'Accept': 'application/json'} if method == 'POST' else {}
+        self.statements = 0
+        started = time.perf_counter()
+        response = self.client.open(url, method=method, headers=headers)
+        elapsed = time.perf_counter() - started
+        return elapsed, self.statements, response.status_code
+
+
+def scenarios(db, rng, count):
+    """{endpoint: [(viewer id, method, url), ...]} with `count` requests each."""
+    from models import User, Post, Like, Follower
+    from sqlalchemy import select
+
+    users = db.session.execute(select(User.id, User.username, User.follower_count)).all()
+    user_ids = [user.id for user in users]
+    by_popularity = [user.follower_count + 1 for user in users]
+    post_ids = list(db.session.scalars(select(Post.id)))
+    liked = set(db.session.execute(select(Like.user_id, Like.post_id)).all())
+    follows = set(db.session.execute(select(Follower.follower_id, Follower.followed_id)).all())
+
+    def viewer():
+        return rng.choice(user_ids)
+
+    def popular():
+        return rng.choices(user_ids, weights=by_popularity)[0]
+
+    def fresh_pair(existing, pick):
+        while True:
+            pair = (viewer(), pick())
+            if pair not in existing and pair[0] != pair[1]:
+                existing.add(pair)
+                return pair
+
+    plan = {
+        'feed': [(viewer(), 'GET', '/feed') for _ in range(count)],
+        'profile': [(viewer(), 'GET', f'/profile/{popular()}') for _ in range(count)],
+        'likes': [(viewer(), 'GET', f'/profile/{popular()}/likes') for _ in range(count)],
+        'search': [(viewer(), 'GET', f'/search?query={rng.choice(users).username[:3]}') for _ in range(count)],
+    }
+
+    # each like is undone by the matching unlike, so the dataset ends as it started
+    like_pairs = [fresh_pair(liked, lambda: rng.choice(post_ids)) for _ in range(count)]
+    plan['like'] = [(user_id, 'POST', f'/post/{post_id}/like') for user_id, post_id in like_pairs]
+    plan['unlike'] = [(user_id, 'POST', f'/post/{post_id}/unlike') for user_id, post_id in like_pairs]
+
+    follow_pairs = [fresh_pair(follows, popular) for _ in range(count)]
+    plan['follow'] = [(user_id, 'POST', f'/follow/{followed_id}') for user_id, followed_id in follow_pairs]
+    plan['unfollow'] = [(user_id, 'POST', f'/unfollow/{followed_id}') for user_id, followed_id in follow_pairs]
+    return plan
+
+
+def run(bench, plan, endpoints, warmup):
+    """{endpoint: {'requests', 'p50_ms', 'p95_ms', 'queries', 'max_queries'}}."""
+    results = {}
+    for name in endpoints:
+        requests = plan[name]
+        for viewer_id, method, url in requests[:warmup]:
+            if method == 'GET':
+                bench.request(viewer_id, method, url)
+
+        timings, queries = [], []
+        for viewer_id, method, url in requests:
+            elapsed, statements, status = bench.request(viewer_id, method, url)
+            if status >= 400:
+                raise SystemExit(f"{method} {url} returned {status}")
+            timings.append(elapsed * 1000)
+            queries.append(statements)
+
+        results[name] = {
+            'requests': len(requests),
+            'p50_ms': round(percentile(timings, 0.5), 3),
+            'p95_ms': round(percentile(timings, 0.95), 3),
+            'queries': round(sum(queries) / len(queries), 2),
+            'max_queries': max(queries),
+        }
+    return results
+
+
+def regressions(results, baseline, threshold):
+    """Messages for endpoints that got slower than the threshold allows or issue more SQL."""
+    found = []
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        if result['p95_ms'] > before['p95_ms'] * (1 + threshold):
+            found.append(f"{name}: p95 {result['p95_ms']:.1f} ms, baseline {before['p95_ms']:.1f} ms")
+        if result['max_queries'] > before['max_queries']:
+            found.append(f"{name}: up to {result['max_queries']} queries, baseline {before['max_queries']}")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help="empty database to use (default: a temporary SQLite file)")
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--follows', type=int, default=40000)
+    parser.add_argument('--posts', type=int, default=20000)
+    parser.add_argument('--likes', type=int, default=100000)
+    parser.add_argument('--comments', type=int, default=20000)
+    parser.add_argument('--alpha', type=float, default=1.2, help="Pareto shape; lower is more skewed")
+    parser.add_argument('--requests', type=int, default=100, help="timed requests per endpoint")
+    parser.add_argument('--warmup', type=int, default=5, help="untimed page views before each endpoint")
+    parser.add_argument('--only', nargs='+', choices=ENDPOINTS, help="endpoints to run (default: all)")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--save', help="write the results to this JSON file")
+    parser.add_argument('--baseline', help="JSON results of an earlier run to compare against")
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help="allowed p95 slowdown against the baseline, as a fraction")
+    args = parser.parse_args()
+
+    path = None
+    if args.url:
+        url = args.url
+    else:
+        handle, path = tempfile.mkstemp(suffix='.db')
+        os.close(handle)
+        url = f"sqlite:///{path}"
+
+    # config.py reads the environment when it is imported
+    os.environ['SUPABASE_DB_URL'] = url
+    os.environ.setdefault('SECRET_KEY', 'benchmark')
+    os.environ.setdefault('PASSWORD_HASH_ROUNDS', '4')
+    os.environ['METRICS_LOG_SAMPLE_RATE'] = '0'
+    os.environ['SLOW_REQUEST_MS'] = '60000'
+
+    from app import create_app
+    from models import db
+    import migrate
+    import seed
+
+    app = create_app('production')
+    app.config['WTF_CSRF_ENABLED'] = False
+    rng = random.Random(args.seed)
+    endpoints = args.only or ENDPOINTS
+
+    try:
+        with app.app_context():
+            migrate.upgrade(db.engine, log=lambda message: None)
+            print("Seeding ...")
+            written = seed.generate(users=args.users, follows=args.follows, posts=args.posts, likes=args.likes,
+                                    comments=args.comments, alpha=args.alpha, seed=args.seed)
+            print(', '.join(f"{table} {count}" for table, count in written.items()))
+            plan = scenarios(db, rng, args.requests)
+            db.session.remove()
+
+        results = run(Bench(app, db), plan, endpoints, args.warmup)
+    finally:
+        with app.app_context():
+            db.engine.dispose()
+        if path:
+            os.remove(path)
+
+    print(f"\n{'endpoint':<10} {'p50 ms':>9} {'p95 ms':>9} {'queries':>8} {'max':>5}")
+    for name, result in results.items():
+        print(f"{name:<10} {result['p50_ms']:>9.2f} {result['p95_ms']:>9.2f} "
+              f"{result['queries']:>8.1f} {result['max_queries']:>5}")
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            found = regressions(results, json.load(f), args.threshold)
+        if found:
+            print("\nRegressions")
+            for message in found:
+                print(f"  {message}")
+            sys.exit(1)
+        print("\nNo regressions against the baseline.")
+
+
+if __name__ == '__main__':
+    main()
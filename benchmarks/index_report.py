@@ -0,0 +1,144 @@
+"""Before/after report for the hot-path indexes added in migration 0003.
+
+Seeds a database with migrations 0001-0002 only, then times each hot-path
+query and prints its plan; applies 0003 and does the same again.
+
+    python benchmarks/index_report.py                  # throwaway SQLite file
+    python benchmarks/index_report.py --url postgresql:///muse_bench --posts 500000
+
+The target database must be empty.
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+from datetime import datetime, timedelta
+
+import sqlalchemy as sa
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import migrate
+
+QUERIES = {
+    'profile posts': ("SELECT id FROM posts WHERE user_id = :user_id ORDER BY timestamp DESC LIMIT 20",
+                      lambda r, n: {'user_id': r.randint(1, n['users'])}),
+    'has liked post': ("SELECT COUNT(*) FROM likes WHERE user_id = :user_id AND post_id = :post_id",
+                       lambda r, n: {'user_id': r.randint(1, n['users']), 'post_id': r.randint(1, n['posts'])}),
+    'likes on post': ("SELECT COUNT(*) FROM likes WHERE post_id = :post_id",
+                      lambda r, n: {'post_id': r.randint(1, n['posts'])}),
+    'is following': ("SELECT COUNT(*) FROM followers WHERE follower_id = :a AND followed_id = :b",
+                     lambda r, n: {'a': r.randint(1, n['users']), 'b': r.randint(1, n['users'])}),
+    'follower list': ("SELECT follower_id FROM followers WHERE followed_id = :user_id",
+                      lambda r, n: {'user_id': r.randint(1, n['users'])}),
+    'post comments': ("SELECT id, content FROM comments WHERE post_id = :post_id",
+                      lambda r, n: {'post_id': r.randint(1, n['posts'])}),
+}
+
+
+def seed(engine, sizes, rng):
+    """Bulk insert users, posts, likes, follows and comments."""
+    now = datetime.utcnow()
+    with engine.begin() as conn:
+        conn.execute(sa.text("INSERT INTO users (id, username, email, password) VALUES (:id, :u, :e, 'x')"),
+                     [{'id': i, 'u': f"user{i}", 'e': f"user{i}@example.com"} for i in range(1, sizes['users'] + 1)])
+        conn.execute(sa.text("INSERT INTO posts (id, user_id, spotify_id, spotify_name, timestamp) "
+                             "VALUES (:id, :user_id, 's', 'Song', :ts)"),
+                     [{'id': i, 'user_id': rng.randint(1, sizes['users']), 'ts': now - timedelta(minutes=i)}
+                      for i in range(1, sizes['posts'] + 1)])
+
+        likes = {(rng.randint(1, sizes['users']), rng.randint(1, sizes['posts'])) for _ in range(sizes['likes'])}
+        conn.execute(sa.text("INSERT INTO likes (user_id, post_id) VALUES (:u, :p)"),
+                     [{'u': u, 'p': p} for u, p in likes])
+
+        follows = {(rng.randint(1, sizes['users']), rng.randint(1, sizes['users'])) for _ in range(sizes['follows'])}
+        conn.execute(sa.text("INSERT INTO followers (follower_id, followed_id) VALUES (:a, :b)"),
+                     [{'a': a, 'b': b} for a, b in follows])
+
+        conn.execute(sa.text("INSERT INTO comments (content, user_id, post_id) VALUES ('nice', :u, :p)"),
+                     [{'u': rng.randint(1, sizes['users']), 'p': rng.randint(1, sizes['posts'])}
+                      for _ in range(sizes['comments'])])
+
+        if conn.dialect.name == 'postgresql':
+            conn.execute(sa.text("ANALYZE"))
+
+
+def explain(conn, sql, params):
+    prefix = 'EXPLAIN QUERY PLAN' if conn.dialect.name == 'sqlite' else 'EXPLAIN'
+    rows = conn.execute(sa.text(f"{prefix} {sql}"), params).fetchall()
+    return ' | '.join(str(row[-1]) for row in rows)
+
+
+def measure(engine, sizes, runs, seed_value):
+    """Return {query name: (mean ms, plan)}."""
+    results = {}
+    with engine.connect() as conn:
+        for name, (sql, make_params) in QUERIES.items():
+            rng = random.Random(seed_value)
+            params = [make_params(rng, sizes) for _ in range(runs)]
+            plan = explain(conn, sql, params[0])
+
+            started = time.perf_counter()
+            for values in params:
+                conn.execute(sa.text(sql), values).fetchall()
+            results[name] = ((time.perf_counter() - started) * 1000 / runs, plan)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help="empty database to use (default: a temporary SQLite file)")
+    parser.add_argument('--users', type=int, default=5000)
+    parser.add_argument('--posts', type=int, default=100000)
+    parser.add_argument('--likes', type=int, default=300000)
+    parser.add_argument('--follows', type=int, default=100000)
+    parser.add_argument('--comments', type=int, default=100000)
+    parser.add_argument('--runs', type=int, default=200, help="executions per query")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    path = None
+    if args.url:
+        url = args.url
+    else:
+        handle, path = tempfile.mkstemp(suffix='.db')
+        os.close(handle)
+        url = f"sqlite:///{path}"
+
+    sizes = {name: getattr(args, name) for name in ('users', 'posts', 'likes', 'follows', 'comments')}
+    engine = sa.create_engine(url)
+    quiet = lambda message: None
+
+    try:
+        migrations = migrate.load_migrations()
+        with engine.begin() as conn:
+            for version, module in migrations:
+                if version < '0003':
+                    module.upgrade(conn)
+
+        print(f"Seeding {sizes} ...")
+        seed(engine, sizes, random.Random(args.seed))
+
+        before = measure(engine, sizes, args.runs, args.seed)
+        migrate.upgrade(engine, log=quiet)
+        after = measure(engine, sizes, args.runs, args.seed)
+
+        print(f"\n{'query':<16} {'before ms':>10} {'after ms':>10} {'speedup':>8}")
+        for name in QUERIES:
+            slow, fast = before[name][0], after[name][0]
+            print(f"{name:<16} {slow:>10.3f} {fast:>10.3f} {slow / fast:>7.1f}x")
+
+        print("\nPlans")
+        for name in QUERIES:
+            print(f"  {name}\n    before: {before[name][1]}\n    after:  {after[name][1]}")
+    finally:
+        engine.dispose()
+        if path:
+            os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
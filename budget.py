@@ -0,0 +1,156 @@
+"""Query budgets: a cap on the SQL statements and database time of a view or block.
+
+    @query_budget(statements=10)
+    def feed(): ...
+
+    with query_budget(statements=2, seconds=0.05, name='hydrate'):
+        hydrate(posts)
+
+Every statement run inside a budget is counted and timed. When the block ends
+over budget, the violation lists the statements that ran more than once, with
+the stack (app code and templates) that issued each one's first repeat. That is
+usually an N+1 query. With QUERY_BUDGET_RAISE set (development and tests) the
+violation is raised as QueryBudgetExceeded. Otherwise it is logged as a
+warning, counted at /metrics, and the request carries on.
+"""
+
+import os
+import time
+import logging
+import threading
+import traceback
+from collections import Counter
+from contextvars import ContextVar
+from functools import wraps
+
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from metrics import log_event
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+STACK_FRAMES = 8  # innermost app frames kept per repeated statement
+
+_active = ContextVar('query_budgets', default=())
+
+_lock = threading.Lock()
+violations = Counter()  # budget name -> times exceeded
+
+
+class QueryBudgetExceeded(Exception):
+    """A block ran more SQL statements, or spent longer in the database, than its budget allows."""
+
+    def __init__(self, budget):
+        self.budget = budget
+        super().__init__(budget.describe())
+
+
+def _app_stack():
+    """The innermost frames of the current stack that are app code or templates."""
+    frames = [frame for frame in traceback.extract_stack()
+              if frame.filename.startswith(ROOT) and frame.filename != __file__
+              and 'site-packages' not in frame.filename]
+    return traceback.format_list(frames[-STACK_FRAMES:])
+
+
+class QueryBudget:
+    """Counts the statements run while it is active. Use through query_budget()."""
+
+    def __init__(self, statements=None, seconds=None, name=None):
+        self.max_statements = statements
+        self.max_seconds = seconds
+        self.name = name
+        self.statements = 0
+        self.seconds = 0.0
+        self.counts = Counter()  # SQL -> times run
+        self.stacks = {}         # SQL -> stack of its first repeat
+
+    def record(self, statement, elapsed):
+        self.statements += 1
+        self.seconds += elapsed
+        self.counts[statement] += 1
+        if self.counts[statement] == 2:
+            self.stacks[statement] = _app_stack()
+
+    @property
+    def exceeded(self):
+        return ((self.max_statements is not None and self.statements > self.max_statements)
+                or (self.max_seconds is not None and self.seconds > self.max_seconds))
+
+    def repeated(self):
+        """[(SQL, times run, stack)] for the statements run more than once, most repeated first."""
+        return [(statement, count, self.stacks[statement])
+                for statement, count in self.counts.most_common() if count > 1]
+
+    def describe(self):
+        lines = [f"{self.name or 'query budget'}: {self.statements} statements in {self.seconds * 1000:.1f} ms "
+                 f"(budget: {self.max_statements} statements, "
+                 f"{'-' if self.max_seconds is None else f'{self.max_seconds * 1000:.0f}'} ms)"]
+        for statement, count, stack in self.repeated():
+            lines.append(f"\n{count}x {' '.join(statement.split())}\n" + ''.join(stack).rstrip())
+        return '\n'.join(lines)
+
+    def __enter__(self):
+        self._token = _active.set(_active.get() + (self,))
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _active.reset(self._token)
+        if exc_type is None and self.exceeded:
+            _violated(self)
+        return False
+
+    def __call__(self, view):
+        name = self.name or f"{view.__module__}.{view.__name__}"
+
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            # a fresh count per call, so concurrent requests never share one
+            with QueryBudget(self.max_statements, self.max_seconds, name):
+                return view(*args, **kwargs)
+        return wrapper
+
+
+def query_budget(statements=None, seconds=None, name=None):
+    """A budget of `statements` SQL statements and `seconds` of database time, as a decorator or a with block."""
+    return QueryBudget(statements, seconds, name)
+
+
+def _violated(budget):
+    with _lock:
+        violations[budget.name or 'query budget'] += 1
+    if has_app_context() and current_app.config.get('QUERY_BUDGET_RAISE'):
+        raise QueryBudgetExceeded(budget)
+    log_event('query_budget_exceeded', level=logging.WARNING,
+              budget=budget.name or 'query budget',
+              statements=budget.statements,
+              db_ms=round(budget.seconds * 1000, 1),
+              max_statements=budget.max_statements,
+              max_db_ms=None if budget.max_seconds is None else round(budget.max_seconds * 1000, 1),
+              repeated=[{'sql': ' '.join(statement.split()), 'count': count, 'stack': stack}
+                        for statement, count, stack in budget.repeated()])
+
+
+def stats():
+    """How often each budget was exceeded, for monitoring."""
+    with _lock:
+        return {'exceeded': dict(violations)}
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _active.get():
+        conn.info['budget_start'] = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    budgets = _active.get()
+    if not budgets:
+        return
+    elapsed = time.perf_counter() - conn.info.pop('budget_start', time.perf_counter())
+    for budget in budgets:
+        budget.record(statement, elapsed)
+
+
+event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
@@ -0,0 +1,146 @@
+"""Small in-process caches shared by the app."""
+
+import time
+import threading
+from collections import OrderedDict
+
+
+class TTLCache:
+    """A thread-safe cache with a maximum size and a per-entry time to live.
+
+    Entries expire `ttl` seconds after they are set. When the cache is full the
+    least recently used entry is evicted. Hit and miss counts are kept for
+    monitoring.
+    """
+
+    def __init__(self, maxsize=1024, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+
+        self._lock = threading.Lock()
+        self._data = OrderedDict()  # key -> (expires_at, value), oldest first
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _lookup(self, key):
+        """Return the live entry for `key` or None. Must be called with the lock held."""
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return entry
+
+    def get(self, key, default=None):
+        """Return the cached value for `key`, counting a hit or a miss."""
+        with self._lock:
+            entry = self._lookup(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+            return entry[1]
+
+    def peek(self, key, default=None):
+        """Return the cached value for `key` without touching the counters."""
+        with self._lock:
+            entry = self._lookup(key)
+            return default if entry is None else entry[1]
+
+    def set(self, key, value, ttl=None):
+        """Store `value` under `key`, evicting the least recently used entries if full."""
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        """Remove `key` if it is cached."""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        """Hit/miss counters and current size, for monitoring."""
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+        }
+
+
+class _Call:
+    """One in-flight call that other callers can wait on."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Collapses concurrent calls for the same key into one.
+
+    The first caller for a key runs the function; callers that arrive while it
+    is still running wait and get the same result (or exception) instead of
+    making their own call.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+        self.calls = 0      # calls that actually ran
+        self.collapsed = 0  # calls that shared another caller's result
+
+    def do(self, key, fn, *args, **kwargs):
+        """Run fn(*args, **kwargs) once per concurrent group of callers for `key`."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.calls += 1
+            else:
+                self.collapsed += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stats(self):
+        """How many calls ran and how many were collapsed into them, for monitoring."""
+        return {
+            'calls': self.calls,
+            'collapsed': self.collapsed,
+            'in_flight': len(self._calls),
+        }
+
@@ -0,0 +1,179 @@
+"""Local catalog of Spotify tracks and playlists shown on post cards.
+
+Posts only store the Spotify ID, name and artist. Richer metadata (album art,
+duration, preview URL) lives in the `tracks` and `playlists` tables and is
+hydrated for a whole page of posts at once: missing or stale tracks are fetched
+with Spotify's multi-ID endpoint, so a page costs at most one call for tracks
+plus a bounded number of playlist calls (Spotify has no multi-ID playlist
+endpoint).
+
+New posts also queue a job that fetches their item ahead of the first page
+view that shows them.
+"""
+
+import re
+import logging
+from datetime import datetime, timedelta
+
+from sqlalchemy.exc import SQLAlchemyError
+
+from models import db, Post, Track, Playlist
+from spotify import get_spotify_tracks, get_spotify_item, SpotifyUnavailable
+import jobs
+
+logger = logging.getLogger(__name__)
+
+CATALOG_MAX_AGE = timedelta(days=7)  # refresh entries older than this
+TRACK_BATCH_SIZE = 50                # most IDs Spotify accepts per /tracks call
+PLAYLIST_FETCHES_PER_PAGE = 1        # playlists are fetched one per call
+
+# one malformed ID makes Spotify reject the whole multi-ID request
+SPOTIFY_ID = re.compile(r'^[0-9A-Za-z]{22}$')
+
+
+def item_type(post):
+    """Posts do not record their type; search.js only sets an artist for tracks."""
+    return 'track' if post.artist_name else 'playlist'
+
+
+def _image_url(images):
+    return images[0]['url'] if images else None
+
+
+def refresh_tracks(spotify_ids, tracks):
+    """Fetch `spotify_ids` from Spotify in one call into `tracks` (id -> Track). Returns the rows to store."""
+    try:
+        items = get_spotify_tracks(spotify_ids)
+    except SpotifyUnavailable as e:
+        logger.warning("Skipping track hydration: %s", e)
+        return []
+
+    rows = []
+    for item in items or []:
+        if not item:
+            continue  # unknown or unavailable track
+
+        row = {'spotify_id': item['id'],
+               'name': item['name'],
+               'artist_name': item['artists'][0]['name'] if item.get('artists') else None,
+               'album_name': item.get('album', {}).get('name'),
+               'image_url': _image_url(item.get('album', {}).get('images')),
+               'duration_ms': item.get('duration_ms'),
+               'preview_url': item.get('preview_url'),
+               'fetched_at': datetime.utcnow()}
+        rows.append(row)
+        tracks[row['spotify_id']] = Track(**row)  # not added to the session; store() writes the row
+    return rows
+
+
+def refresh_playlist(spotify_id, playlists):
+    """Fetch one playlist from Spotify into `playlists` (id -> Playlist). Returns the rows to store."""
+    try:
+        item = get_spotify_item(spotify_id, item_type='playlist')
+    except (SpotifyUnavailable, ValueError) as e:
+        logger.warning("Skipping playlist hydration for %s: %s", spotify_id, e)
+        return []
+
+    row = {'spotify_id': spotify_id,
+           'name': item['name'],
+           'owner_name': item.get('owner', {}).get('display_name'),
+           'image_url': _image_url(item.get('images')),
+           'track_count': item.get('tracks', {}).get('total'),
+           'fetched_at': datetime.utcnow()}
+    playlists[spotify_id] = Playlist(**row)
+    return [row]
+
+
+def store(connection, model, rows):
+    """Upsert catalog rows, so two requests (or a request and a job) fetching the same item both succeed."""
+    if not rows:
+        return
+    if connection.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+
+    statement = insert(model.__table__).values(rows)
+    statement = statement.on_conflict_do_update(
+        index_elements=['spotify_id'],
+        set_={column: statement.excluded[column] for column in rows[0] if column != 'spotify_id'})
+    connection.execute(statement)
+
+
+def hydrate(posts):
+    """Set `post.catalog` to the Track or Playlist for each post (None if unknown).
+
+    Reads the local catalog with one query per type, then refreshes what is
+    missing or older than CATALOG_MAX_AGE: up to TRACK_BATCH_SIZE tracks in one
+    call and up to PLAYLIST_FETCHES_PER_PAGE playlists. Anything left over is
+    picked up by a later page view.
+
+    Refreshed entries are written in their own short transaction on the
+    primary, never by committing the request's session, and the page shows
+    them from memory.
+    """
+    valid_posts = [post for post in posts if SPOTIFY_ID.match(post.spotify_id or '')]
+    track_ids = {post.spotify_id for post in valid_posts if item_type(post) == 'track'}
+    playlist_ids = {post.spotify_id for post in valid_posts if item_type(post) == 'playlist'}
+
+    tracks = {}
+    if track_ids:
+        tracks = {track.spotify_id: track for track in Track.query.filter(Track.spotify_id.in_(track_ids))}
+
+    playlists = {}
+    if playlist_ids:
+        playlists = {playlist.spotify_id: playlist
+                     for playlist in Playlist.query.filter(Playlist.spotify_id.in_(playlist_ids))}
+
+    stale_before = datetime.utcnow() - CATALOG_MAX_AGE
+    missing_tracks = sorted(spotify_id for spotify_id in track_ids
+                            if spotify_id not in tracks or tracks[spotify_id].fetched_at < stale_before)
+    missing_playlists = sorted(spotify_id for spotify_id in playlist_ids
+                               if spotify_id not in playlists or playlists[spotify_id].fetched_at < stale_before)
+
+    track_rows = refresh_tracks(missing_tracks[:TRACK_BATCH_SIZE], tracks) if missing_tracks else []
+    playlist_rows = []
+    for spotify_id in missing_playlists[:PLAYLIST_FETCHES_PER_PAGE]:
+        playlist_rows += refresh_playlist(spotify_id, playlists)
+    if track_rows or playlist_rows:
+        try:
+            with db.engine.begin() as connection:
+                store(connection, Track, track_rows)
+                store(connection, Playlist, playlist_rows)
+        except SQLAlchemyError as e:
+            # the page still shows what was fetched; a later view stores it
+            logger.warning("Could not store refreshed catalog entries: %s", e)
+
+    for post in posts:
+        if item_type(post) == 'track':
+            post.catalog = tracks.get(post.spotify_id)
+        else:
+            post.catalog = playlists.get(post.spotify_id)
+
+    return posts
+
+
+@jobs.handler('warm_catalog')
+def warm_catalog(post_id):
+    """Fetch a new post's track or playlist into the catalog. Raises if it could not be fetched, so the job is retried."""
+    post = db.session.get(Post, post_id)
+    if post is None or not SPOTIFY_ID.match(post.spotify_id or ''):
+        return
+
+    model = Track if item_type(post) == 'track' else Playlist
+    stale_before = datetime.utcnow() - CATALOG_MAX_AGE
+
+    cached = db.session.get(model, post.spotify_id)
+    if cached is not None and cached.fetched_at >= stale_before:
+        return
+
+    known = {post.spotify_id: cached} if cached else {}
+    if model is Track:
+        rows = refresh_tracks([post.spotify_id], known)
+    else:
+        rows = refresh_playlist(post.spotify_id, known)
+    store(db.session.connection(), model, rows)  # committed with the job
+
+    entry = known.get(post.spotify_id)
+    if entry is None or entry.fetched_at < stale_before:
+        raise SpotifyUnavailable(f"Could not fetch {post.spotify_id} for post {post.id}")
@@ -0,0 +1,114 @@
+"""Conditional GET (ETag / Last-Modified) for the feed and profile pages.
+
+Every user row carries a `version` that is bumped (models.bump_versions) by
+each write that changes what that user's pages show: their own posts, likes,
+comments and follows, likes, comments and follows aimed at them, and posts
+copied into or removed from their timeline. A page's strong ETag hashes the
+versions of the users it depends on (the viewer and, on profile pages, the
+profile's owner), so revalidating costs one primary-key lookup and the 304 is
+sent before any feed or profile query runs.
+
+A few things on these pages are not covered by the versions: like and comment
+counts on other people's posts, posts by fan-out-on-read authors and album art
+fetched later. The validators therefore also change every WINDOW seconds,
+which bounds how stale a revalidated page can be.
+
+Pages rendered with flashed messages get no validators, so the message is not
+replayed from the browser's cache. base.html shows (and so consumes) them, so
+only that one page goes uncached.
+"""
+
+import time
+import hashlib
+import threading
+from datetime import datetime, timezone
+from functools import wraps
+
+from flask import request, session, current_app, make_response
+from flask_login import current_user
+from flask_wtf.csrf import generate_csrf
+from sqlalchemy import select
+from werkzeug.http import is_resource_modified
+
+from models import db, User
+
+WINDOW = 120  # seconds; the longest a revalidated page can lag changes the versions miss
+
+_lock = threading.Lock()
+counters = {'checked': 0, 'not_modified': 0, 'rendered': 0, 'skipped': 0}
+
+
+def _count(name):
+    with _lock:
+        counters[name] += 1
+
+
+def stats():
+    """How often pages were revalidated and answered with 304, for monitoring."""
+    with _lock:
+        return dict(counters)
+
+
+def validators(versions, window):
+    """(strong ETag, Last-Modified) for the current request and the (id, version, version_at) rows."""
+    now = time.time()
+    window_start = now - now % window
+
+    # the session's CSRF token is embedded in the page, so a new session must not reuse it
+    generate_csrf()
+    parts = [request.endpoint, request.full_path, str(int(window_start)),
+             str(session.get(current_app.config.get('WTF_CSRF_FIELD_NAME', 'csrf_token')))]
+    parts += [f"{user_id}:{version}" for user_id, version, _ in sorted(versions)]
+    etag = hashlib.sha1('|'.join(parts).encode()).hexdigest()
+
+    # versions are stamped with naive UTC times
+    changed = [version_at.replace(tzinfo=timezone.utc).timestamp() for _, _, version_at in versions
+               if version_at is not None]
+    last_modified = datetime.fromtimestamp(max(changed + [window_start]), timezone.utc)
+    return etag, last_modified
+
+
+def _add_validators(response, etag, last_modified):
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.headers['Cache-Control'] = 'private, no-cache'  # keep a copy, but always ask first
+    response.vary.add('Cookie')
+    return response
+
+
+def conditional(owner_arg=None):
+    """Answer the decorated page view with 304 when the viewer's copy is current.
+
+    The page depends on the signed-in user and, if `owner_arg` is given, on
+    the user whose id is in that URL argument. Use it inside @login_required.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(**kwargs):
+            if session.get('_flashes'):
+                _count('skipped')
+                response = make_response(view(**kwargs))
+                response.headers['Cache-Control'] = 'no-store'
+                return response
+
+            user_ids = {current_user.id}
+            if owner_arg is not None:
+                user_ids.add(kwargs[owner_arg])
+            versions = db.session.execute(select(User.id, User.version, User.version_at)
+                                          .where(User.id.in_(user_ids))).all()
+            if len(versions) < len(user_ids):
+                return view(**kwargs)  # e.g. an unknown profile; let the view answer
+
+            _count('checked')
+            etag, last_modified = validators(versions, current_app.config.get('CONDITIONAL_GET_WINDOW', WINDOW))
+            if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+                _count('not_modified')
+                return _add_validators(current_app.response_class(status=304), etag, last_modified)
+
+            _count('rendered')
+            response = make_response(view(**kwargs))
+            if response.status_code == 200:
+                _add_validators(response, etag, last_modified)
+            return response
+        return wrapper
+    return decorator
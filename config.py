@@ -0,0 +1,105 @@
+"""Configuration profiles for create_app().
+
+Values come from the environment (and .env), read once when this module is
+imported. APP_CONFIG picks the profile when none is passed to create_app().
+"""
+
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def _flag(name, default=''):
+    return os.getenv(name, default).lower() in ('1', 'true', 'yes')
+
+
+def _list(name):
+    return [value.strip() for value in os.getenv(name, '').split(',') if value.strip()]
+
+
+class Config:
+    SQLALCHEMY_DATABASE_URI = os.getenv('SUPABASE_DB_URL', 'postgresql:///muse_db')
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # logs every statement; request SQL counts and timings are at /metrics instead
+    SQLALCHEMY_ECHO = _flag('SQLALCHEMY_ECHO')
+
+    # reads in GET requests go to these replicas (comma-separated URLs; see replicas.py)
+    SQLALCHEMY_BINDS = {f'replica_{n}': url for n, url in enumerate(_list('DATABASE_REPLICA_URLS'), 1)}
+    REPLICA_MAX_LAG_SECONDS = float(os.getenv('REPLICA_MAX_LAG_SECONDS', 5))
+    REPLICA_CHECK_SECONDS = float(os.getenv('REPLICA_CHECK_SECONDS', 5))
+    # how long a user who wrote something reads from the primary
+    READ_YOUR_WRITES_SECONDS = float(os.getenv('READ_YOUR_WRITES_SECONDS', 5))
+
+    PROPAGATE_EXCEPTIONS = True
+    SECRET_KEY = os.getenv('SECRET_KEY')
+    LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+
+    # Flask-DebugToolbar is only imported and installed when this is set
+    DEBUG_TOOLBAR = False
+
+    # raise QueryBudgetExceeded when a view runs more SQL than its budget, instead of logging a warning
+    QUERY_BUDGET_RAISE = _flag('QUERY_BUDGET_RAISE')
+
+    # run background jobs inside the request instead of on a `flask jobs work` worker
+    JOBS_INLINE = _flag('JOBS_INLINE')
+
+    # feed and profile validators also change this often (seconds), bounding staleness (see conditional.py)
+    CONDITIONAL_GET_WINDOW = int(os.getenv('CONDITIONAL_GET_WINDOW', 120))
+
+    # bcrypt cost: fixed if PASSWORD_HASH_ROUNDS is set, otherwise calibrated to the target time
+    PASSWORD_HASH_ROUNDS = int(os.getenv('PASSWORD_HASH_ROUNDS', 0)) or None
+    PASSWORD_HASH_TARGET_MS = int(os.getenv('PASSWORD_HASH_TARGET_MS', 250))
+    PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', 2))
+
+    # share of requests logged as JSON lines; slow (SLOW_REQUEST_MS) and failed requests are always logged
+    METRICS_LOG_SAMPLE_RATE = float(os.getenv('METRICS_LOG_SAMPLE_RATE', 0.01))
+    SLOW_REQUEST_MS = int(os.getenv('SLOW_REQUEST_MS', 1000))
+    # /metrics needs `Authorization: Bearer <METRICS_TOKEN>` when set; otherwise it is only served
+    # to these addresses, and never to requests that came through a proxy
+    METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+    METRICS_ALLOWED_IPS = os.getenv('METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',')
+
+
+class DevelopmentConfig(Config):
+    DEBUG_TOOLBAR = True
+    QUERY_BUDGET_RAISE = True
+    DEBUG_TB_INTERCEPT_REDIRECTS = True
+
+
+class TestingConfig(Config):
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = os.getenv('TEST_DATABASE_URL', 'postgresql:///muse_test_db')
+    SQLALCHEMY_BINDS = {}
+    SECRET_KEY = os.getenv('SECRET_KEY', 'testing')
+    WTF_CSRF_ENABLED = False
+    JOBS_INLINE = True
+    QUERY_BUDGET_RAISE = True
+    PASSWORD_HASH_ROUNDS = 4  # bcrypt's minimum; tests do not need slow hashes
+    METRICS_LOG_SAMPLE_RATE = 0.0
+
+
+class ProductionConfig(Config):
+    PROPAGATE_EXCEPTIONS = False
+
+
+configs = {
+    'development': DevelopmentConfig,
+    'testing': TestingConfig,
+    'production': ProductionConfig,
+}
+
+
+def get_config(name=None):
+    """The profile called `name`, or the one named by APP_CONFIG (development by default).
+
+    A Config subclass is returned as is.
+    """
+    if isinstance(name, type):
+        return name
+    name = name or os.getenv('APP_CONFIG', 'development')
+    try:
+        return configs[name]
+    except KeyError:
+        raise ValueError(f"Unknown config {name!r}; expected one of {', '.join(configs)}") from None
@@ -0,0 +1,136 @@
+"""Feed read model.
+
+Loads everything a post card needs (author username, like count, comment count
+and whether the viewer liked the post) in one query, so the feed template never
+has to touch relationships or call `has_liked_post` per post.
+
+Pages are keyset-paginated on (timestamp, id): the cursor is the position of the
+last post on the previous page, so every page costs the same index range scan
+no matter how deep the user has scrolled. Feed pages are read from the
+materialised timeline maintained by timeline.py.
+"""
+
+import base64
+from datetime import datetime
+
+from sqlalchemy import or_, and_, select, exists
+
+from models import db, User, Post, Like, Follower, TimelineEntry
+
+FEED_PAGE_SIZE = 20
+
+
+class FeedPost:
+    """A post card as shown on the feed, with author and engagement data."""
+
+    __slots__ = ('id', 'user_id', 'spotify_id', 'spotify_name', 'artist_name',
+                 'caption', 'timestamp', 'author_username', 'like_count',
+                 'comment_count', 'liked_by_me', 'catalog')
+
+    def __init__(self, **fields):
+        for name in self.__slots__:
+            setattr(self, name, fields.get(name))
+
+    def __repr__(self):
+        return f"<FeedPost {self.id} by {self.author_username}>"
+
+
+def feed_post_query(viewer_id):
+    """Build the select for post cards as seen by `viewer_id`.
+
+    Like and comment counts are maintained on the post row and "liked by me" is
+    a correlated EXISTS, so the whole page comes back in a single round trip
+    regardless of its size.
+    """
+    liked_by_me = (exists()
+                   .where(Like.post_id == Post.id, Like.user_id == viewer_id)
+                   .correlate(Post))
+
+    return (select(Post.id,
+                   Post.user_id,
+                   Post.spotify_id,
+                   Post.spotify_name,
+                   Post.artist_name,
+                   Post.caption,
+                   Post.timestamp,
+                   User.username.label('author_username'),
+                   Post.like_count,
+                   Post.comment_count,
+                   liked_by_me.label('liked_by_me'))
+            .join(User, User.id == Post.user_id))
+
+
+def encode_cursor(post):
+    """Return an opaque cursor pointing just after `post`."""
+    raw = f"{post.timestamp.isoformat()}|{post.id}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """Turn a cursor back into (timestamp, post_id). Raises ValueError if it is malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8')
+        timestamp, post_id = raw.split('|')
+        return datetime.fromisoformat(timestamp), int(post_id)
+    except (UnicodeError, TypeError, ValueError) as e:
+        raise ValueError(f"Invalid feed cursor: {cursor!r}") from e
+
+
+def after_cursor(query, cursor, timestamp_column=Post.timestamp, id_column=Post.id):
+    """Restrict a newest-first query to rows after `cursor`."""
+    timestamp, post_id = decode_cursor(cursor)
+    return query.where(or_(timestamp_column < timestamp,
+                           and_(timestamp_column == timestamp, id_column < post_id)))
+
+
+def fetch_page(query, cursor, limit, timestamp_column=Post.timestamp, id_column=Post.id):
+    """Fetch up to `limit` + 1 post cards after `cursor`, newest first."""
+    if cursor:
+        query = after_cursor(query, cursor, timestamp_column, id_column)
+
+    # the extra row tells the caller whether another page exists
+    query = query.order_by(timestamp_column.desc(), id_column.desc()).limit(limit + 1)
+    return [FeedPost(**row._mapping) for row in db.session.execute(query)]
+
+
+def page_of(posts, limit):
+    """Cut a newest-first list of up to `limit` + 1 posts down to a page.
+
+    Returns (posts, next_cursor); next_cursor is None on the last page.
+    """
+    if len(posts) > limit:
+        posts = posts[:limit]
+        return posts, encode_cursor(posts[-1])
+    return posts, None
+
+
+def get_feed_page(user, cursor=None, limit=FEED_PAGE_SIZE):
+    """Return one page of the user's feed (their own posts plus followed users' posts), newest first.
+
+    Most posts come from the user's materialised timeline with one range scan.
+    Posts by followed accounts that are fanned out on read are fetched with a
+    second bounded query and merged in.
+    """
+    timeline_query = (feed_post_query(user.id)
+                      .join(TimelineEntry, TimelineEntry.post_id == Post.id)
+                      .where(TimelineEntry.user_id == user.id))
+
+    timeline_posts = fetch_page(timeline_query, cursor, limit,
+                                TimelineEntry.timestamp, TimelineEntry.post_id)
+
+    fanout_on_read_ids = (select(Follower.followed_id)
+                          .join(User, User.id == Follower.followed_id)
+                          .where(Follower.follower_id == user.id,
+                                 User.fanout_on_read.is_(True)))
+
+    read_time_posts = fetch_page(feed_post_query(user.id).where(Post.user_id.in_(fanout_on_read_ids)),
+                                 cursor, limit)
+
+    if not read_time_posts:
+        return page_of(timeline_posts, limit)
+
+    # an account switched to fan-out on read may still have older posts in the timeline
+    merged = {post.id: post for post in timeline_posts + read_time_posts}
+    posts = sorted(merged.values(), key=lambda post: (post.timestamp, post.id), reverse=True)
+
+    return page_of(posts, limit)
@@ -0,0 +1,70 @@
+"""Cached post cards.
+
+Most of a post card (track, artist, caption, author, timestamp, album art and
+counts) is the same for every viewer, so `_post_card.html` is rendered once per
+post version and kept in an in-process LRU. A post's version is the state of
+everything on the card that can change: its like and comment counters (read
+fresh with every page) and the catalog entry it shows. A cached card is only
+used while the version still matches, so a copy rendered before a like or
+comment in another process is never served.
+
+The viewer-specific parts (the like/unlike form, the author's delete button and
+the CSRF token in each form) are left as slots in the cached HTML and rendered
+per request from `_post_card_controls.html`. Liking, unliking, commenting on
+and deleting a post also drop its card straight away (invalidate_card()).
+"""
+
+import re
+
+from flask import render_template, get_template_attribute
+from markupsafe import Markup
+
+from cache import TTLCache
+
+CARD_CACHE_SIZE = 5000
+CARD_CACHE_TTL = 3600  # seconds; cards of posts nobody is scrolling past are dropped even if the cache is not full
+
+# user content is escaped when rendered, so only a slot() call can produce a marker
+SLOT_MARKER = re.compile(r'<slot:(\w+)>')
+
+card_cache = TTLCache(maxsize=CARD_CACHE_SIZE, ttl=CARD_CACHE_TTL)
+
+
+def _slot(name):
+    return Markup(f'<slot:{name}>')
+
+
+def card_version(post):
+    """The state of a post card's shared parts; a cached card is only reused while it is unchanged."""
+    catalog = post.catalog
+    return (post.like_count, post.comment_count, catalog.fetched_at if catalog is not None else None)
+
+
+def shared_card(post):
+    """The card's shared HTML, split at its slots: [html, slot name, html, slot name, ..., html]."""
+    version = card_version(post)
+    cached = card_cache.get(post.id)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    parts = SLOT_MARKER.split(render_template('_post_card.html', post=post, slot=_slot))
+    card_cache.set(post.id, (version, parts))
+    return parts
+
+
+def render_card(post, form, viewer_id):
+    """The post's card as seen by `viewer_id`: the cached shared parts with the viewer's controls filled in."""
+    hidden_tag = form.hidden_tag()
+    slots = {
+        'like_form': get_template_attribute('_post_card_controls.html', 'like_form')(post, hidden_tag),
+        'delete_form': (get_template_attribute('_post_card_controls.html', 'delete_form')(post, hidden_tag)
+                        if post.user_id == viewer_id else ''),
+        'hidden_tag': hidden_tag,
+    }
+    parts = shared_card(post)
+    return Markup(''.join(slots[part] if i % 2 else part for i, part in enumerate(parts)))
+
+
+def invalidate_card(post_id):
+    """Forget a post's cached card after it is liked, unliked, commented on or deleted."""
+    card_cache.delete(post_id)
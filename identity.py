@@ -0,0 +1,53 @@
+"""The logged-in user for the current request.
+
+Flask-Login calls load_identity() at most once per request, and everything
+else (g.user, templates, routes) shares the user it returns.
+
+The user's identity columns are also kept in a short-lived in-process cache,
+so most authenticated requests start without a query for the user at all. The
+cached row is attached to the session without a SELECT; the counter columns
+are left out because other users' actions change them, and are loaded from the
+database the first time they are read. Entries are dropped when the user's row
+changes, and expire after USER_CACHE_TTL seconds otherwise, which bounds how
+stale another process's copy can be.
+"""
+
+from sqlalchemy.orm import make_transient_to_detached
+
+from cache import TTLCache
+from models import db, User
+
+USER_CACHE_TTL = 30  # seconds; 0 turns the cache off
+USER_CACHE_SIZE = 10000
+
+# columns copied into the cache; anything else is loaded on first access
+CACHED_COLUMNS = ('id', 'username', 'email', 'password', 'fanout_on_read')
+
+user_cache = TTLCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+
+
+def _from_cache(columns):
+    """Attach a cached user row to the session without querying for it."""
+    user = User(**columns)
+    make_transient_to_detached(user)
+    return db.session.merge(user, load=False)
+
+
+def load_identity(user_id):
+    """Return the User for `user_id`, or None."""
+    if not user_cache.ttl:
+        return db.session.get(User, user_id)
+
+    columns = user_cache.get(user_id)
+    if columns is not None:
+        return _from_cache(columns)
+
+    user = db.session.get(User, user_id)
+    if user is not None:
+        user_cache.set(user_id, {name: getattr(user, name) for name in CACHED_COLUMNS})
+    return user
+
+
+def invalidate_user(user_id):
+    """Forget the cached copy of a user after their row changes."""
+    user_cache.delete(user_id)
@@ -0,0 +1,247 @@
+"""Background jobs backed by the `jobs` table.
+
+Write paths call enqueue() inside their own transaction, so a job exists if and
+only if the write that asked for it committed. `flask jobs work` runs them:
+
+- workers claim due jobs with a conditional UPDATE (and SKIP LOCKED on
+  Postgres), so several workers never run the same job
+- a handler's writes and the job's "done" mark are committed together
+- a failed job is retried with exponential backoff; after max_attempts it is
+  left in the `dead` state with its last error for inspection and
+  `flask jobs retry-dead`
+- jobs left running by a worker that died are requeued after
+  VISIBILITY_TIMEOUT
+- an idempotency key makes enqueueing the same work twice create one job
+
+Handlers are plain functions registered with @handler(kind); their keyword
+arguments are stored as JSON. They must tolerate running more than once.
+
+With JOBS_INLINE set in the app config, enqueue() runs the handler straight
+away in the caller's transaction instead (for tests and single-process setups
+without a worker). The handler runs in a savepoint: if it fails, its writes
+are rolled back and the error is logged, but the caller's write still commits.
+Nothing retries it, so only best-effort work belongs in inline jobs.
+"""
+
+import os
+import json
+import time
+import socket
+import logging
+import traceback
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import select, func
+
+from models import db, Job, insert_ignore
+
+logger = logging.getLogger(__name__)
+
+QUEUED, RUNNING, DONE, DEAD = 'queued', 'running', 'done', 'dead'
+
+MAX_ATTEMPTS = 5
+BACKOFF_BASE = 2                          # seconds; doubles with each attempt
+BACKOFF_MAX = 600
+VISIBILITY_TIMEOUT = timedelta(minutes=5)  # a running job older than this is assumed orphaned
+BATCH_SIZE = 10
+POLL_INTERVAL = 1.0                       # seconds between polls of an empty queue
+ERROR_MAX_LENGTH = 4000
+
+handlers = {}
+
+# per-process counters for this worker, for monitoring
+counters = {'succeeded': 0, 'retried': 0, 'dead': 0, 'requeued_stale': 0}
+
+
+def handler(kind):
+    """Register the decorated function as the handler for jobs of `kind`."""
+    def register(fn):
+        handlers[kind] = fn
+        return fn
+    return register
+
+
+def enqueue(kind, key=None, delay=0, max_attempts=MAX_ATTEMPTS, **payload):
+    """Add a job to the session's transaction. Returns False if a job with `key` already exists.
+
+    The caller commits. `payload` must be JSON serialisable.
+    """
+    if current_app.config.get('JOBS_INLINE'):
+        run_inline(kind, payload)
+        return True
+
+    now = datetime.utcnow()
+    return insert_ignore(Job,
+                         kind=kind,
+                         payload=json.dumps(payload),
+                         idempotency_key=key,
+                         status=QUEUED,
+                         attempts=0,
+                         max_attempts=max_attempts,
+                         run_at=now + timedelta(seconds=delay),
+                         created_at=now)
+
+
+def run_inline(kind, payload):
+    """Run a handler in a savepoint of the caller's transaction. Returns False if it failed."""
+    try:
+        with db.session.begin_nested():
+            handlers[kind](**payload)
+        return True
+    except Exception:
+        # the savepoint is rolled back; the caller's own writes are kept
+        logger.warning("Inline job %s failed:\n%s", kind, traceback.format_exc()[-ERROR_MAX_LENGTH:])
+        return False
+
+
+def backoff(attempts):
+    """Seconds to wait before retrying a job that has failed `attempts` times."""
+    return min(BACKOFF_BASE ** attempts, BACKOFF_MAX)
+
+
+def claim(worker_id, limit=BATCH_SIZE):
+    """Mark up to `limit` due jobs as running for `worker_id` and return their ids, oldest first."""
+    now = datetime.utcnow()
+    due = (select(Job.id)
+           .where(Job.status == QUEUED, Job.run_at <= now)
+           .order_by(Job.run_at, Job.id)
+           .limit(limit))
+    if db.engine.dialect.name == 'postgresql':
+        due = due.with_for_update(skip_locked=True)
+
+    claimed = []
+    for job_id in db.session.scalars(due).all():
+        # only one worker's update can move a job out of `queued`
+        updated = (Job.query
+                   .filter(Job.id == job_id, Job.status == QUEUED)
+                   .update({Job.status: RUNNING,
+                            Job.locked_by: worker_id,
+                            Job.started_at: now,
+                            Job.attempts: Job.attempts + 1},
+                           synchronize_session=False))
+        if updated:
+            claimed.append(job_id)
+
+    db.session.commit()
+    return claimed
+
+
+def run(job_id):
+    """Run one claimed job and record the outcome. Returns the job's new status."""
+    job = db.session.get(Job, job_id)
+    try:
+        handlers[job.kind](**json.loads(job.payload))
+        job.status = DONE
+        job.finished_at = datetime.utcnow()
+        job.last_error = None
+        db.session.commit()
+        counters['succeeded'] += 1
+        return DONE
+    except Exception:
+        error = traceback.format_exc()[-ERROR_MAX_LENGTH:]
+        db.session.rollback()  # throw away the handler's partial writes
+
+    job = db.session.get(Job, job_id)
+    job.last_error = error
+    if job.attempts >= job.max_attempts:
+        job.status = DEAD
+        job.finished_at = datetime.utcnow()
+        counters['dead'] += 1
+        logger.error("Job %s (%s) failed %s times, giving up:\n%s", job.id, job.kind, job.attempts, error)
+    else:
+        job.status = QUEUED
+        job.run_at = datetime.utcnow() + timedelta(seconds=backoff(job.attempts))
+        counters['retried'] += 1
+        logger.warning("Job %s (%s) failed, retrying:\n%s", job.id, job.kind, error)
+    db.session.commit()
+    return job.status
+
+
+def requeue_stale(timeout=VISIBILITY_TIMEOUT):
+    """Put jobs that have been running for longer than `timeout` back in the queue."""
+    requeued = (Job.query
+                .filter(Job.status == RUNNING, Job.started_at < datetime.utcnow() - timeout)
+                .update({Job.status: QUEUED, Job.locked_by: None}, synchronize_session=False))
+    db.session.commit()
+    counters['requeued_stale'] += requeued
+    return requeued
+
+
+def work_once(worker_id, batch=BATCH_SIZE):
+    """Claim and run one batch of due jobs. Returns how many were run."""
+    job_ids = claim(worker_id, batch)
+    for job_id in job_ids:
+        run(job_id)
+    return len(job_ids)
+
+
+def work(worker_id=None, batch=BATCH_SIZE, poll_interval=POLL_INTERVAL, once=False):
+    """Run jobs until interrupted (or until the queue is empty, with once=True)."""
+    worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+    last_requeue = 0
+    while True:
+        if time.monotonic() - last_requeue > VISIBILITY_TIMEOUT.total_seconds() / 2:
+            requeue_stale()
+            last_requeue = time.monotonic()
+
+        if work_once(worker_id, batch) == 0:
+            if once:
+                return
+            time.sleep(poll_interval)
+
+
+def retry_dead(kind=None):
+    """Move dead jobs (optionally only of `kind`) back to the queue with a fresh set of attempts."""
+    query = Job.query.filter(Job.status == DEAD)
+    if kind:
+        query = query.filter(Job.kind == kind)
+    retried = query.update({Job.status: QUEUED,
+                            Job.attempts: 0,
+                            Job.run_at: datetime.utcnow(),
+                            Job.finished_at: None},
+                           synchronize_session=False)
+    db.session.commit()
+    return retried
+
+
+def purge(older_than=timedelta(days=7)):
+    """Delete finished jobs older than `older_than`. Dead jobs are kept."""
+    deleted = (Job.query
+               .filter(Job.status == DONE, Job.finished_at < datetime.utcnow() - older_than)
+               .delete(synchronize_session=False))
+    db.session.commit()
+    return deleted
+
+
+def _percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def queue_stats(sample=500):
+    """Queue depth by status, age of the oldest due job, and wait/run latency of recent jobs."""
+    depth = dict(db.session.execute(select(Job.status, func.count(Job.id)).group_by(Job.status)).all())
+
+    now = datetime.utcnow()
+    oldest_due = db.session.scalar(select(func.min(Job.run_at))
+                                   .where(Job.status == QUEUED, Job.run_at <= now))
+
+    recent = db.session.execute(select(Job.created_at, Job.started_at, Job.finished_at)
+                                .where(Job.status == DONE)
+                                .order_by(Job.finished_at.desc())
+                                .limit(sample)).all()
+    waits = [(started - created).total_seconds() for created, started, _ in recent]
+    runs = [(finished - started).total_seconds() for _, started, finished in recent]
+
+    return {
+        'depth': {status: depth.get(status, 0) for status in (QUEUED, RUNNING, DONE, DEAD)},
+        'oldest_due_age': (now - oldest_due).total_seconds() if oldest_due else 0,
+        'wait_p50': _percentile(waits, 0.5),
+        'wait_p95': _percentile(waits, 0.95),
+        'run_p50': _percentile(runs, 0.5),
+        'run_p95': _percentile(runs, 0.95),
+        'worker': dict(counters),
+    }
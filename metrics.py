@@ -0,0 +1,266 @@
+"""Request, SQL and upstream metrics in Prometheus text format, and sampled request logs.
+
+instrument(app) times every request and counts the SQL statements (and SQL
+time) it issues; the totals feed per-endpoint histograms served at /metrics.
+Components that already keep their own counters (caches, the Spotify client,
+the job queue, the password pool) are published through collectors that read
+their stats() when /metrics is scraped.
+
+Requests are also logged as one JSON line each on the `muse.requests` logger,
+but only a sample of them (LOG_SAMPLE_RATE), plus every slow or failed one.
+"""
+
+import hmac
+import json
+import time
+import random
+import logging
+import threading
+
+from flask import g, request, has_request_context, current_app, abort, Response
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger('muse.requests')
+
+PREFIX = 'muse'
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+LOG_SAMPLE_RATE = 0.01
+SLOW_REQUEST_SECONDS = 1.0
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    pairs = ','.join(f'{name}="{_escape(value)}"' for name, value in labels)
+    return '{' + pairs + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """A monotonically increasing count, optionally split by labels."""
+
+    type = 'counter'
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = f'{PREFIX}_{name}'
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            yield self.name, tuple(zip(self.labelnames, key)), value
+
+
+class Histogram:
+    """Observations counted into cumulative buckets, optionally split by labels."""
+
+    type = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = f'{PREFIX}_{name}'
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets) + (float('inf'),)
+        self._lock = threading.Lock()
+        self._values = {}  # label values -> [bucket counts..., sum, count]
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[i] += 1
+            entry[-2] += value
+            entry[-1] += 1
+
+    def samples(self):
+        with self._lock:
+            values = {key: list(entry) for key, entry in self._values.items()}
+        for key, entry in sorted(values.items()):
+            labels = tuple(zip(self.labelnames, key))
+            for bound, count in zip(self.buckets, entry):
+                yield f'{self.name}_bucket', labels + (('le', _format_value(bound)),), count
+            yield f'{self.name}_sum', labels, entry[-2]
+            yield f'{self.name}_count', labels, entry[-1]
+
+
+class Registry:
+    """The metrics and collectors rendered at /metrics."""
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def collector(self, name, stats):
+        """Publish a component's stats() dict as gauges named muse_<name>_<key>.
+
+        Numbers become gauges; a nested dict becomes one gauge labelled by its
+        keys; a string becomes a gauge of 1 labelled with the value; None is skipped.
+        """
+        self._collectors.append((name, stats))
+
+    def _collected(self):
+        for prefix, stats in self._collectors:
+            try:
+                values = stats()
+            except Exception:
+                logger.exception("Metrics collector %s failed", prefix)
+                continue
+            for key, value in values.items():
+                name = f'{PREFIX}_{prefix}_{key}'
+                if isinstance(value, dict):
+                    yield name, [((('key', sub_key),), sub_value) for sub_key, sub_value in value.items()
+                                 if isinstance(sub_value, (int, float))]
+                elif isinstance(value, str):
+                    yield name, [((('value', value),), 1)]
+                elif isinstance(value, (int, float)):
+                    yield name, [((), value)]
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+
+        for name, samples in self._collected():
+            lines.append(f'# TYPE {name} gauge')
+            for labels, value in samples:
+                lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+request_seconds = registry.register(Histogram(
+    'http_request_duration_seconds', 'Time spent handling a request.', ('endpoint', 'method', 'status')))
+request_sql_statements = registry.register(Histogram(
+    'http_request_sql_statements', 'SQL statements issued while handling a request.', ('endpoint',),
+    buckets=COUNT_BUCKETS))
+request_sql_seconds = registry.register(Histogram(
+    'http_request_sql_duration_seconds', 'Time spent in SQL while handling a request.', ('endpoint',)))
+sql_statements = registry.register(Counter(
+    'sql_statements_total', 'SQL statements issued, inside or outside requests.'))
+spotify_request_seconds = registry.register(Histogram(
+    'spotify_request_duration_seconds', 'Time per HTTP call to the Spotify API.', ('endpoint', 'status')))
+logins = registry.register(Counter(
+    'logins_total', 'Login attempts by outcome.', ('outcome',)))
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info['query_start'] = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info.pop('query_start', time.perf_counter())
+    sql_statements.inc()
+    if has_request_context() and 'metrics_start' in g:
+        g.metrics_sql_count += 1
+        g.metrics_sql_seconds += elapsed
+
+
+def _start_request():
+    g.metrics_start = time.perf_counter()
+    g.metrics_sql_count = 0
+    g.metrics_sql_seconds = 0.0
+
+
+def _finish_request(response):
+    _record(response.status_code)
+    return response
+
+
+def _teardown_request(error):
+    if error is not None:
+        _record(500)  # an unhandled exception skips after_request
+
+
+def _record(status):
+    start = g.pop('metrics_start', None)
+    if start is None or request.endpoint in ('metrics', 'static'):
+        return
+    elapsed = time.perf_counter() - start
+    endpoint = request.endpoint or 'unmatched'
+
+    request_seconds.observe(elapsed, endpoint=endpoint, method=request.method, status=status)
+    request_sql_statements.observe(g.metrics_sql_count, endpoint=endpoint)
+    request_sql_seconds.observe(g.metrics_sql_seconds, endpoint=endpoint)
+
+    if status >= 500 or elapsed >= SLOW_REQUEST_SECONDS or random.random() < LOG_SAMPLE_RATE:
+        log_event('request',
+                  method=request.method,
+                  path=request.path,
+                  endpoint=endpoint,
+                  status=status,
+                  duration_ms=round(elapsed * 1000, 1),
+                  sql_count=g.metrics_sql_count,
+                  sql_ms=round(g.metrics_sql_seconds * 1000, 1))
+
+
+def log_event(event_name, level=logging.INFO, log=logger, **fields):
+    """Log one event as a single JSON line."""
+    log.log(level, json.dumps({'event': event_name, **fields}, default=str))
+
+
+def _metrics_allowed():
+    token = current_app.config.get('METRICS_TOKEN')
+    if token:
+        supplied = request.headers.get('Authorization', '').removeprefix('Bearer ')
+        return hmac.compare_digest(supplied.encode(), token.encode())
+
+    # a reverse proxy on the same host makes every request look local; its forwarding headers give it away
+    if request.headers.get('X-Forwarded-For') or request.headers.get('Forwarded'):
+        return False
+    return request.remote_addr in current_app.config['METRICS_ALLOWED_IPS']
+
+
+def metrics_view():
+    """Everything in the registry in Prometheus text format, for scrapers with the token or local ones."""
+    if not _metrics_allowed():
+        abort(404)
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+
+def instrument(app):
+    """Time the app's requests, count their SQL and serve /metrics. Call once per app."""
+    global LOG_SAMPLE_RATE, SLOW_REQUEST_SECONDS
+    LOG_SAMPLE_RATE = app.config.get('METRICS_LOG_SAMPLE_RATE', LOG_SAMPLE_RATE)
+    SLOW_REQUEST_SECONDS = app.config.get('SLOW_REQUEST_MS', SLOW_REQUEST_SECONDS * 1000) / 1000
+
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    app.teardown_request(_teardown_request)
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
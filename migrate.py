@@ -0,0 +1,98 @@
+"""Versioned schema migrations.
+
+Each module in migrations/ named NNNN_description.py defines `upgrade(conn)`.
+Applied versions are recorded in the schema_migrations table, and `flask db
+upgrade` runs the pending ones in order, each in its own transaction.
+
+The helpers below only create what is missing, so a migration is safe to run
+against a database whose tables were originally made by `db.create_all()`.
+"""
+
+import os
+import importlib
+from datetime import datetime
+
+import sqlalchemy as sa
+from sqlalchemy.schema import CreateColumn
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+
+schema_migrations = sa.Table(
+    'schema_migrations', sa.MetaData(),
+    sa.Column('version', sa.String(64), primary_key=True),
+    sa.Column('applied_at', sa.DateTime, nullable=False),
+)
+
+
+def load_migrations():
+    """Return [(version, module)] for every migration, oldest first."""
+    migrations = []
+    for filename in sorted(os.listdir(MIGRATIONS_DIR)):
+        name, ext = os.path.splitext(filename)
+        if ext == '.py' and name[:4].isdigit():
+            migrations.append((name, importlib.import_module(f'migrations.{name}')))
+    return migrations
+
+
+def applied_versions(engine):
+    with engine.begin() as conn:
+        schema_migrations.create(conn, checkfirst=True)
+        return {row.version for row in conn.execute(sa.select(schema_migrations.c.version))}
+
+
+def pending_migrations(engine):
+    applied = applied_versions(engine)
+    return [(version, module) for version, module in load_migrations() if version not in applied]
+
+
+def upgrade(engine, log=print):
+    """Apply every pending migration. Returns the versions applied."""
+    done = []
+    for version, module in pending_migrations(engine):
+        log(f"Applying {version}...")
+        with engine.begin() as conn:
+            module.upgrade(conn)
+            conn.execute(schema_migrations.insert().values(version=version, applied_at=datetime.utcnow()))
+        done.append(version)
+    return done
+
+
+# Idempotent schema operations for use inside migrations
+
+def has_column(conn, table, column):
+    return column in {col['name'] for col in sa.inspect(conn).get_columns(table)}
+
+
+def has_index(conn, table, name):
+    inspector = sa.inspect(conn)
+    names = {index['name'] for index in inspector.get_indexes(table)}
+    names |= {constraint['name'] for constraint in inspector.get_unique_constraints(table)}
+    return name in names
+
+
+def add_column(conn, table, column):
+    """ALTER TABLE ... ADD COLUMN unless the column already exists."""
+    if not has_column(conn, table, column.name):
+        ddl = CreateColumn(column).compile(dialect=conn.dialect)
+        conn.execute(sa.text(f"ALTER TABLE {table} ADD COLUMN {ddl}"))
+
+
+def create_index(conn, table, name, *columns, unique=False, **kwargs):
+    """CREATE [UNIQUE] INDEX unless an index or unique constraint with that name exists."""
+    if not has_index(conn, table, name):
+        stub = sa.Table(table, sa.MetaData(), *[sa.Column(column) for column in columns])
+        sa.Index(name, *[stub.c[column] for column in columns], unique=unique, **kwargs).create(conn)
+
+
+def delete_duplicates(conn, table, columns):
+    """Keep the lowest id of each group of rows that share `columns`, so a unique index can be added."""
+    keys = ', '.join(columns)
+    return conn.execute(sa.text(
+        f"DELETE FROM {table} WHERE id NOT IN (SELECT MIN(id) FROM {table} GROUP BY {keys})"
+    )).rowcount
+
+
+def drop_index(conn, table, name):
+    """DROP INDEX if it exists."""
+    if has_index(conn, table, name):
+        conn.execute(sa.text(f"DROP INDEX {name}"))
@@ -0,0 +1,42 @@
+"""Original schema: users, followers, posts, likes and comments."""
+
+import sqlalchemy as sa
+
+
+def upgrade(conn):
+    metadata = sa.MetaData()
+
+    sa.Table('users', metadata,
+             sa.Column('id', sa.Integer, primary_key=True, autoincrement=True),
+             sa.Column('username', sa.String(80), nullable=False, unique=True),
+             sa.Column('email', sa.String(128), nullable=False, unique=True),
+             sa.Column('password', sa.String(128), nullable=False))
+
+    sa.Table('followers', metadata,
+             sa.Column('id', sa.Integer, primary_key=True, autoincrement=True),
+             sa.Column('follower_id', sa.Integer, sa.ForeignKey('users.id'), nullable=False),
+             sa.Column('followed_id', sa.Integer, sa.ForeignKey('users.id'), nullable=False),
+             sa.Column('timestamp', sa.DateTime))
+
+    sa.Table('posts', metadata,
+             sa.Column('id', sa.Integer, primary_key=True, autoincrement=True),
+             sa.Column('user_id', sa.Integer, sa.ForeignKey('users.id'), nullable=False),
+             sa.Column('spotify_id', sa.String(255), nullable=False),
+             sa.Column('spotify_name', sa.String(255), nullable=False),
+             sa.Column('artist_name', sa.String(255)),
+             sa.Column('caption', sa.String(200)),
+             sa.Column('timestamp', sa.DateTime))
+
+    sa.Table('likes', metadata,
+             sa.Column('id', sa.Integer, primary_key=True, autoincrement=True),
+             sa.Column('user_id', sa.Integer, sa.ForeignKey('users.id'), nullable=False),
+             sa.Column('post_id', sa.Integer, sa.ForeignKey('posts.id'), nullable=False))
+
+    sa.Table('comments', metadata,
+             sa.Column('id', sa.Integer, primary_key=True, autoincrement=True),
+             sa.Column('content', sa.Text, nullable=False),
+             sa.Column('user_id', sa.Integer, sa.ForeignKey('users.id'), nullable=False),
+             sa.Column('post_id', sa.Integer, sa.ForeignKey('posts.id'), nullable=False))
+
+    # databases made by db.create_all() already have these
+    metadata.create_all(conn, checkfirst=True)
@@ -0,0 +1,105 @@
+"""Feed timeline, Spotify catalog, engagement counters and user search indexes.
+
+The feed reads only from `timeline`, so existing posts are copied into it here,
+the way fan-out on write would have placed them: every post in its author's
+timeline and, unless the author has more than FANOUT_LIMIT followers (who are
+switched to fan-out on read), in their followers' timelines too. The new
+counters are filled from the existing rows.
+"""
+
+import sqlalchemy as sa
+
+from migrate import add_column, create_index
+
+FANOUT_LIMIT = 5000  # timeline.FANOUT_LIMIT when this migration was written
+
+
+def upgrade(conn):
+    add_column(conn, 'users', sa.Column('fanout_on_read', sa.Boolean, nullable=False, server_default=sa.false()))
+    add_column(conn, 'users', sa.Column('follower_count', sa.Integer, nullable=False, server_default='0'))
+    add_column(conn, 'users', sa.Column('following_count', sa.Integer, nullable=False, server_default='0'))
+    add_column(conn, 'users', sa.Column('liked_count', sa.Integer, nullable=False, server_default='0'))
+    add_column(conn, 'posts', sa.Column('like_count', sa.Integer, nullable=False, server_default='0'))
+    add_column(conn, 'posts', sa.Column('comment_count', sa.Integer, nullable=False, server_default='0'))
+
+    metadata = sa.MetaData()
+    # just enough of the existing tables for the foreign keys below
+    sa.Table('users', metadata, sa.Column('id', sa.Integer, primary_key=True))
+    sa.Table('posts', metadata, sa.Column('id', sa.Integer, primary_key=True))
+
+    sa.Table('timeline', metadata,
+             sa.Column('user_id', sa.Integer, sa.ForeignKey('users.id'), primary_key=True),
+             sa.Column('post_id', sa.Integer, sa.ForeignKey('posts.id'), primary_key=True),
+             sa.Column('author_id', sa.Integer, sa.ForeignKey('users.id'), nullable=False),
+             sa.Column('timestamp', sa.DateTime, nullable=False),
+             sa.Index('ix_timeline_user_timestamp', 'user_id', 'timestamp', 'post_id'),
+             sa.Index('ix_timeline_user_author', 'user_id', 'author_id'),
+             sa.Index('ix_timeline_post', 'post_id'))
+
+    sa.Table('tracks', metadata,
+             sa.Column('spotify_id', sa.String(255), primary_key=True),
+             sa.Column('name', sa.String(255), nullable=False),
+             sa.Column('artist_name', sa.String(255)),
+             sa.Column('album_name', sa.String(255)),
+             sa.Column('image_url', sa.String(512)),
+             sa.Column('duration_ms', sa.Integer),
+             sa.Column('preview_url', sa.String(512)),
+             sa.Column('fetched_at', sa.DateTime, nullable=False))
+
+    sa.Table('playlists', metadata,
+             sa.Column('spotify_id', sa.String(255), primary_key=True),
+             sa.Column('name', sa.String(255), nullable=False),
+             sa.Column('owner_name', sa.String(255)),
+             sa.Column('image_url', sa.String(512)),
+             sa.Column('track_count', sa.Integer),
+             sa.Column('fetched_at', sa.DateTime, nullable=False))
+
+    metadata.create_all(conn, tables=[metadata.tables[name] for name in ('timeline', 'tracks', 'playlists')],
+                        checkfirst=True)
+
+    create_index(conn, 'posts', 'ix_posts_timestamp_id', 'timestamp', 'id')
+
+    fill_counters(conn)
+    fill_timelines(conn)
+
+    if conn.dialect.name == 'postgresql':
+        conn.execute(sa.text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        conn.execute(sa.text("CREATE INDEX IF NOT EXISTS ix_users_username_lower "
+                             "ON users (lower(username) text_pattern_ops)"))
+        conn.execute(sa.text("CREATE INDEX IF NOT EXISTS ix_users_username_trgm "
+                             "ON users USING gin (lower(username) gin_trgm_ops)"))
+    else:
+        conn.execute(sa.text("CREATE INDEX IF NOT EXISTS ix_users_username_lower ON users (lower(username))"))
+
+
+def fill_counters(conn):
+    for statement in (
+        "UPDATE posts SET like_count = (SELECT COUNT(*) FROM likes WHERE likes.post_id = posts.id)",
+        "UPDATE posts SET comment_count = (SELECT COUNT(*) FROM comments WHERE comments.post_id = posts.id)",
+        "UPDATE users SET follower_count = (SELECT COUNT(*) FROM followers WHERE followers.followed_id = users.id)",
+        "UPDATE users SET following_count = (SELECT COUNT(*) FROM followers WHERE followers.follower_id = users.id)",
+        "UPDATE users SET liked_count = (SELECT COUNT(*) FROM likes WHERE likes.user_id = users.id)",
+    ):
+        conn.execute(sa.text(statement))
+
+
+def fill_timelines(conn):
+    conn.execute(sa.text("UPDATE users SET fanout_on_read = :on WHERE follower_count > :limit"),
+                 {'on': True, 'limit': FANOUT_LIMIT})
+
+    # posts without a timestamp cannot be ordered in a feed and are left out
+    conn.execute(sa.text(
+        "INSERT INTO timeline (user_id, post_id, author_id, timestamp) "
+        "SELECT posts.user_id, posts.id, posts.user_id, posts.timestamp FROM posts "
+        "WHERE posts.timestamp IS NOT NULL "
+        "AND NOT EXISTS (SELECT 1 FROM timeline WHERE timeline.user_id = posts.user_id "
+        "AND timeline.post_id = posts.id)"))
+    conn.execute(sa.text(
+        "INSERT INTO timeline (user_id, post_id, author_id, timestamp) "
+        "SELECT DISTINCT followers.follower_id, posts.id, posts.user_id, posts.timestamp "
+        "FROM followers JOIN posts ON posts.user_id = followers.followed_id "
+        "JOIN users authors ON authors.id = posts.user_id "
+        "WHERE posts.timestamp IS NOT NULL AND followers.follower_id != followers.followed_id "
+        "AND authors.fanout_on_read = :off "
+        "AND NOT EXISTS (SELECT 1 FROM timeline WHERE timeline.user_id = followers.follower_id "
+        "AND timeline.post_id = posts.id)"), {'off': False})
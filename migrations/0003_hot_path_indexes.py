@@ -0,0 +1,32 @@
+"""Indexes for the hot read paths, and uniqueness for likes and follows.
+
+Duplicate likes and follows (possible before this migration, when like/follow
+were check-then-insert) are removed first, and the counters they fed are
+recounted.
+"""
+
+import sqlalchemy as sa
+
+from migrate import create_index, delete_duplicates
+
+
+def upgrade(conn):
+    create_index(conn, 'posts', 'ix_posts_user_id_timestamp', 'user_id', 'timestamp')
+
+    if delete_duplicates(conn, 'likes', ['user_id', 'post_id']):
+        conn.execute(sa.text("UPDATE posts SET like_count = "
+                             "(SELECT COUNT(*) FROM likes WHERE likes.post_id = posts.id)"))
+        conn.execute(sa.text("UPDATE users SET liked_count = "
+                             "(SELECT COUNT(*) FROM likes WHERE likes.user_id = users.id)"))
+    create_index(conn, 'likes', 'uq_likes_user_post', 'user_id', 'post_id', unique=True)
+    create_index(conn, 'likes', 'ix_likes_post_id', 'post_id')
+
+    if delete_duplicates(conn, 'followers', ['follower_id', 'followed_id']):
+        conn.execute(sa.text("UPDATE users SET follower_count = "
+                             "(SELECT COUNT(*) FROM followers WHERE followers.followed_id = users.id)"))
+        conn.execute(sa.text("UPDATE users SET following_count = "
+                             "(SELECT COUNT(*) FROM followers WHERE followers.follower_id = users.id)"))
+    create_index(conn, 'followers', 'uq_followers_follower_followed', 'follower_id', 'followed_id', unique=True)
+    create_index(conn, 'followers', 'ix_followers_followed_id', 'followed_id')
+
+    create_index(conn, 'comments', 'ix_comments_post_id', 'post_id')
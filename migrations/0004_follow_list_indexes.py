@@ -0,0 +1,12 @@
+"""Indexes for paging follower and following lists by follow id.
+
+(followed_id, id) replaces the plain followed_id index, which it covers.
+"""
+
+from migrate import create_index, drop_index
+
+
+def upgrade(conn):
+    create_index(conn, 'followers', 'ix_followers_followed_id_id', 'followed_id', 'id')
+    create_index(conn, 'followers', 'ix_followers_follower_id_id', 'follower_id', 'id')
+    drop_index(conn, 'followers', 'ix_followers_followed_id')
@@ -0,0 +1,23 @@
+"""Background job queue table (see jobs.py)."""
+
+import sqlalchemy as sa
+
+
+def upgrade(conn):
+    metadata = sa.MetaData()
+    jobs = sa.Table('jobs', metadata,
+                    sa.Column('id', sa.Integer, primary_key=True, autoincrement=True),
+                    sa.Column('kind', sa.String(64), nullable=False),
+                    sa.Column('payload', sa.Text, nullable=False),
+                    sa.Column('idempotency_key', sa.String(255), nullable=True, unique=True),
+                    sa.Column('status', sa.String(16), nullable=False),
+                    sa.Column('attempts', sa.Integer, nullable=False),
+                    sa.Column('max_attempts', sa.Integer, nullable=False),
+                    sa.Column('run_at', sa.DateTime, nullable=False),
+                    sa.Column('created_at', sa.DateTime, nullable=False),
+                    sa.Column('started_at', sa.DateTime, nullable=True),
+                    sa.Column('finished_at', sa.DateTime, nullable=True),
+                    sa.Column('locked_by', sa.String(64), nullable=True),
+                    sa.Column('last_error', sa.Text, nullable=True),
+                    sa.Index('ix_jobs_status_run_at', 'status', 'run_at'))
+    jobs.create(conn, checkfirst=True)
@@ -0,0 +1,10 @@
+"""Per-user page versions for conditional GETs (see conditional.py)."""
+
+import sqlalchemy as sa
+
+from migrate import add_column
+
+
+def upgrade(conn):
+    add_column(conn, 'users', sa.Column('version', sa.Integer, nullable=False, server_default='0'))
+    add_column(conn, 'users', sa.Column('version_at', sa.DateTime, nullable=True))
@@ -0,0 +1,17 @@
+"""Time-bucketed post and like counts per Spotify item for the trending leaderboard (see trending.py)."""
+
+import sqlalchemy as sa
+
+
+def upgrade(conn):
+    metadata = sa.MetaData()
+    activity = sa.Table('track_activity', metadata,
+                        sa.Column('spotify_id', sa.String(255), primary_key=True),
+                        sa.Column('width', sa.Integer, primary_key=True),
+                        sa.Column('bucket', sa.DateTime, primary_key=True),
+                        sa.Column('name', sa.String(255), nullable=False),
+                        sa.Column('artist_name', sa.String(255), nullable=True),
+                        sa.Column('posts', sa.Integer, nullable=False),
+                        sa.Column('likes', sa.Integer, nullable=False),
+                        sa.Index('ix_track_activity_width_bucket', 'width', 'bucket'))
+    activity.create(conn, checkfirst=True)
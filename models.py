@@ -1,27 +1,97 @@
 from flask  import Flask
 from datetime import datetime
-from flask_bcrypt import Bcrypt
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import DDL, event, func, select
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash
 
-db = SQLAlchemy()
-bcrypt = Bcrypt()
+from passwords import hasher
+from replicas import RoutingSession
+
+# reads in GET requests can go to a read replica (see replicas.py)
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 def connect_db(app):
-    with app.app_context():
-        db.app = app
-        db.init_app(app)
-        db.create_all()
+    """Bind the database to the app. The schema is managed by migrations (`flask db upgrade`)."""
+    db.init_app(app)
 
 """def connect_db(app):
     db.app = app
     db.init_app(app)"""
 
 
+def increment(column, row_id, amount=1):
+    """Atomically add `amount` to a counter column for one row.
+
+    The addition happens in the UPDATE statement itself, so concurrent requests
+    never overwrite each other's changes.
+    """
+    if not amount:
+        return
+    model = column.class_
+    (db.session.query(model)
+     .filter(model.id == row_id)
+     .update({column: column + amount}, synchronize_session=False))
+
+
+def bump_versions(user_ids):
+    """Mark these users' pages as changed, for conditional GETs (see conditional.py).
+
+    `user_ids` is a list of ids or a select of them. The caller commits.
+    """
+    (db.session.query(User)
+     .filter(User.id.in_(user_ids))
+     .update({User.version: User.version + 1, User.version_at: datetime.utcnow()},
+             synchronize_session=False))
+
+
+def insert_ignore(model, **values):
+    """INSERT one row unless it would break a unique index, in a single statement.
+
+    Returns True if the row was inserted, False if it already existed.
+    """
+    if db.session.get_bind().dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+
+    statement = insert(model.__table__).values(**values).on_conflict_do_nothing()
+    return db.session.execute(statement).rowcount > 0
+
+
+def reconcile_counters():
+    """Recompute every counter column from the underlying rows.
+
+    Returns {counter name: number of rows that had drifted and were fixed}.
+    """
+    counts = [
+        (Post.like_count, select(func.count(Like.id)).where(Like.post_id == Post.id)),
+        (Post.comment_count, select(func.count(Comment.id)).where(Comment.post_id == Post.id)),
+        (User.follower_count, select(func.count(Follower.id)).where(Follower.followed_id == User.id)),
+        (User.following_count, select(func.count(Follower.id)).where(Follower.follower_id == User.id)),
+        (User.liked_count, select(func.count(Like.id)).where(Like.user_id == User.id)),
+    ]
+
+    drift = {}
+    for column, count in counts:
+        model = column.class_
+        actual = count.scalar_subquery()
+        drift[f"{model.__tablename__}.{column.key}"] = (db.session.query(model)
+                                                         .filter(column != actual)
+                                                         .update({column: actual}, synchronize_session=False))
+    return drift
+
+
 class Follower(db.Model):
     __tablename__ = 'followers'
 
+    # one row per pair, so follow() can be an upsert; (user, id) pages follower and following lists
+    __table_args__ = (
+        db.Index('uq_followers_follower_followed', 'follower_id', 'followed_id', unique=True),
+        db.Index('ix_followers_followed_id_id', 'followed_id', 'id'),
+        db.Index('ix_followers_follower_id_id', 'follower_id', 'id'),
+    )
+
     id = db.Column(db.Integer, 
                     primary_key=True,
                     autoincrement=True)
@@ -55,6 +125,37 @@ class User(db.Model):
     password = db.Column(db.String(128),
                                nullable = False)
 
+    # accounts with very large follower counts are not fanned out on write;
+    # their posts are merged into followers' feeds at read time instead
+    fanout_on_read = db.Column(db.Boolean,
+                               nullable = False,
+                               default = False)
+
+    # counters maintained on every follow/unfollow/like/unlike (see increment())
+    follower_count = db.Column(db.Integer,
+                               nullable = False,
+                               default = 0,
+                               server_default = '0')
+
+    following_count = db.Column(db.Integer,
+                                nullable = False,
+                                default = 0,
+                                server_default = '0')
+
+    liked_count = db.Column(db.Integer,
+                            nullable = False,
+                            default = 0,
+                            server_default = '0')
+
+    # bumped by every write that changes this user's feed or profile pages (see bump_versions)
+    version = db.Column(db.Integer,
+                        nullable = False,
+                        default = 0,
+                        server_default = '0')
+
+    version_at = db.Column(db.DateTime,
+                           nullable = True)
+
     #relationships to followers, posts, likes, comments
     posts = db.relationship('Post',
                              backref='author',
@@ -83,19 +184,41 @@ class User(db.Model):
         return self.followed.filter_by(followed_id=user.id).count() > 0
 
     def follow(self, user):
-        if not self.is_following(user):
-            follow = Follower(follower_id=self.id, followed_id=user.id)
-            db.session.add(follow)
+        """Follow `user`. Returns False if already following."""
+        followed = insert_ignore(Follower, follower_id=self.id, followed_id=user.id)
+        if followed:
+            increment(User.following_count, self.id)
+            increment(User.follower_count, user.id)
+            bump_versions([self.id, user.id])
+        return followed
 
     def unfollow(self, user):
-        if self.is_following(user):
-            Follower.query.filter_by(follower_id=self.id, followed_id=user.id).delete()
+        """Unfollow `user`. Returns False if not following."""
+        deleted = Follower.query.filter_by(follower_id=self.id, followed_id=user.id).delete()
+        increment(User.following_count, self.id, -deleted)
+        increment(User.follower_count, user.id, -deleted)
+        if deleted:
+            bump_versions([self.id, user.id])
+        return deleted > 0
 
     # instance methods: liking and unlikeing posts
     def like_post(self, post):
-        if not self.has_linked_post(post):
-            like = Like(user_id=self.id, post_id=post.id)
-            db.session.add(like)
+        """Like `post`. Returns False if already liked."""
+        liked = insert_ignore(Like, user_id=self.id, post_id=post.id)
+        if liked:
+            increment(Post.like_count, post.id)
+            increment(User.liked_count, self.id)
+            bump_versions([self.id, post.user_id])
+        return liked
+
+    def unlike_post(self, post):
+        """Unlike `post`. Returns False if it was not liked."""
+        deleted = Like.query.filter_by(user_id=self.id, post_id=post.id).delete()
+        increment(Post.like_count, post.id, -deleted)
+        increment(User.liked_count, self.id, -deleted)
+        if deleted:
+            bump_versions([self.id, post.user_id])
+        return deleted > 0
 
     def has_liked_post(self, post):
         return Like.query.filter(Like.user_id==self.id, Like.post_id==post.id).count() > 0
@@ -121,10 +244,10 @@ class User(db.Model):
     @classmethod
     def signup(cls, username, email, password):
         """registers a new user.
-            -hashes the password using Flask-Bcrypt and stores the user details in the database.
+            -hashes the password with bcrypt (on the hashing pool, see passwords.py) and stores the user details in the database.
         """
         #hash the password with bycrpt
-        hashed_password = bcrypt.generate_password_hash(password).decode('utf-8')
+        hashed_password = hasher.hash(password)
 
         #create new user object with hashed password
         new_user = cls(
@@ -143,24 +266,48 @@ class User(db.Model):
     def authenticate(cls, username, password):
         """auhenticate a user with username and password
             -finds the user by email and checks if the password matches using bcrypt
+            -upgrades a hash made with an older bcrypt cost; the caller commits
         """
         #find user by username
-        print(f"authenticating user: {username}")
         user = cls.query.filter_by(username=username).first()
 
         #if user exists and password matches, return the user
-        if user and bcrypt.check_password_hash(user.password, password):
-            print(f"User {username} authenticaed successfully.")
+        if user and hasher.check(user.password, password):
+            if hasher.needs_rehash(user.password):
+                user.password = hasher.hash(password)
             return user
 
         #otherwise, return none if authentication fails
-        print("authentication failed")
         return None
 
+# user search: prefix matches use the lower(username) index, substring matches
+# use the pg_trgm GIN index (Postgres only, see search.py)
+db.Index('ix_users_username_lower',
+         func.lower(User.username).label('lower_username'),
+         postgresql_ops={'lower_username': 'text_pattern_ops'})
+
+db.Index('ix_users_username_trgm',
+         func.lower(User.username).label('lower_username'),
+         postgresql_using='gin',
+         postgresql_ops={'lower_username': 'gin_trgm_ops'}).ddl_if(dialect='postgresql')
+
+# the trigram index needs the pg_trgm extension
+event.listen(User.__table__,
+             'before_create',
+             DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(dialect='postgresql'))
+
+
 class Post(db.Model):
     
     __tablename__ = 'posts'
 
+    # keyset pagination on the feed walks posts by (timestamp, id);
+    # profiles list one user's posts newest first
+    __table_args__ = (
+        db.Index('ix_posts_timestamp_id', 'timestamp', 'id'),
+        db.Index('ix_posts_user_id_timestamp', 'user_id', 'timestamp'),
+    )
+
     id = db.Column(db.Integer,
                     primary_key=True,
                     autoincrement=True)
@@ -181,6 +328,17 @@ class Post(db.Model):
     caption = db.Column(db.String(200), 
                          nullable=True)
 
+    # counters maintained on every like/unlike/comment (see increment())
+    like_count = db.Column(db.Integer,
+                           nullable=False,
+                           default=0,
+                           server_default='0')
+
+    comment_count = db.Column(db.Integer,
+                              nullable=False,
+                              default=0,
+                              server_default='0')
+
     timestamp = db.Column(db.DateTime, 
                            default=datetime.utcnow)
 
@@ -199,6 +357,12 @@ class Post(db.Model):
 class Like(db.Model):
     __tablename__ = 'likes'
 
+    # one like per user and post, so like_post() can be an upsert
+    __table_args__ = (
+        db.Index('uq_likes_user_post', 'user_id', 'post_id', unique=True),
+        db.Index('ix_likes_post_id', 'post_id'),
+    )
+
     id = db.Column(db.Integer, 
                     primary_key=True,
                     autoincrement=True)
@@ -216,6 +380,10 @@ class Like(db.Model):
 class Comment(db.Model):
     __tablename__ = 'comments'
 
+    __table_args__ = (
+        db.Index('ix_comments_post_id', 'post_id'),
+    )
+
     id = db.Column(db.Integer, 
                     primary_key=True,
                     autoincrement=True)
@@ -232,3 +400,192 @@ class Comment(db.Model):
                         nullable=False)
 
 
+class TimelineEntry(db.Model):
+    """A post materialised into a user's feed (fan-out on write)."""
+
+    __tablename__ = 'timeline'
+
+    user_id = db.Column(db.Integer,
+                        db.ForeignKey('users.id'),
+                        primary_key=True)
+
+    post_id = db.Column(db.Integer,
+                        db.ForeignKey('posts.id'),
+                        primary_key=True)
+
+    # copied from the post so unfollowing can prune without touching posts
+    author_id = db.Column(db.Integer,
+                          db.ForeignKey('users.id'),
+                          nullable=False)
+
+    # copied from the post so a feed page is a single range scan on this table
+    timestamp = db.Column(db.DateTime,
+                          nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_timeline_user_timestamp', 'user_id', 'timestamp', 'post_id'),
+        db.Index('ix_timeline_user_author', 'user_id', 'author_id'),
+        db.Index('ix_timeline_post', 'post_id'),
+    )
+
+
+class Track(db.Model):
+    """Spotify track metadata cached locally, keyed by Spotify ID."""
+
+    __tablename__ = 'tracks'
+
+    spotify_id = db.Column(db.String(255),
+                           primary_key=True)
+
+    name = db.Column(db.String(255),
+                     nullable=False)
+
+    artist_name = db.Column(db.String(255),
+                            nullable=True)
+
+    album_name = db.Column(db.String(255),
+                           nullable=True)
+
+    image_url = db.Column(db.String(512),
+                          nullable=True)
+
+    duration_ms = db.Column(db.Integer,
+                            nullable=True)
+
+    preview_url = db.Column(db.String(512),
+                            nullable=True)
+
+    fetched_at = db.Column(db.DateTime,
+                           nullable=False,
+                           default=datetime.utcnow)
+
+    @property
+    def duration(self):
+        """Track length as m:ss."""
+        if self.duration_ms is None:
+            return None
+        seconds = self.duration_ms // 1000
+        return f"{seconds // 60}:{seconds % 60:02d}"
+
+
+class Playlist(db.Model):
+    """Spotify playlist metadata cached locally, keyed by Spotify ID."""
+
+    __tablename__ = 'playlists'
+
+    spotify_id = db.Column(db.String(255),
+                           primary_key=True)
+
+    name = db.Column(db.String(255),
+                     nullable=False)
+
+    owner_name = db.Column(db.String(255),
+                           nullable=True)
+
+    image_url = db.Column(db.String(512),
+                          nullable=True)
+
+    track_count = db.Column(db.Integer,
+                            nullable=True)
+
+    fetched_at = db.Column(db.DateTime,
+                           nullable=False,
+                           default=datetime.utcnow)
+
+
+
+class TrackActivity(db.Model):
+    """Posts and likes of one Spotify item in one time bucket, for the trending leaderboard (see trending.py)."""
+
+    __tablename__ = 'track_activity'
+
+    # each leaderboard sums one bucket width over a range of buckets
+    __table_args__ = (
+        db.Index('ix_track_activity_width_bucket', 'width', 'bucket'),
+    )
+
+    spotify_id = db.Column(db.String(255),
+                           primary_key=True)
+
+    width = db.Column(db.Integer,
+                      primary_key=True)  # bucket length in seconds
+
+    bucket = db.Column(db.DateTime,
+                       primary_key=True)  # start of the bucket (UTC)
+
+    # as of the item's latest post or like, so a leaderboard needs no other table
+    name = db.Column(db.String(255),
+                     nullable=False)
+
+    artist_name = db.Column(db.String(255),
+                            nullable=True)
+
+    posts = db.Column(db.Integer,
+                      nullable=False,
+                      default=0)
+
+    likes = db.Column(db.Integer,
+                      nullable=False,
+                      default=0)
+
+
+class Job(db.Model):
+    """A unit of background work, run by `flask jobs work` (see jobs.py)."""
+
+    __tablename__ = 'jobs'
+
+    # workers claim the oldest due jobs of a status
+    __table_args__ = (
+        db.Index('ix_jobs_status_run_at', 'status', 'run_at'),
+    )
+
+    id = db.Column(db.Integer,
+                   primary_key=True,
+                   autoincrement=True)
+
+    kind = db.Column(db.String(64),
+                     nullable=False)
+
+    payload = db.Column(db.Text,
+                        nullable=False,
+                        default='{}')  # JSON keyword arguments for the handler
+
+    # enqueueing the same key twice creates one job
+    idempotency_key = db.Column(db.String(255),
+                                nullable=True,
+                                unique=True)
+
+    status = db.Column(db.String(16),
+                       nullable=False,
+                       default='queued')  # queued, running, done or dead
+
+    attempts = db.Column(db.Integer,
+                         nullable=False,
+                         default=0)
+
+    max_attempts = db.Column(db.Integer,
+                             nullable=False,
+                             default=5)
+
+    run_at = db.Column(db.DateTime,
+                       nullable=False,
+                       default=datetime.utcnow)
+
+    created_at = db.Column(db.DateTime,
+                           nullable=False,
+                           default=datetime.utcnow)
+
+    started_at = db.Column(db.DateTime,
+                           nullable=True)
+
+    finished_at = db.Column(db.DateTime,
+                            nullable=True)
+
+    locked_by = db.Column(db.String(64),
+                          nullable=True)
+
+    last_error = db.Column(db.Text,
+                           nullable=True)
+
+    def __repr__(self):
+        return f"<Job {self.id} {self.kind} {self.status}>"
@@ -0,0 +1,186 @@
+"""Password hashing on a bounded worker pool.
+
+bcrypt is deliberately slow. Running it on the request thread lets a burst of
+logins occupy every server worker, so hashes and checks run on a small thread
+pool instead (bcrypt releases the GIL while it works). At most
+`workers + max_queue` operations are accepted at once; beyond that callers wait
+up to `queue_timeout` seconds for a slot and then get PasswordHasherBusy, which
+the app turns into a 503 rather than letting requests pile up.
+
+The bcrypt cost is calibrated the first time it is needed: the highest cost
+whose hash takes no longer than the target time on this machine, never below
+MIN_ROUNDS. Hashes made with a lower cost are upgraded the next time their
+owner logs in (see User.authenticate).
+"""
+
+import os
+import time
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from flask_bcrypt import Bcrypt
+
+logger = logging.getLogger(__name__)
+
+TARGET_SECONDS = 0.25  # how long one hash should take after calibration
+MIN_ROUNDS = 10
+MAX_ROUNDS = 15
+WORKERS = 2
+MAX_QUEUE = 16         # operations allowed to wait for a worker
+QUEUE_TIMEOUT = 2.0    # seconds a caller waits for a queue slot before giving up
+TIMING_SAMPLES = 1000  # recent durations kept per operation for percentiles
+
+
+class PasswordHasherBusy(Exception):
+    """Raised when the hashing pool is saturated and the caller should retry later."""
+
+
+def hash_rounds(password_hash):
+    """The bcrypt cost a hash was made with ('$2b$12$...' -> 12)."""
+    try:
+        return int(password_hash.split('$')[2])
+    except (AttributeError, IndexError, ValueError):
+        return 0
+
+
+class PasswordHasher:
+    """Runs bcrypt hashes and checks on a bounded thread pool, with a calibrated cost."""
+
+    def __init__(self, workers=WORKERS, max_queue=MAX_QUEUE, queue_timeout=QUEUE_TIMEOUT,
+                 target_seconds=TARGET_SECONDS, rounds=None):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.target_seconds = target_seconds
+
+        self._bcrypt = Bcrypt()
+        self._rounds = rounds  # None until calibrated
+        self._lock = threading.Lock()
+        self._executor = None
+        self._slots = threading.BoundedSemaphore(workers + max_queue)
+
+        self.accepted = 0
+        self.rejected = 0
+        self.running = 0
+        self._timings = {'hash': deque(maxlen=TIMING_SAMPLES), 'check': deque(maxlen=TIMING_SAMPLES)}
+
+    def configure(self, workers=None, max_queue=None, queue_timeout=None, target_seconds=None, rounds=None):
+        """Change the pool settings, e.g. from app config. Takes effect for the next operation."""
+        with self._lock:
+            if workers is not None:
+                self.workers = workers
+            if max_queue is not None:
+                self.max_queue = max_queue
+            if queue_timeout is not None:
+                self.queue_timeout = queue_timeout
+            if target_seconds is not None:
+                self.target_seconds = target_seconds
+            self._rounds = rounds
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+            self._slots = threading.BoundedSemaphore(self.workers + self.max_queue)
+
+    def after_fork(self):
+        """Forget the parent's pool in a forked worker; its threads do not exist there."""
+        self._lock = threading.Lock()
+        self._executor = None
+        self._slots = threading.BoundedSemaphore(self.workers + self.max_queue)
+        self.running = 0
+
+    def calibrate(self):
+        """Pick the highest cost whose hash takes at most target_seconds. Returns the cost."""
+        start = time.perf_counter()
+        self._bcrypt.generate_password_hash('calibration', MIN_ROUNDS)
+        elapsed = time.perf_counter() - start
+
+        # each extra round doubles the work
+        rounds = MIN_ROUNDS
+        while rounds < MAX_ROUNDS and elapsed * 2 <= self.target_seconds:
+            rounds += 1
+            elapsed *= 2
+
+        logger.info("bcrypt cost calibrated to %s (about %.0f ms per hash)", rounds, elapsed * 1000)
+        return rounds
+
+    @property
+    def rounds(self):
+        """The bcrypt cost for new hashes, calibrated on first use."""
+        if self._rounds is None:
+            with self._lock:
+                if self._rounds is None:
+                    self._rounds = self.calibrate()
+        return self._rounds
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='bcrypt')
+            return self._executor
+
+    def _timed(self, operation, fn, *args):
+        with self._lock:
+            self.running += 1
+        start = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.running -= 1
+                self._timings[operation].append(elapsed)
+
+    def _submit(self, operation, fn, *args):
+        """Run fn(*args) on the pool and wait for the result, or raise PasswordHasherBusy."""
+        slots = self._slots
+        if not slots.acquire(timeout=self.queue_timeout):
+            with self._lock:
+                self.rejected += 1
+            raise PasswordHasherBusy("Too many password operations in progress")
+
+        with self._lock:
+            self.accepted += 1
+        try:
+            return self._pool().submit(self._timed, operation, fn, *args).result()
+        finally:
+            slots.release()
+
+    def hash(self, password):
+        """Return a bcrypt hash of `password` as text, made with the calibrated cost."""
+        rounds = self.rounds
+        return self._submit('hash', self._bcrypt.generate_password_hash, password, rounds).decode('utf-8')
+
+    def check(self, password_hash, password):
+        """Return True if `password` matches `password_hash`."""
+        return self._submit('check', self._bcrypt.check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        """True if the hash was made with a lower cost than the current one."""
+        return hash_rounds(password_hash) < self.rounds
+
+    def stats(self):
+        """Pool utilisation, rejections and hash/check timings, for monitoring."""
+        with self._lock:
+            timings = {operation: sorted(samples) for operation, samples in self._timings.items()}
+            stats = {
+                'rounds': self._rounds,
+                'workers': self.workers,
+                'running': self.running,
+                'utilisation': self.running / self.workers,
+                'accepted': self.accepted,
+                'rejected': self.rejected,
+            }
+
+        for operation, samples in timings.items():
+            stats[f'{operation}_count'] = len(samples)
+            stats[f'{operation}_p50'] = samples[len(samples) // 2] if samples else None
+            stats[f'{operation}_p95'] = samples[min(len(samples) - 1, int(len(samples) * 0.95))] if samples else None
+        return stats
+
+
+hasher = PasswordHasher()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=hasher.after_fork)
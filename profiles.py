@@ -0,0 +1,174 @@
+"""Profile read model.
+
+The profile header (counts plus follow state between the viewer and the
+profile's owner) comes back in one query from the counters kept on the user
+row, so it costs the same for a new account as for one with thousands of posts.
+Posts, liked posts, followers and following are loaded a page at a time;
+post lists as post cards (see feed.py).
+"""
+
+import base64
+
+from sqlalchemy import select, exists, or_, and_
+
+from models import db, User, Post, Like, Follower
+from feed import FeedPost, feed_post_query, fetch_page, page_of
+
+PROFILE_PAGE_SIZE = 20
+
+
+class ProfileSummary:
+    """The header of a profile page as seen by one viewer."""
+
+    __slots__ = ('id', 'username', 'follower_count', 'following_count',
+                 'liked_count', 'viewer_follows', 'follows_viewer')
+
+    def __init__(self, **fields):
+        for name in self.__slots__:
+            setattr(self, name, fields.get(name))
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __repr__(self):
+        return f"<ProfileSummary {self.id} {self.username}>"
+
+
+def get_profile_summary(user_id, viewer_id):
+    """Return the ProfileSummary for `user_id` as seen by `viewer_id`, or None if there is no such user."""
+    viewer_follows = (exists()
+                      .where(Follower.follower_id == viewer_id, Follower.followed_id == User.id)
+                      .correlate(User))
+    follows_viewer = (exists()
+                      .where(Follower.follower_id == User.id, Follower.followed_id == viewer_id)
+                      .correlate(User))
+
+    row = db.session.execute(select(User.id,
+                                    User.username,
+                                    User.follower_count,
+                                    User.following_count,
+                                    User.liked_count,
+                                    viewer_follows.label('viewer_follows'),
+                                    follows_viewer.label('follows_viewer'))
+                             .where(User.id == user_id)).first()
+
+    if row is None:
+        return None
+    summary = ProfileSummary(**row._mapping)
+    summary.viewer_follows = bool(summary.viewer_follows)
+    summary.follows_viewer = bool(summary.follows_viewer)
+    return summary
+
+
+def get_profile_posts(user_id, viewer_id, cursor=None, limit=PROFILE_PAGE_SIZE):
+    """Return (posts, next_cursor) for one page of a user's own posts, newest first."""
+    query = feed_post_query(viewer_id).where(Post.user_id == user_id)
+    return page_of(fetch_page(query, cursor, limit), limit)
+
+
+def encode_id_cursor(row_id):
+    """Return an opaque cursor for lists paged by a single id column."""
+    return base64.urlsafe_b64encode(str(row_id).encode('ascii')).decode('ascii')
+
+
+def decode_id_cursor(cursor):
+    """Turn an id cursor back into the id. Raises ValueError if it is malformed."""
+    try:
+        return int(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('ascii'))
+    except (UnicodeError, TypeError, ValueError) as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
+
+
+def get_liked_posts(user_id, viewer_id, cursor=None, limit=PROFILE_PAGE_SIZE):
+    """Return (posts, next_cursor) for one page of the posts a user has liked, newest post first.
+
+    Ordered by post id rather than timestamp so each page is a range scan of the
+    (user_id, post_id) index on likes, however many posts the user has liked.
+    """
+    query = (feed_post_query(viewer_id)
+             .join(Like, Like.post_id == Post.id)
+             .where(Like.user_id == user_id))
+    if cursor:
+        query = query.where(Like.post_id < decode_id_cursor(cursor))
+
+    query = query.order_by(Like.post_id.desc()).limit(limit + 1)
+    posts = [FeedPost(**row._mapping) for row in db.session.execute(query)]
+
+    if len(posts) > limit:
+        posts = posts[:limit]
+        return posts, encode_id_cursor(posts[-1].id)
+    return posts, None
+
+
+class FollowListEntry:
+    """One user in a follower or following list, with their follow state relative to the viewer."""
+
+    __slots__ = ('follow_id', 'id', 'username', 'viewer_follows', 'follows_viewer')
+
+    def __init__(self, **fields):
+        for name in self.__slots__:
+            setattr(self, name, fields.get(name))
+
+    def to_dict(self):
+        return {'id': self.id,
+                'username': self.username,
+                'viewer_follows': self.viewer_follows,
+                'follows_viewer': self.follows_viewer}
+
+    def __repr__(self):
+        return f"<FollowListEntry {self.id} {self.username}>"
+
+
+def annotate_follow_state(entries, viewer_id):
+    """Set viewer_follows and follows_viewer on every entry with one query."""
+    user_ids = [entry.id for entry in entries]
+    if not user_ids:
+        return entries
+
+    rows = db.session.execute(select(Follower.follower_id, Follower.followed_id)
+                              .where(or_(and_(Follower.follower_id == viewer_id,
+                                              Follower.followed_id.in_(user_ids)),
+                                         and_(Follower.followed_id == viewer_id,
+                                              Follower.follower_id.in_(user_ids)))))
+
+    viewer_follows, follows_viewer = set(), set()
+    for follower_id, followed_id in rows:
+        if follower_id == viewer_id:
+            viewer_follows.add(followed_id)
+        if followed_id == viewer_id:
+            follows_viewer.add(follower_id)
+
+    for entry in entries:
+        entry.viewer_follows = entry.id in viewer_follows
+        entry.follows_viewer = entry.id in follows_viewer
+    return entries
+
+
+def _follow_list(user_column, list_column, user_id, viewer_id, cursor, limit):
+    """One page of the users in `list_column` of follow rows whose `user_column` is `user_id`, newest follow first."""
+    query = (select(Follower.id.label('follow_id'), User.id, User.username)
+             .join(User, User.id == list_column)
+             .where(user_column == user_id))
+    if cursor:
+        query = query.where(Follower.id < decode_id_cursor(cursor))
+
+    # served by the (followed_id, id) and (follower_id, id) indexes on followers
+    query = query.order_by(Follower.id.desc()).limit(limit + 1)
+    entries = [FollowListEntry(**row._mapping) for row in db.session.execute(query)]
+
+    next_cursor = None
+    if len(entries) > limit:
+        entries = entries[:limit]
+        next_cursor = encode_id_cursor(entries[-1].follow_id)
+
+    return annotate_follow_state(entries, viewer_id), next_cursor
+
+
+def get_followers(user_id, viewer_id, cursor=None, limit=PROFILE_PAGE_SIZE):
+    """Return (entries, next_cursor) for one page of the user's followers, most recent first."""
+    return _follow_list(Follower.followed_id, Follower.follower_id, user_id, viewer_id, cursor, limit)
+
+
+def get_following(user_id, viewer_id, cursor=None, limit=PROFILE_PAGE_SIZE):
+    """Return (entries, next_cursor) for one page of the users the user follows, most recent first."""
+    return _follow_list(Follower.follower_id, Follower.followed_id, user_id, viewer_id, cursor, limit)
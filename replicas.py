@@ -0,0 +1,165 @@
+"""Read replicas for the db session.
+
+Replicas are extra binds named replica_1, replica_2, ... (from
+DATABASE_REPLICA_URLS). RoutingSession sends a plain SELECT to a replica when
+the request is a GET or HEAD, nothing in the request has written yet, and the
+user has not written anything in the last READ_YOUR_WRITES_SECONDS. Requests
+that write leave that deadline in the user's session, so the page a POST
+redirects to shows the user their own change. Everything else goes to the
+primary: writes, SELECT ... FOR UPDATE, raw SQL, CLI commands and jobs.
+
+Each request reads from one replica, picked at random among those that were
+no more than REPLICA_MAX_LAG_SECONDS behind at their last check (at most every
+REPLICA_CHECK_SECONDS). A replica that is lagging or cannot be reached is
+skipped until a later check finds it caught up. With none left, reads fall back
+to the primary.
+"""
+
+import time
+import random
+import logging
+import threading
+
+from flask import g, request, session, has_request_context, current_app
+from flask_sqlalchemy.session import Session
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.sql.dml import UpdateBase
+
+logger = logging.getLogger(__name__)
+
+REPLICA_PREFIX = 'replica_'
+READ_METHODS = ('GET', 'HEAD')
+PRIMARY_UNTIL = '_db_primary_until'  # session key: the user reads from the primary until this time
+
+# a standby that has replayed everything it received is current, however long ago the last write was
+POSTGRES_LAG = text("SELECT COALESCE(CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+                    "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END, 0)")
+
+
+def replica_keys(config):
+    """The bind keys of the configured replicas."""
+    return [key for key in config.get('SQLALCHEMY_BINDS') or {} if key.startswith(REPLICA_PREFIX)]
+
+
+def replica_lag(engine):
+    """Seconds the replica is behind the primary (0 where the database cannot tell)."""
+    if engine.dialect.name != 'postgresql':
+        return 0.0
+    with engine.connect() as conn:
+        return float(conn.execute(POSTGRES_LAG).scalar())
+
+
+class ReplicaHealth:
+    """Remembers which replica engines are usable, re-checking each one at most every `interval` seconds."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._checked = {}  # engine -> (checked at, usable)
+        self.counters = {'replica_requests': 0, 'read_your_writes': 0, 'fallbacks': 0,
+                         'checks': 0, 'lagging': 0, 'unreachable': 0}
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def usable(self, engine, max_lag, interval):
+        checked = self._checked.get(engine)
+        now = time.monotonic()
+        if checked is not None and now - checked[0] < interval:
+            return checked[1]
+
+        # checked outside the lock; two threads racing to check the same replica is harmless
+        self._count('checks')
+        try:
+            lag = replica_lag(engine)
+        except DBAPIError as e:
+            self._count('unreachable')
+            logger.warning("Replica %s is unreachable, reading from the primary: %s", engine.url, e)
+            usable = False
+        else:
+            usable = lag <= max_lag
+            if not usable:
+                self._count('lagging')
+                logger.warning("Replica %s is %.1fs behind, reading from the primary", engine.url, lag)
+
+        with self._lock:
+            self._checked[engine] = (now, usable)
+        return usable
+
+    def choose(self, engines, config):
+        """A usable replica engine for this request, or None to read from the primary."""
+        usable = [engines[key] for key in replica_keys(config)
+                  if self.usable(engines[key], config['REPLICA_MAX_LAG_SECONDS'], config['REPLICA_CHECK_SECONDS'])]
+        if not usable:
+            self._count('fallbacks')
+            return None
+        self._count('replica_requests')
+        return random.choice(usable)
+
+    def reset(self):
+        with self._lock:
+            self._checked.clear()
+
+    def stats(self):
+        """Requests routed to replicas and replica checks that failed, for monitoring."""
+        with self._lock:
+            return dict(self.counters, replicas=len(self._checked),
+                        usable=sum(usable for _, usable in self._checked.values()))
+
+
+health = ReplicaHealth()
+
+
+def _is_plain_select(clause):
+    return (clause is not None and getattr(clause, 'is_select', False)
+            and getattr(clause, '_for_update_arg', None) is None)
+
+
+class RoutingSession(Session):
+    """The db session: reads in read-only requests go to a replica, everything else to the primary."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        engine = super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+        if bind is not None or not has_request_context() or engine is not self._db.engines.get(None):
+            return engine
+
+        if self._flushing or isinstance(clause, UpdateBase):
+            # the rest of the request reads its own writes
+            g.db_wrote = True
+            g.db_read_replica = False
+            return engine
+
+        if g.get('db_read_replica') and _is_plain_select(clause):
+            if 'db_replica' not in g:
+                g.db_replica = health.choose(self._db.engines, current_app.config)
+            return g.db_replica or engine
+        return engine
+
+
+def _route_request():
+    g.db_wrote = False
+    g.pop('db_replica', None)
+    g.db_read_replica = False
+    if request.method not in READ_METHODS or not replica_keys(current_app.config):
+        return
+
+    primary_until = session.get(PRIMARY_UNTIL)
+    if primary_until is not None:
+        if primary_until > time.time():
+            health._count('read_your_writes')
+            return
+        session.pop(PRIMARY_UNTIL)
+    g.db_read_replica = True
+
+
+def _remember_writes(response):
+    if g.get('db_wrote') and replica_keys(current_app.config):
+        session[PRIMARY_UNTIL] = time.time() + current_app.config['READ_YOUR_WRITES_SECONDS']
+    return response
+
+
+def init_app(app):
+    """Route each request's reads (see the module docstring)."""
+    app.before_request(_route_request)
+    app.after_request(_remember_writes)
@@ -0,0 +1,164 @@
+"""User search.
+
+Results are ranked exact match first, then prefix matches, then other
+substring matches, and paginated. Queries shorter than NGRAM_SIZE characters
+only match username prefixes.
+
+On Postgres the lookup is served by indexes on users (see models.py): the
+lower(username) btree for prefixes and the pg_trgm GIN index for substrings.
+Other databases (SQLite in development and tests) use an in-process n-gram
+index over usernames that is rebuilt periodically to pick up new users.
+"""
+
+import time
+import threading
+from bisect import bisect_left
+
+from sqlalchemy import case, func
+
+from models import db, User
+
+SEARCH_PAGE_SIZE = 20
+NGRAM_SIZE = 3
+INDEX_MAX_AGE = 300  # seconds before the in-process index is rebuilt
+
+
+def escape_like(text):
+    """Escape LIKE wildcards so user input matches literally."""
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def ngrams(text):
+    return {text[i:i + NGRAM_SIZE] for i in range(len(text) - NGRAM_SIZE + 1)}
+
+
+def rank(username, query):
+    """0 for an exact match, 1 for a prefix match, 2 otherwise (lowercase inputs)."""
+    if username == query:
+        return 0
+    if username.startswith(query):
+        return 1
+    return 2
+
+
+class NgramIndex:
+    """In-process n-gram index over usernames, for databases without pg_trgm."""
+
+    def __init__(self, max_age=INDEX_MAX_AGE):
+        self.max_age = max_age
+
+        self._lock = threading.Lock()
+        self._built_at = None
+        self._usernames = {}  # user id -> lowercase username
+        self._postings = {}   # n-gram -> set of user ids
+        self._sorted = []     # (lowercase username, user id), for prefix lookups
+
+    def _build(self):
+        usernames = {user_id: username.lower()
+                     for user_id, username in db.session.query(User.id, User.username)}
+
+        postings = {}
+        for user_id, username in usernames.items():
+            for gram in ngrams(username):
+                postings.setdefault(gram, set()).add(user_id)
+
+        self._usernames = usernames
+        self._postings = postings
+        self._sorted = sorted((username, user_id) for user_id, username in usernames.items())
+        self._built_at = time.monotonic()
+
+    def _ensure_fresh(self):
+        with self._lock:
+            if self._built_at is None or time.monotonic() - self._built_at > self.max_age:
+                self._build()
+
+    def add(self, user):
+        """Index a newly created user without waiting for the next rebuild."""
+        with self._lock:
+            if self._built_at is None:
+                return  # picked up by the first build
+            username = user.username.lower()
+            self._usernames[user.id] = username
+            for gram in ngrams(username):
+                self._postings.setdefault(gram, set()).add(user.id)
+            self._sorted.insert(bisect_left(self._sorted, (username, user.id)), (username, user.id))
+
+    def invalidate(self):
+        with self._lock:
+            self._built_at = None
+
+    def _prefix_matches(self, query):
+        start = bisect_left(self._sorted, (query,))
+        for username, user_id in self._sorted[start:]:
+            if not username.startswith(query):
+                break
+            yield user_id
+
+    def search(self, query):
+        """Return matching user ids, best ranked first."""
+        self._ensure_fresh()
+
+        with self._lock:
+            if len(query) < NGRAM_SIZE:
+                matches = list(self._prefix_matches(query))
+            else:
+                grams = sorted(ngrams(query), key=lambda gram: len(self._postings.get(gram, ())))
+                candidates = set(self._postings.get(grams[0], ()))
+                for gram in grams[1:]:
+                    candidates &= self._postings.get(gram, set())
+                # n-grams can match out of order, so confirm the substring
+                matches = [user_id for user_id in candidates if query in self._usernames[user_id]]
+
+            return sorted(matches, key=lambda user_id: (rank(self._usernames[user_id], query),
+                                                        self._usernames[user_id],
+                                                        user_id))
+
+
+user_index = NgramIndex()
+
+
+def _search_postgres(query, page, per_page):
+    username = func.lower(User.username)
+    pattern = escape_like(query)
+
+    if len(query) < NGRAM_SIZE:
+        match = username.like(f"{pattern}%", escape='\\')
+        similarity = func.length(username)
+    else:
+        match = username.like(f"%{pattern}%", escape='\\')
+        similarity = -func.similarity(username, query)
+
+    ranking = case((username == query, 0),
+                   (username.like(f"{pattern}%", escape='\\'), 1),
+                   else_=2)
+
+    return (User.query
+            .filter(match)
+            .order_by(ranking, similarity, username, User.id)
+            .offset((page - 1) * per_page)
+            .limit(per_page + 1)
+            .all())
+
+
+def _search_ngram_index(query, page, per_page):
+    start = (page - 1) * per_page
+    user_ids = user_index.search(query)[start:start + per_page + 1]
+    if not user_ids:
+        return []
+
+    users = {user.id: user for user in User.query.filter(User.id.in_(user_ids))}
+    return [users[user_id] for user_id in user_ids if user_id in users]
+
+
+def search_users(query, page=1, per_page=SEARCH_PAGE_SIZE):
+    """Return (users, has_next) for one page of users whose username contains `query`."""
+    query = query.strip().lower()
+    if not query:
+        return [], False
+
+    if db.engine.dialect.name == 'postgresql':
+        users = _search_postgres(query, page, per_page)
+    else:
+        users = _search_ngram_index(query, page, per_page)
+
+    return users[:per_page], len(users) > per_page
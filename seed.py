@@ -0,0 +1,219 @@
+"""Synthetic datasets shaped like production traffic, for benchmarks and load tests.
+
+Real social graphs are heavily skewed: a few accounts have most of the
+followers, a few users write most of the posts and a few posts get most of the
+likes. generate() reproduces that by giving every user a Pareto-distributed
+popularity and activity weight and drawing follows, posts, likes and comments
+from those weights (a lower `alpha` means a longer tail).
+
+Rows are written with bulk multi-row inserts in chunks, then the counter
+columns are reconciled and the materialised timelines filled with one
+INSERT ... SELECT, so the result looks like data written through the app.
+Every seeded account has the password SEED_PASSWORD.
+
+    flask seed --users 10000 --posts 200000 --likes 1000000
+
+Ids continue from the highest existing id, so seeding into a non-empty
+database adds to it.
+"""
+
+import random
+import logging
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, insert, func, union_all, text
+
+from models import db, User, Follower, Post, Like, Comment, TimelineEntry, Track, reconcile_counters
+from passwords import hasher
+import timeline
+
+logger = logging.getLogger(__name__)
+
+SEED_PASSWORD = 'password'
+CHUNK_SIZE = 5000   # rows per multi-row insert
+ALPHA = 1.2         # Pareto shape of popularity and activity; lower is more skewed
+DAYS = 90           # posts and follows are spread over this many days
+
+DEFAULT_SIZES = {
+    'users': 1000,
+    'follows': 20000,
+    'posts': 10000,
+    'likes': 50000,
+    'comments': 10000,
+    'tracks': 500,
+}
+
+
+def _weights(rng, count, alpha):
+    """Cumulative Pareto weights for `count` items, for random.choices(cum_weights=...)."""
+    total = 0.0
+    cumulative = []
+    for _ in range(count):
+        total += rng.paretovariate(alpha)
+        cumulative.append(total)
+    return cumulative
+
+
+def _draw(rng, population, cum_weights, k):
+    return rng.choices(population, cum_weights=cum_weights, k=k)
+
+
+def _next_id(model):
+    return (db.session.scalar(select(func.max(model.id))) or 0) + 1
+
+
+def _bulk_insert(model, rows):
+    for start in range(0, len(rows), CHUNK_SIZE):
+        db.session.execute(insert(model.__table__), rows[start:start + CHUNK_SIZE])
+
+
+def _pairs(count, draw_first, draw_second, exclude_self=False):
+    """Up to `count` distinct (first, second) pairs; gives up on pairs the weights keep repeating."""
+    pairs = set()
+    for _ in range(4):
+        missing = count - len(pairs)
+        if missing <= 0:
+            break
+        for pair in zip(draw_first(missing), draw_second(missing)):
+            if not (exclude_self and pair[0] == pair[1]):
+                pairs.add(pair)
+    return list(pairs)[:count]
+
+
+def _spread(rng, now, days):
+    return now - timedelta(seconds=rng.uniform(0, days * 86400))
+
+
+def generate(users=DEFAULT_SIZES['users'], follows=DEFAULT_SIZES['follows'], posts=DEFAULT_SIZES['posts'],
+             likes=DEFAULT_SIZES['likes'], comments=DEFAULT_SIZES['comments'], tracks=DEFAULT_SIZES['tracks'],
+             alpha=ALPHA, days=DAYS, seed=1):
+    """Insert a synthetic dataset and commit it. Returns the number of rows written per table."""
+    from faker import Faker  # slow to import, and only needed here
+
+    rng = random.Random(seed)
+    fake = Faker()
+    fake.seed_instance(seed)
+    now = datetime.utcnow()
+    written = {}
+
+    # a catalog the posts point at, so post cards hydrate without calling Spotify
+    track_ids = []
+    existing = set(db.session.scalars(select(Track.spotify_id)))
+    track_rows = []
+    while len(track_rows) < tracks:
+        spotify_id = fake.pystr(min_chars=22, max_chars=22)
+        if spotify_id in existing:
+            continue
+        existing.add(spotify_id)
+        track_ids.append(spotify_id)
+        track_rows.append({'spotify_id': spotify_id,
+                           'name': fake.catch_phrase(),
+                           'artist_name': fake.name(),
+                           'album_name': fake.bs().title(),
+                           'image_url': f"https://i.scdn.co/image/{spotify_id}",
+                           'duration_ms': rng.randint(90000, 420000),
+                           'preview_url': None,
+                           'fetched_at': now})
+    _bulk_insert(Track, track_rows)
+    written['tracks'] = len(track_rows)
+    catalog = {row['spotify_id']: row for row in track_rows}
+
+    # users: one shared hash, since bcrypt per user would dominate the run
+    password = hasher.hash(SEED_PASSWORD)
+    first_user = _next_id(User)
+    user_ids = list(range(first_user, first_user + users))
+    user_rows = []
+    for user_id in user_ids:
+        username = f"{fake.user_name()}{user_id}"
+        user_rows.append({'id': user_id, 'username': username, 'email': f"{username}@example.com",
+                          'password': password, 'fanout_on_read': False,
+                          'follower_count': 0, 'following_count': 0, 'liked_count': 0})
+    _bulk_insert(User, user_rows)
+    written['users'] = len(user_rows)
+
+    popularity = _weights(rng, users, alpha)  # who gets followed and liked
+    activity = _weights(rng, users, alpha)    # who follows, posts, likes and comments
+
+    follow_pairs = _pairs(follows,
+                          lambda k: _draw(rng, user_ids, activity, k),
+                          lambda k: _draw(rng, user_ids, popularity, k),
+                          exclude_self=True)
+    _bulk_insert(Follower, [{'follower_id': follower, 'followed_id': followed, 'timestamp': _spread(rng, now, days)}
+                            for follower, followed in follow_pairs])
+    written['follows'] = len(follow_pairs)
+
+    # posts go to authors by activity; a post's appeal is its author's popularity times its own luck
+    first_post = _next_id(Post)
+    authors = _draw(rng, user_ids, activity, posts)
+    author_popularity = dict(zip(user_ids, (b - a for a, b in zip([0.0] + popularity, popularity))))
+    post_rows = []
+    appeal = []
+    for offset, author in enumerate(authors):
+        track = catalog[rng.choice(track_ids)]
+        post_rows.append({'id': first_post + offset, 'user_id': author,
+                          'spotify_id': track['spotify_id'], 'spotify_name': track['name'],
+                          'artist_name': track['artist_name'],
+                          'caption': fake.sentence(nb_words=8)[:200] if rng.random() < 0.6 else None,
+                          'like_count': 0, 'comment_count': 0,
+                          'timestamp': _spread(rng, now, days)})
+        appeal.append(author_popularity[author] * rng.paretovariate(alpha))
+    _bulk_insert(Post, post_rows)
+    written['posts'] = len(post_rows)
+
+    if post_rows:
+        post_ids = [row['id'] for row in post_rows]
+        post_weights = []
+        total = 0.0
+        for value in appeal:
+            total += value
+            post_weights.append(total)
+
+        like_pairs = _pairs(likes,
+                            lambda k: _draw(rng, user_ids, activity, k),
+                            lambda k: _draw(rng, post_ids, post_weights, k))
+        _bulk_insert(Like, [{'user_id': user_id, 'post_id': post_id} for user_id, post_id in like_pairs])
+        written['likes'] = len(like_pairs)
+
+        commenters = _draw(rng, user_ids, activity, comments)
+        commented = _draw(rng, post_ids, post_weights, comments)
+        _bulk_insert(Comment, [{'content': fake.sentence(nb_words=rng.randint(3, 15)), 'user_id': user_id,
+                                'post_id': post_id}
+                               for user_id, post_id in zip(commenters, commented)])
+        written['comments'] = comments
+
+    db.session.flush()
+    reconcile_counters()
+
+    # the same switch fan_out_to_followers makes when an author passes the limit
+    (User.query
+     .filter(User.id >= first_user, User.follower_count > timeline.FANOUT_LIMIT)
+     .update({User.fanout_on_read: True}, synchronize_session=False))
+
+    written['timeline'] = _fill_timelines(first_post)
+
+    if db.session.get_bind().dialect.name == 'postgresql':
+        # explicit ids leave the serial sequences behind
+        for table in ('users', 'posts'):
+            db.session.execute(text(f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                                    f"(SELECT MAX(id) FROM {table}))"))
+
+    db.session.commit()
+    logger.info("Seeded %s", written)
+    return written
+
+
+def _fill_timelines(first_post):
+    """Materialise the new posts into their authors' and followers' timelines, as fan-out on write would."""
+    new_posts = Post.id >= first_post
+
+    own = select(Post.user_id, Post.id, Post.user_id, Post.timestamp).where(new_posts)
+    followers = (select(Follower.follower_id, Post.id, Post.user_id, Post.timestamp)
+                 .join(Post, Post.user_id == Follower.followed_id)
+                 .join(User, User.id == Post.user_id)
+                 .where(new_posts,
+                        Follower.follower_id != Post.user_id,
+                        User.fanout_on_read.is_(False)))
+
+    result = db.session.execute(insert(TimelineEntry).from_select(
+        ['user_id', 'post_id', 'author_id', 'timestamp'], union_all(own, followers)))
+    return result.rowcount
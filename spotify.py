@@ -0,0 +1,531 @@
+"""Spotify Web API helpers.
+
+Access tokens come from the Client Credentials Flow and are cached by
+SpotifyTokenManager until shortly before they expire, so normal requests do not
+pay for an extra round trip to accounts.spotify.com.
+
+All Web API calls go through one SpotifyClient: a pooled keep-alive session
+with strict timeouts, bounded retries with jitter, a process-wide rate limiter
+that honours 429 Retry-After, and a circuit breaker. When Spotify is down or
+rate limiting us, calls fail fast with SpotifyUnavailable instead of tying up
+workers.
+
+Autocomplete results for the add-post search box are cached per normalised
+query, and a longer query can be answered from a shorter cached one when that
+result already held every match. Identical lookups that are in flight at the
+same time are coalesced into one request.
+"""
+
+import os
+import time
+import random
+import logging
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from cache import TTLCache, SingleFlight
+from metrics import spotify_request_seconds
+
+logger = logging.getLogger(__name__)
+
+SPOTIFY_AUTH_URL = "https://accounts.spotify.com/api/token"
+SPOTIFY_API_URL = "https://api.spotify.com/v1"
+
+TIMEOUT = (3.05, 5)  # (connect, read) seconds
+
+AUTOCOMPLETE_LIMIT = 5       # results per type shown under the search box
+AUTOCOMPLETE_MIN_LENGTH = 3  # search.js only searches from 3 characters
+
+
+class SpotifyTokenManager:
+    """Caches a Spotify access token and refreshes it before it expires.
+
+    Refreshes happen under a lock, so concurrent requests that find the token
+    expired wait for a single refresh instead of each fetching their own.
+    """
+
+    def __init__(self, client_id=None, client_secret=None, refresh_margin=60, session=None):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.refresh_margin = refresh_margin  # seconds before expiry to refresh early
+        self.session = session or requests
+
+        self._lock = threading.Lock()
+        self._token = None
+        self._expires_at = 0.0
+
+        self.refresh_count = 0
+        self.refresh_failures = 0
+        self.last_refresh_seconds = None
+        self.total_refresh_seconds = 0.0
+
+    def _is_fresh(self):
+        return self._token is not None and time.monotonic() < self._expires_at - self.refresh_margin
+
+    def get_token(self):
+        """Return a valid access token, refreshing it if needed. Returns None if Spotify refuses."""
+        if self._is_fresh():
+            return self._token
+
+        with self._lock:
+            # another thread may have refreshed while we waited for the lock
+            if not self._is_fresh():
+                self._refresh()
+            return self._token
+
+    def invalidate(self, token):
+        """Drop `token` (e.g. after a 401) so the next get_token() fetches a new one."""
+        with self._lock:
+            if self._token == token:
+                self._token = None
+                self._expires_at = 0.0
+
+    def _refresh(self):
+        """Fetch a new token from Spotify. Must be called with the lock held."""
+        data = {
+            'grant_type': 'client_credentials',  # Required parameter
+            'client_id': self.client_id or os.getenv('SPOTIFY_CLIENT_ID'),
+            'client_secret': self.client_secret or os.getenv('SPOTIFY_CLIENT_SECRET')
+        }
+        headers = {
+            'Content-Type': 'application/x-www-form-urlencoded'
+        }
+
+        started = time.monotonic()
+        try:
+            response = self.session.post(SPOTIFY_AUTH_URL, headers=headers, data=data, timeout=TIMEOUT)
+        except requests.RequestException as e:
+            response = None
+            logger.warning("Error getting Spotify token: %s", e)
+        elapsed = time.monotonic() - started
+
+        self.refresh_count += 1
+        self.last_refresh_seconds = elapsed
+        self.total_refresh_seconds += elapsed
+
+        if response is not None and response.status_code == 200:
+            token_info = response.json()
+            self._token = token_info.get('access_token')
+            self._expires_at = time.monotonic() + token_info.get('expires_in', 3600)
+            logger.info("Refreshed Spotify token in %.3fs", elapsed)
+        else:
+            if response is not None:
+                logger.warning("Error getting Spotify token: %s", response.status_code)
+            self.refresh_failures += 1
+            self._token = None
+            self._expires_at = 0.0
+
+    def stats(self):
+        """Refresh counters and latency, for monitoring."""
+        return {
+            'refresh_count': self.refresh_count,
+            'refresh_failures': self.refresh_failures,
+            'last_refresh_seconds': self.last_refresh_seconds,
+            'total_refresh_seconds': self.total_refresh_seconds,
+        }
+
+
+class SpotifyUnavailable(Exception):
+    """Raised instead of calling Spotify while it is failing or rate limiting us."""
+
+
+class RateLimiter:
+    """Process-wide token bucket that also honours Spotify's Retry-After.
+
+    Callers wait for a token; after a 429 everyone is held back until the
+    Retry-After time. If the wait would be longer than `max_wait` the call fails
+    fast instead of pinning the worker.
+    """
+
+    def __init__(self, rate=10.0, burst=20, max_wait=2.0):
+        self.rate = rate        # tokens added per second
+        self.burst = burst      # bucket size
+        self.max_wait = max_wait
+
+        self._lock = threading.Lock()
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+
+    def block_for(self, seconds):
+        """Hold all callers back for `seconds` (from a Retry-After header)."""
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+
+    def acquire(self):
+        """Wait for permission to make a request. Raises SpotifyUnavailable if that would take too long."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+
+            wait = max(self._blocked_until - now, 0.0)
+            if self._tokens < 1:
+                wait = max(wait, (1 - self._tokens) / self.rate)
+            if wait > self.max_wait:
+                raise SpotifyUnavailable(f"Spotify rate limit: retry in {wait:.1f}s")
+
+            # reserve the token now so concurrent callers queue up behind us
+            self._tokens -= 1
+
+        if wait > 0:
+            time.sleep(wait)
+
+
+class CircuitBreaker:
+    """Stops calling Spotify after repeated failures, then lets a trial call through.
+
+    closed: calls go through. open: calls fail fast for `reset_timeout`
+    seconds. half-open: one trial call decides whether to close or re-open.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+
+        self.times_opened = 0
+
+    @property
+    def state(self):
+        if self._opened_at is None:
+            return 'closed'
+        if time.monotonic() - self._opened_at < self.reset_timeout:
+            return 'open'
+        return 'half-open'
+
+    def before_call(self):
+        """Raise SpotifyUnavailable if the circuit is open."""
+        with self._lock:
+            state = self.state
+            if state == 'open' or (state == 'half-open' and self._trial_in_flight):
+                raise SpotifyUnavailable("Spotify circuit breaker is open")
+            if state == 'half-open':
+                self._trial_in_flight = True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def cancel_trial(self):
+        """Give up a half-open trial slot without a verdict (the call never reached Spotify)."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                if self._opened_at is None:
+                    self.times_opened += 1
+                self._opened_at = time.monotonic()
+
+
+def make_session(pool_size=10):
+    """A requests session that keeps connections to Spotify alive between calls."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+class SpotifyClient:
+    """Resilient client for the Spotify Web API.
+
+    Retries connection errors, timeouts, 5xx responses and short 429s up to
+    `max_retries` times with jittered exponential back-off, and refreshes the
+    token once on a 401. Failed calls count towards the circuit breaker.
+    """
+
+    RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+    def __init__(self, tokens, session=None, api_url=SPOTIFY_API_URL, timeout=TIMEOUT,
+                 max_retries=2, backoff=0.2, rate_limiter=None, breaker=None):
+        self.tokens = tokens
+        self.session = session or make_session()
+        self.api_url = api_url
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.breaker = breaker or CircuitBreaker()
+
+        self.retries = 0
+        self.rate_limited = 0
+
+    def _sleep_before_retry(self, attempt, response):
+        """Back off before another attempt, honouring Retry-After on a 429."""
+        if response is not None and response.status_code == 429:
+            self.rate_limited += 1
+            try:
+                retry_after = float(response.headers.get('Retry-After', 1))
+            except ValueError:
+                retry_after = 1.0
+            self.rate_limiter.block_for(retry_after)
+        else:
+            # full jitter so retrying workers do not hit Spotify in lockstep
+            time.sleep(random.uniform(0, self.backoff * 2 ** attempt))
+
+    def _send(self, url, headers, params, endpoint=None):
+        """One GET with retries. Returns the final response or raises the last error."""
+        for attempt in range(self.max_retries + 1):
+            self.rate_limiter.acquire()
+
+            response, error = None, None
+            started = time.perf_counter()
+            try:
+                response = self.session.get(url, headers=headers, params=params, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
+            spotify_request_seconds.observe(time.perf_counter() - started,
+                                            endpoint=endpoint or 'other',
+                                            status=response.status_code if response is not None else 'error')
+
+            if error is None and response.status_code not in self.RETRY_STATUSES:
+                return response
+            if attempt == self.max_retries:
+                break
+
+            self.retries += 1
+            self._sleep_before_retry(attempt, response)
+
+        if error is not None:
+            raise error
+        return response
+
+    def get(self, path, params=None):
+        """GET a Spotify Web API endpoint, retrying once with a new token on a 401.
+
+        Raises SpotifyUnavailable when the circuit breaker or rate limiter
+        refuses the call, when no access token can be had, or when Spotify
+        cannot be reached.
+        """
+        self.breaker.before_call()
+
+        try:
+            for attempt in range(2):
+                access_token = self.tokens.get_token()
+                if access_token is None:
+                    break  # auth is down; "Bearer None" would only earn a 401 and another token fetch
+                headers = {
+                    'Authorization': f'Bearer {access_token}'
+                }
+                response = self._send(f"{self.api_url}{path}", headers, params,
+                                      endpoint=path.strip('/').split('/')[0])
+
+                if response.status_code != 401:
+                    break
+                # token was revoked or expired early; drop it and try again with a fresh one
+                self.tokens.invalidate(access_token)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            self.breaker.record_failure()
+            raise SpotifyUnavailable(f"Spotify request failed: {e}") from e
+        except SpotifyUnavailable:
+            # refused by our own rate limiter; Spotify itself was not at fault
+            self.breaker.cancel_trial()
+            raise
+
+        if access_token is None:
+            self.breaker.record_failure()
+            raise SpotifyUnavailable("Could not get a Spotify access token")
+
+        if response.status_code >= 500:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        return response
+
+    def stats(self):
+        """Retry, rate limit and circuit breaker counters, for monitoring."""
+        return {
+            'retries': self.retries,
+            'rate_limited': self.rate_limited,
+            'circuit_state': self.breaker.state,
+            'circuit_opened': self.breaker.times_opened,
+        }
+
+
+# Shared by every request in this process
+http_session = make_session()
+token_manager = SpotifyTokenManager(session=http_session)
+client = SpotifyClient(token_manager, session=http_session)
+
+# concurrent identical lookups (a popular search, a viral post) share one upstream request
+spotify_flight = SingleFlight()
+
+# a forked worker must not reuse connections opened by its parent
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=http_session.close)
+
+
+def get_spotify_access_token():
+    """Get a cached access token using Spotify's Client Credentials Flow"""
+    return token_manager.get_token()
+
+
+def spotify_get(path, params=None):
+    """GET a Spotify Web API endpoint through the shared client."""
+    return client.get(path, params=params)
+
+
+def search_spotify_api(query, search_type='track', limit=10):
+    """Search for songs or playlists using the Spotify API."""
+    return spotify_flight.do(('search', query, search_type, limit), _search, query, search_type, limit)
+
+
+def _search(query, search_type, limit):
+    params = {
+        'q': query,
+        'type': search_type,
+        'limit': limit
+    }
+
+    try:
+        response = spotify_get('/search', params=params)
+    except SpotifyUnavailable as e:
+        logger.warning("Spotify unavailable, skipping search: %s", e)
+        return None
+
+    if response.status_code == 200:
+        return response.json()
+    else:
+        logger.warning("Error searching Spotify: %s", response.status_code)
+        return None
+
+
+def get_spotify_item(spotify_id, item_type='track'):
+    """Fetching the details of the selected song or playlist from Spotify API"""
+    return spotify_flight.do(('item', item_type, spotify_id), _get_item, spotify_id, item_type)
+
+
+def _get_item(spotify_id, item_type):
+    if item_type == 'track':
+        path = f"/tracks/{spotify_id}"
+    elif item_type == 'playlist':
+        path = f"/playlists/{spotify_id}"
+    else:
+        raise ValueError(f"Unknown Spotify item type {item_type!r}")
+
+    response = spotify_get(path)
+
+    if response.status_code == 200:
+        return response.json()
+    if response.status_code in (400, 404):
+        raise ValueError(f"No Spotify {item_type} {spotify_id!r}: {response.status_code}")
+    raise SpotifyUnavailable(f"Failed to fetch item from Spotify API: {response.status_code}")
+
+
+def get_spotify_tracks(spotify_ids):
+    """Fetch up to 50 tracks in one call. Returns a list (None for unknown IDs), or None on error."""
+    return spotify_flight.do(('tracks', tuple(spotify_ids)), _get_tracks, spotify_ids)
+
+
+def _get_tracks(spotify_ids):
+    response = spotify_get('/tracks', params={'ids': ','.join(spotify_ids)})
+
+    if response.status_code == 200:
+        return response.json().get('tracks', [])
+    else:
+        logger.warning("Error fetching Spotify tracks: %s", response.status_code)
+        return None
+
+
+# Autocomplete results keyed by normalised query
+autocomplete_cache = TTLCache(maxsize=2048, ttl=300)
+
+_autocomplete_lock = threading.Lock()
+autocomplete_counters = {'prefix_hits': 0, 'upstream_calls': 0}
+
+
+def _count(name):
+    with _autocomplete_lock:
+        autocomplete_counters[name] += 1
+
+
+def normalize_query(query):
+    """Lowercase a search query and collapse its whitespace."""
+    return ' '.join(query.lower().split())
+
+
+def _autocomplete_results(data):
+    """Reduce a Spotify search response to what the search box shows."""
+    tracks = data.get('tracks', {})
+    playlists = data.get('playlists', {})
+
+    track_items = [item for item in tracks.get('items', []) if item]
+    playlist_items = [item for item in playlists.get('items', []) if item]
+
+    # when Spotify returned every match there is, the result can answer longer queries too
+    complete = (tracks.get('total', 0) <= len(track_items) and
+                playlists.get('total', 0) <= len(playlist_items))
+
+    return {
+        'tracks': [{'id': item['id'], 'name': item['name'], 'artist': item['artists'][0]['name']} for item in track_items],
+        'playlists': [{'id': item['id'], 'name': item['name']} for item in playlist_items],
+        'complete': complete,
+    }
+
+
+def _matches(item, terms):
+    text = normalize_query(f"{item['name']} {item.get('artist', '')}")
+    return all(term in text for term in terms)
+
+
+def _from_cached_prefix(key):
+    """Answer `key` by filtering the longest complete cached result for one of its prefixes."""
+    terms = key.split()
+    tried = set()
+
+    for length in range(len(key) - 1, AUTOCOMPLETE_MIN_LENGTH - 1, -1):
+        prefix = key[:length].rstrip()
+        if prefix in tried or len(prefix) < AUTOCOMPLETE_MIN_LENGTH:
+            continue
+        tried.add(prefix)
+
+        cached = autocomplete_cache.peek(prefix)
+        if cached is not None and cached['complete']:
+            return {
+                'tracks': [item for item in cached['tracks'] if _matches(item, terms)],
+                'playlists': [item for item in cached['playlists'] if _matches(item, terms)],
+                'complete': True,
+            }
+
+    return None
+
+
+def autocomplete(query):
+    """Return {'tracks': [...], 'playlists': [...]} for the search box, or None if Spotify fails."""
+    key = normalize_query(query)
+    if not key:
+        return {'tracks': [], 'playlists': []}
+
+    results = autocomplete_cache.get(key)
+    if results is None:
+        results = _from_cached_prefix(key)
+        if results is not None:
+            _count('prefix_hits')
+        else:
+            _count('upstream_calls')
+            data = search_spotify_api(key, search_type='track,playlist', limit=AUTOCOMPLETE_LIMIT)
+            if data is None:
+                return None
+            results = _autocomplete_results(data)
+        autocomplete_cache.set(key, results)
+
+    return {'tracks': results['tracks'], 'playlists': results['playlists']}
+
+
+def autocomplete_stats():
+    """Cache hit/miss counters for autocomplete, for monitoring."""
+    with _autocomplete_lock:
+        return {**autocomplete_cache.stats(), **autocomplete_counters}
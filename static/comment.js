@@ -1,8 +1,11 @@
-document.querySelectorAll('.comment-btn').forEach(button => {
-    button.addEventListener('click', function() {
-        const postId = this.getAttribute('data-post-id');  // Access the post.id value
-        toggleCommentForm(postId);  // Pass the post.id to the function
-    });
+// Delegated so comment buttons on post cards added by infinite scroll work too
+document.addEventListener('click', function(event) {
+    const button = event.target.closest('.comment-btn');
+    if (!button) {
+        return;
+    }
+    const postId = button.getAttribute('data-post-id');  // Access the post.id value
+    toggleCommentForm(postId);  // Pass the post.id to the function
 });
 
 function toggleCommentForm(postId) {
@@ -14,3 +17,72 @@ function toggleCommentForm(postId) {
         commentForm.style.display = 'none';
     }
 }
+
+// Likes, comments and follows are posted with fetch() and the page is updated from the
+// JSON reply, instead of a redirect that re-renders the whole feed or profile. The forms
+// still carry their csrf_token field, and still work as plain posts without JavaScript.
+function postForm(form) {
+    return fetch(form.action, {
+        method: 'POST',
+        body: new FormData(form),
+        headers: { 'Accept': 'application/json' }
+    }).then(response => {
+        if (!response.ok) {
+            throw new Error(`${form.action} returned ${response.status}`);
+        }
+        return response.json();
+    });
+}
+
+function setToggle(button, on, onLabel, offLabel) {
+    button.textContent = on ? onLabel : offLabel;
+    button.classList.toggle('btn-warning', on);
+    button.classList.toggle('btn-primary', !on);
+}
+
+function updateLike(form, data) {
+    form.action = data.liked ? form.dataset.unlikeUrl : form.dataset.likeUrl;
+    setToggle(form.querySelector('button'), data.liked, 'Unlike', 'Like');
+    form.parentElement.querySelector('.like-count').textContent = data.like_count;
+}
+
+function updateFollow(form, data) {
+    form.action = data.following ? form.dataset.unfollowUrl : form.dataset.followUrl;
+    setToggle(form.querySelector('button'), data.following, 'Unfollow', 'Follow');
+    document.querySelectorAll(`.follower-count[data-user-id="${data.user_id}"]`).forEach(count => {
+        count.textContent = data.follower_count;
+    });
+}
+
+function updateComments(form, data) {
+    const card = form.closest('.card');
+    card.querySelector('.comment-count').textContent = data.comment_count;
+    form.reset();
+    toggleCommentForm(data.post_id);
+}
+
+const formHandlers = [
+    ['.like-form', updateLike],
+    ['.follow-form', updateFollow],
+    ['.comment-submit-form', updateComments]
+];
+
+document.addEventListener('submit', function(event) {
+    const form = event.target;
+    const handler = formHandlers.find(([selector]) => form.matches(selector));
+    if (!handler) {
+        return;
+    }
+    event.preventDefault();
+
+    const button = form.querySelector('button[type="submit"]');
+    button.disabled = true;  // one request per click
+    postForm(form)
+        .then(data => handler[1](form, data))
+        .catch(error => {
+            console.error('Error saving change:', error);
+        })
+        .finally(() => {
+            button.disabled = false;
+        });
+});
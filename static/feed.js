@@ -0,0 +1,52 @@
+// Infinite scroll for paged lists (feed, profile posts, liked posts, followers, following):
+// when the sentinel below the last item comes into view, fetch the page at its data-next-url
+// and append the rendered HTML to the element named by its data-container.
+(function () {
+    const sentinel = document.getElementById('scroll-sentinel');
+    const container = sentinel && document.getElementById(sentinel.dataset.container);
+
+    if (!sentinel || !container) {
+        return;  // everything fit on the first page
+    }
+
+    let loading = false;
+
+    function loadNextPage() {
+        const nextUrl = sentinel.dataset.nextUrl;
+        if (loading || !nextUrl) {
+            return;
+        }
+        loading = true;
+
+        fetch(nextUrl, { headers: { 'Accept': 'application/json' } })
+            .then(response => response.json())
+            .then(data => {
+                container.insertAdjacentHTML('beforeend', data.html);
+
+                if (data.next_url) {
+                    sentinel.dataset.nextUrl = data.next_url;
+                    // re-observe so a sentinel that is still on screen triggers another load
+                    observer.unobserve(sentinel);
+                    observer.observe(sentinel);
+                } else {
+                    observer.disconnect();
+                    sentinel.remove();  // reached the end of the list
+                }
+            })
+            .catch(error => {
+                console.error('Error loading more posts:', error);
+                sentinel.textContent = 'Could not load more posts.';
+            })
+            .finally(() => {
+                loading = false;
+            });
+    }
+
+    const observer = new IntersectionObserver(entries => {
+        if (entries.some(entry => entry.isIntersecting)) {
+            loadNextPage();
+        }
+    }, { rootMargin: '400px' });
+
+    observer.observe(sentinel);
+})();
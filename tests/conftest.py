@@ -0,0 +1,9 @@
+"""Run the suite against the testing profile (TEST_DATABASE_URL, inline jobs, cheap password hashes).
+
+Set before anything imports the app, whatever APP_CONFIG says, so the tests
+never create or drop tables in the development or production database.
+"""
+
+import os
+
+os.environ['APP_CONFIG'] = 'testing'
@@ -0,0 +1,114 @@
+import unittest
+from sqlalchemy import select
+from app import app
+from models import db, User, Post, Like, Comment, Follower, TimelineEntry, Job
+from budget import query_budget, QueryBudgetExceeded, stats
+from identity import user_cache
+import timeline
+
+class QueryBudgetTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        """Set up the app context and database."""
+        cls.app = app
+        cls.app.config['TESTING'] = True
+        cls.app_context = cls.app.app_context()
+        cls.app_context.push()
+        db.create_all()
+
+    @classmethod
+    def tearDownClass(cls):
+        """Clean up the database."""
+        db.session.remove()
+        db.drop_all()
+        cls.app_context.pop()
+
+    def setUp(self):
+        """Create a viewer following 20 authors with a post each, and raise on violations."""
+        self.app.config['QUERY_BUDGET_RAISE'] = True
+        user_cache.clear()
+        viewer = User(username="viewer", email="viewer@example.com", password="hashed")
+        authors = [User(username=f"author{n}", email=f"author{n}@example.com", password="hashed") for n in range(20)]
+        db.session.add_all([viewer] + authors)
+        db.session.commit()
+        for author in authors:
+            viewer.follow(author)
+            post = Post(user_id=author.id, spotify_id="x", spotify_name="Song")
+            db.session.add(post)
+            db.session.flush()
+            timeline.enqueue_fan_out(post)
+            viewer.like_post(post)
+            db.session.add(Comment(content="Nice", user_id=author.id, post_id=post.id))
+        db.session.commit()
+        self.viewer_id = viewer.id
+        self.post_ids = [post_id for post_id in db.session.scalars(select(Post.id))]
+        db.session.remove()
+
+    def tearDown(self):
+        """Remove any data after each test."""
+        db.session.rollback()
+        for model in (Job, TimelineEntry, Comment, Like, Post, Follower, User):
+            model.query.delete()
+        db.session.commit()
+        db.session.remove()
+
+    def load_authors_one_by_one(self):
+        # the N+1 the budget is there to catch
+        return [db.session.get(Post, post_id).author.username for post_id in self.post_ids]
+
+    def test_within_budget(self):
+        """Test that statements and database time are counted."""
+        with query_budget(statements=1) as budget:
+            db.session.execute(select(User.id)).all()
+        self.assertEqual(budget.statements, 1)
+        self.assertGreater(budget.seconds, 0)
+        self.assertFalse(budget.exceeded)
+
+    def test_violation_raises_with_repeated_statements(self):
+        """Test that an N+1 over budget raises, naming the repeated statement and the code that issued it."""
+        with self.assertRaises(QueryBudgetExceeded) as raised:
+            with query_budget(statements=5, name='authors'):
+                self.load_authors_one_by_one()
+
+        budget = raised.exception.budget
+        self.assertEqual(budget.statements, 40)
+        statement, count, stack = budget.repeated()[0]
+        self.assertEqual(count, 20)
+        self.assertIn('FROM posts', statement)
+        self.assertIn('load_authors_one_by_one', ''.join(stack))
+        self.assertIn('authors: 40 statements', str(raised.exception))
+        self.assertEqual(stats()['exceeded']['authors'], 1)
+
+    def test_violation_is_logged_when_not_raising(self):
+        """Test that in production a violation is logged as a warning and the block's result kept."""
+        self.app.config['QUERY_BUDGET_RAISE'] = False
+
+        @query_budget(statements=5)
+        def view():
+            return self.load_authors_one_by_one()
+
+        with self.assertLogs('muse.requests', level='WARNING') as logs:
+            self.assertEqual(len(view()), 20)
+        self.assertIn('"event": "query_budget_exceeded"', logs.output[0])
+        self.assertIn('test_budget.view', logs.output[0])
+
+    def test_time_budget(self):
+        """Test that the database time is budgeted too."""
+        with self.assertRaises(QueryBudgetExceeded):
+            with query_budget(seconds=0):
+                db.session.execute(select(User.id)).all()
+
+    def test_pages_stay_within_budget(self):
+        """Test that the post list pages cost the same number of statements for 20 posts as for one."""
+        client = self.app.test_client()
+        with client.session_transaction() as sess:
+            sess['_user_id'] = str(self.viewer_id)
+        for url in ('/feed', '/feed/page', f'/profile/{self.viewer_id}/likes',
+                    f'/post/{self.post_ids[0]}/comments'):
+            with self.app.app_context():
+                self.assertEqual(client.get(url).status_code, 200, url)
+                db.session.remove()
+
+if __name__ == '__main__':
+    unittest.main()
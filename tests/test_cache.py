@@ -0,0 +1,108 @@
+import threading
+import time
+import unittest
+from unittest import mock
+from cache import TTLCache, SingleFlight
+
+class TTLCacheTests(unittest.TestCase):
+
+    def test_get_and_set(self):
+        """Test that cached values are returned and counted as hits."""
+        cache = TTLCache(maxsize=10, ttl=60)
+        self.assertIsNone(cache.get('a'))
+        cache.set('a', 1)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.stats()['hits'], 1)
+        self.assertEqual(cache.stats()['misses'], 1)
+
+    def test_entries_expire(self):
+        """Test that entries are dropped once their TTL has passed."""
+        cache = TTLCache(maxsize=10, ttl=60)
+        with mock.patch('cache.time.monotonic', return_value=100.0):
+            cache.set('a', 1)
+        with mock.patch('cache.time.monotonic', return_value=159.0):
+            self.assertEqual(cache.get('a'), 1)
+        with mock.patch('cache.time.monotonic', return_value=161.0):
+            self.assertIsNone(cache.get('a'))
+        self.assertEqual(len(cache), 0)
+
+    def test_least_recently_used_is_evicted(self):
+        """Test that a full cache evicts the entry used longest ago."""
+        cache = TTLCache(maxsize=2, ttl=60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')  # 'b' is now the least recently used
+        cache.set('c', 3)
+
+        self.assertEqual(cache.peek('a'), 1)
+        self.assertIsNone(cache.peek('b'))
+        self.assertEqual(cache.peek('c'), 3)
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+class SingleFlightTests(unittest.TestCase):
+
+    def run_concurrently(self, flight, fn, callers=5):
+        """Call flight.do('key', fn) from several threads at once and collect the outcomes."""
+        outcomes = []
+        threads = [threading.Thread(target=lambda: outcomes.append(self.outcome(flight, fn)))
+                   for _ in range(callers)]
+        for thread in threads:
+            thread.start()
+        return threads, outcomes
+
+    def outcome(self, flight, fn):
+        try:
+            return flight.do('key', fn)
+        except Exception as e:
+            return e
+
+    def test_concurrent_callers_share_one_call(self):
+        """Test that callers arriving while a call is in flight get its result."""
+        flight = SingleFlight()
+        release = threading.Event()
+        calls = []
+
+        def slow():
+            calls.append(1)
+            release.wait(1)
+            return 'result'
+
+        threads, outcomes = self.run_concurrently(flight, slow)
+        while flight.stats()['collapsed'] < 4:
+            time.sleep(0.001)  # wait until every follower is queued behind the leader
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(outcomes, ['result'] * 5)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(flight.stats(), {'calls': 1, 'collapsed': 4, 'in_flight': 0})
+
+    def test_errors_are_shared(self):
+        """Test that waiting callers see the leader's exception."""
+        flight = SingleFlight()
+        release = threading.Event()
+
+        def failing():
+            release.wait(1)
+            raise RuntimeError('upstream down')
+
+        threads, outcomes = self.run_concurrently(flight, failing, callers=3)
+        while flight.stats()['collapsed'] < 2:
+            time.sleep(0.001)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(outcomes), 3)
+        self.assertTrue(all(isinstance(outcome, RuntimeError) for outcome in outcomes))
+
+    def test_sequential_calls_are_not_collapsed(self):
+        """Test that a finished call does not answer later callers."""
+        flight = SingleFlight()
+        self.assertEqual(flight.do('key', lambda: 1), 1)
+        self.assertEqual(flight.do('key', lambda: 2), 2)
+        self.assertEqual(flight.stats()['collapsed'], 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,135 @@
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+from app import app
+from budget import query_budget
+from models import db, User, Post, Track, Playlist
+import catalog
+
+def track_item(spotify_id):
+    return {'id': spotify_id,
+            'name': f"Song {spotify_id[:4]}",
+            'artists': [{'name': 'Artist'}],
+            'album': {'name': 'Album', 'images': [{'url': f"https://img/{spotify_id}"}]},
+            'duration_ms': 185000,
+            'preview_url': None}
+
+class CatalogTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        """Set up the app context and database."""
+        cls.app = app
+        cls.app.config['TESTING'] = True
+        cls.app_context = cls.app.app_context()
+        cls.app_context.push()
+        db.create_all()
+
+    @classmethod
+    def tearDownClass(cls):
+        """Clean up the database."""
+        db.session.remove()
+        db.drop_all()
+        cls.app_context.pop()
+
+    def setUp(self):
+        self.user = User(username="listener", email="listener@example.com", password="hashed")
+        db.session.add(self.user)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.rollback()
+        for model in (Track, Playlist, Post, User):
+            model.query.delete()
+        db.session.commit()
+
+    def make_posts(self, count, artist_name="Artist"):
+        posts = [Post(user_id=self.user.id, spotify_id=f"{i:022d}", spotify_name=f"Song {i}", artist_name=artist_name)
+                 for i in range(count)]
+        db.session.add_all(posts)
+        db.session.commit()
+        return posts
+
+    def test_missing_tracks_fetched_in_one_call(self):
+        """Test that a page of uncatalogued tracks costs a single upstream call."""
+        posts = self.make_posts(30)
+        with mock.patch('catalog.get_spotify_tracks',
+                        side_effect=lambda ids: [track_item(i) for i in ids]) as fetch:
+            catalog.hydrate(posts)
+
+        self.assertEqual(fetch.call_count, 1)
+        self.assertEqual(Track.query.count(), 30)
+        self.assertEqual(posts[0].catalog.duration, "3:05")
+        self.assertEqual(posts[0].catalog.image_url, f"https://img/{posts[0].spotify_id}")
+
+    def test_fresh_entries_are_not_refetched(self):
+        """Test that catalogued tracks are served locally until they go stale."""
+        posts = self.make_posts(3)
+        with mock.patch('catalog.get_spotify_tracks',
+                        side_effect=lambda ids: [track_item(i) for i in ids]) as fetch:
+            catalog.hydrate(posts)
+            catalog.hydrate(posts)
+            self.assertEqual(fetch.call_count, 1)
+
+            stale = Track.query.get(posts[0].spotify_id)
+            stale.fetched_at = datetime.utcnow() - catalog.CATALOG_MAX_AGE - timedelta(minutes=1)
+            db.session.commit()
+
+            catalog.hydrate(posts)
+            self.assertEqual(fetch.call_count, 2)
+            self.assertEqual(fetch.call_args.args[0], [posts[0].spotify_id])
+
+    def test_refreshed_entries_are_not_reloaded(self):
+        """Test that storing refreshed tracks leaves the page's posts and catalog entries loaded."""
+        posts = self.make_posts(20)
+        with mock.patch('catalog.get_spotify_tracks',
+                        side_effect=lambda ids: [track_item(i) for i in ids]):
+            catalog.hydrate(posts)
+
+        with query_budget(statements=0) as budget:
+            cards = [(post.spotify_name, post.catalog.image_url, post.catalog.fetched_at) for post in posts]
+        self.assertEqual(budget.statements, 0)
+        self.assertEqual(len(cards), 20)
+
+    def test_concurrent_refresh_of_the_same_track(self):
+        """Test that a track stored by another request in the meantime is updated, not inserted twice."""
+        posts = self.make_posts(1)
+        spotify_id = posts[0].spotify_id
+
+        def fetched_elsewhere_too(ids):
+            with db.engine.begin() as connection:
+                catalog.store(connection, Track, [{'spotify_id': spotify_id, 'name': "Old",
+                                                   'fetched_at': datetime.utcnow()}])
+            return [track_item(i) for i in ids]
+
+        with mock.patch('catalog.get_spotify_tracks', side_effect=fetched_elsewhere_too):
+            catalog.hydrate(posts)
+
+        self.assertEqual(posts[0].catalog.name, "Song 0000")
+        db.session.expire_all()
+        self.assertEqual([track.name for track in Track.query], ["Song 0000"])
+
+    def test_playlist_fetches_are_bounded(self):
+        """Test that only a limited number of playlists are fetched per page."""
+        posts = self.make_posts(4, artist_name=None)
+        item = {'name': 'Mix', 'owner': {'display_name': 'dj'}, 'images': [], 'tracks': {'total': 12}}
+        with mock.patch('catalog.get_spotify_item', return_value=item) as fetch:
+            catalog.hydrate(posts)
+
+        self.assertEqual(fetch.call_count, catalog.PLAYLIST_FETCHES_PER_PAGE)
+        self.assertEqual(sum(1 for post in posts if post.catalog), catalog.PLAYLIST_FETCHES_PER_PAGE)
+
+    def test_invalid_ids_are_skipped(self):
+        """Test that IDs that are not Spotify IDs never reach the API."""
+        post = Post(user_id=self.user.id, spotify_id="12345", spotify_name="Test", artist_name="A")
+        db.session.add(post)
+        db.session.commit()
+
+        with mock.patch('catalog.get_spotify_tracks') as fetch:
+            catalog.hydrate([post])
+
+        fetch.assert_not_called()
+        self.assertIsNone(post.catalog)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,155 @@
+import unittest
+from sqlalchemy import event
+from app import app
+from models import db, User, Post, Like, Comment, Follower, TimelineEntry, Job
+from identity import user_cache
+import timeline
+
+class ConditionalGetTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        """Set up the app context and database."""
+        cls.app = app
+        cls.app.config['TESTING'] = True
+        cls.app_context = cls.app.app_context()
+        cls.app_context.push()
+        db.create_all()
+
+    @classmethod
+    def tearDownClass(cls):
+        """Clean up the database."""
+        db.session.remove()
+        db.drop_all()
+        cls.app_context.pop()
+
+    def setUp(self):
+        """Create a viewer and an author the viewer follows, and sign the viewer in."""
+        user_cache.clear()
+        viewer = User(username="viewer", email="viewer@example.com", password="hashed")
+        author = User(username="author", email="author@example.com", password="hashed")
+        db.session.add_all([viewer, author])
+        db.session.commit()
+        viewer.follow(author)
+        post = Post(user_id=author.id, spotify_id="x", spotify_name="Song")
+        db.session.add(post)
+        db.session.commit()
+        self.viewer_id, self.author_id, self.post_id = viewer.id, author.id, post.id
+        db.session.remove()
+
+        self.client = self.app.test_client()
+        self.sign_in(self.viewer_id)
+
+    def tearDown(self):
+        """Remove any data after each test."""
+        db.session.rollback()
+        for model in (Job, TimelineEntry, Comment, Like, Post, Follower, User):
+            model.query.delete()
+        db.session.commit()
+        db.session.remove()
+
+    def sign_in(self, user_id):
+        with self.client.session_transaction() as sess:
+            sess['_user_id'] = str(user_id)
+
+    def request(self, method, url, **kwargs):
+        # a fresh app context per request, so no user or ORM state carries over between them
+        with self.app.app_context():
+            response = self.client.open(url, method=method, **kwargs)
+            db.session.remove()
+        return response
+
+    def revalidate(self, url, etag):
+        return self.request('GET', url, headers={'If-None-Match': etag})
+
+    def test_feed_not_modified(self):
+        """Test that the feed sends a strong ETag and answers a matching revalidation with 304."""
+        first = self.request('GET', '/feed')
+        self.assertEqual(first.status_code, 200)
+        etag = first.headers['ETag']
+        self.assertFalse(etag.startswith('W/'))
+        self.assertIn('private', first.headers['Cache-Control'])
+        self.assertIn('Last-Modified', first.headers)
+
+        statements = []
+        count = lambda *args: statements.append(args[2])
+        event.listen(db.engine, 'before_cursor_execute', count)
+        try:
+            second = self.revalidate('/feed', etag)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', count)
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(second.headers['ETag'], etag)
+        self.assertEqual(second.data, b'')
+        self.assertFalse([s for s in statements if 'FROM posts' in s or 'FROM timeline' in s])
+
+    def test_own_like_changes_feed(self):
+        """Test that liking a post gives the viewer's pages a new ETag."""
+        etag = self.request('GET', '/feed').headers['ETag']
+        self.request('POST', f'/post/{self.post_id}/like')
+        self.assertEqual(self.revalidate('/feed', etag).status_code, 200)
+
+    def test_new_post_changes_followers_feed(self):
+        """Test that a post copied into a follower's timeline changes the follower's feed ETag."""
+        etag = self.request('GET', '/feed').headers['ETag']
+
+        post = Post(user_id=self.author_id, spotify_id="y", spotify_name="New")
+        db.session.add(post)
+        db.session.flush()
+        timeline.enqueue_fan_out(post)
+        db.session.commit()
+        db.session.remove()
+
+        self.assertEqual(self.revalidate('/feed', etag).status_code, 200)
+
+    def test_profile_changes_when_others_act(self):
+        """Test that a like on the owner's post by someone else changes the owner's profile for viewers."""
+        url = f'/profile/{self.author_id}'
+        etag = self.request('GET', url).headers['ETag']
+        self.assertEqual(self.revalidate(url, etag).status_code, 304)
+
+        other = User(username="other", email="other@example.com", password="hashed")
+        db.session.add(other)
+        db.session.commit()
+        other.like_post(db.session.get(Post, self.post_id))
+        db.session.commit()
+        db.session.remove()
+
+        self.assertEqual(self.revalidate(url, etag).status_code, 200)
+
+    def test_liked_posts_page(self):
+        """Test that the liked posts page revalidates until its owner likes something."""
+        url = f'/profile/{self.viewer_id}/likes'
+        etag = self.request('GET', url).headers['ETag']
+        self.assertEqual(self.revalidate(url, etag).status_code, 304)
+        self.request('POST', f'/post/{self.post_id}/like')
+        self.assertEqual(self.revalidate(url, etag).status_code, 200)
+
+    def test_pages_differ_per_viewer(self):
+        """Test that another viewer's copy of the same profile does not validate."""
+        url = f'/profile/{self.author_id}'
+        etag = self.request('GET', url).headers['ETag']
+        self.sign_in(self.author_id)
+        self.assertEqual(self.revalidate(url, etag).status_code, 200)
+
+    def test_flashed_page_not_cached(self):
+        """Test that a page showing a flashed message gets no validators, and the next one does again."""
+        self.request('POST', f'/follow/{self.author_id}')  # flashes "already following"
+        response = self.request('GET', '/feed')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('already following', response.get_data(as_text=True))
+        self.assertNotIn('ETag', response.headers)
+        self.assertEqual(response.headers['Cache-Control'], 'no-store')
+
+        # showing the message consumed it
+        response = self.request('GET', '/feed')
+        self.assertNotIn('already following', response.get_data(as_text=True))
+        etag = response.headers['ETag']
+        self.assertEqual(self.revalidate('/feed', etag).status_code, 304)
+
+    def test_unknown_profile(self):
+        """Test that a missing profile is still a 404."""
+        self.assertEqual(self.request('GET', '/profile/999999').status_code, 404)
+
+if __name__ == '__main__':
+    unittest.main()
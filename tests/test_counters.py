@@ -0,0 +1,87 @@
+import unittest
+from app import app
+from models import db, User, Post, Like, Comment, Follower, increment, reconcile_counters
+
+class CounterTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        """Set up the app context and database."""
+        cls.app = app
+        cls.app.config['TESTING'] = True
+        cls.app_context = cls.app.app_context()
+        cls.app_context.push()
+        db.create_all()
+
+    @classmethod
+    def tearDownClass(cls):
+        """Clean up the database."""
+        db.session.remove()
+        db.drop_all()
+        cls.app_context.pop()
+
+    def setUp(self):
+        """Create two users and a post."""
+        self.user1 = User(username="counter1", email="counter1@example.com", password="hashed")
+        self.user2 = User(username="counter2", email="counter2@example.com", password="hashed")
+        db.session.add_all([self.user1, self.user2])
+        db.session.commit()
+        self.post = Post(user_id=self.user2.id, spotify_id="12345", spotify_name="Test Song")
+        db.session.add(self.post)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.rollback()
+        for model in (Comment, Like, Post, Follower, User):
+            model.query.delete()
+        db.session.commit()
+
+    def test_follow_counters(self):
+        """Test that following and unfollowing keep both users' counters in step."""
+        self.user1.follow(self.user2)
+        db.session.commit()
+        self.assertEqual(self.user1.following_count, 1)
+        self.assertEqual(self.user2.follower_count, 1)
+
+        self.user1.unfollow(self.user2)
+        db.session.commit()
+        self.assertEqual(self.user1.following_count, 0)
+        self.assertEqual(self.user2.follower_count, 0)
+
+    def test_like_counters(self):
+        """Test that liking and unliking update the post's and the liker's counters."""
+        self.user1.like_post(self.post)
+        self.user1.like_post(self.post)  # liking twice does nothing
+        db.session.commit()
+        self.assertEqual(self.post.like_count, 1)
+        self.assertEqual(self.user1.liked_count, 1)
+
+        self.user1.unlike_post(self.post)
+        self.user1.unlike_post(self.post)
+        db.session.commit()
+        self.assertEqual(self.post.like_count, 0)
+        self.assertEqual(self.user1.liked_count, 0)
+
+    def test_reconcile_fixes_drift(self):
+        """Test that reconciliation recomputes counters that drifted from the rows."""
+        db.session.add(Like(user_id=self.user1.id, post_id=self.post.id))
+        db.session.add(Comment(content="hi", user_id=self.user1.id, post_id=self.post.id))
+        db.session.add(Follower(follower_id=self.user1.id, followed_id=self.user2.id))
+        increment(User.liked_count, self.user2.id, 5)
+        db.session.commit()
+
+        drift = reconcile_counters()
+        db.session.commit()
+
+        self.assertEqual(drift['posts.like_count'], 1)
+        self.assertEqual(drift['users.liked_count'], 2)
+        self.assertEqual(self.post.like_count, 1)
+        self.assertEqual(self.post.comment_count, 1)
+        self.assertEqual(self.user1.following_count, 1)
+        self.assertEqual(self.user2.follower_count, 1)
+        self.assertEqual(self.user2.liked_count, 0)
+
+        self.assertEqual(sum(reconcile_counters().values()), 0)
+
+if __name__ == '__main__':
+    unittest.main()
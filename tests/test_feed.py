@@ -0,0 +1,136 @@
+import unittest
+from sqlalchemy import event
+from app import app
+from models import db, User, Post, Like, Comment, Follower, TimelineEntry, increment
+from feed import get_feed_page, decode_cursor
+import timeline
+
+class FeedTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        """Set up the app context and database."""
+        cls.app = app
+        cls.app.config['TESTING'] = True
+        cls.app_context = cls.app.app_context()
+        cls.app_context.push()
+        db.create_all()
+
+    @classmethod
+    def tearDownClass(cls):
+        """Clean up the database."""
+        db.session.remove()
+        db.drop_all()
+        cls.app_context.pop()
+
+    def setUp(self):
+        """Create a viewer who follows one other user."""
+        self.viewer = User(username="viewer", email="viewer@example.com", password="hashed")
+        self.other = User(username="other", email="other@example.com", password="hashed")
+        db.session.add_all([self.viewer, self.other])
+        db.session.commit()
+        db.session.add(Follower(follower_id=self.viewer.id, followed_id=self.other.id))
+        db.session.commit()
+
+    def tearDown(self):
+        """Remove any data after each test."""
+        db.session.rollback()
+        for model in (TimelineEntry, Comment, Like, Post, Follower, User):
+            model.query.delete()
+        db.session.commit()
+
+    def add_posts(self, count):
+        """Add `count` posts by the followed user, each with a like and a comment from the viewer."""
+        for i in range(count):
+            post = Post(user_id=self.other.id, spotify_id=f"id{i}", spotify_name=f"Song {i}")
+            db.session.add(post)
+            db.session.flush()
+            timeline.enqueue_fan_out(post)
+            self.viewer.like_post(post)
+            db.session.add(Comment(content="nice", user_id=self.viewer.id, post_id=post.id))
+            increment(Post.comment_count, post.id)
+        db.session.commit()
+
+    def count_feed_queries(self, limit=100):
+        """Load the viewer's feed and return (posts, number of SQL statements issued)."""
+        statements = []
+
+        def count(*args):
+            statements.append(args[2])
+
+        event.listen(db.engine, 'before_cursor_execute', count)
+        try:
+            posts, _ = get_feed_page(self.viewer, limit=limit)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', count)
+        return posts, len(statements)
+
+    def test_feed_post_fields(self):
+        """Test that feed posts carry author and engagement data."""
+        self.add_posts(1)
+        own = Post(user_id=self.viewer.id, spotify_id="mine", spotify_name="My Song")
+        db.session.add(own)
+        db.session.flush()
+        timeline.enqueue_fan_out(own)
+        db.session.commit()
+
+        posts, _ = self.count_feed_queries()
+        self.assertEqual(len(posts), 2)
+
+        by_id = {post.spotify_id: post for post in posts}
+        self.assertEqual(by_id["id0"].author_username, "other")
+        self.assertEqual(by_id["id0"].like_count, 1)
+        self.assertEqual(by_id["id0"].comment_count, 1)
+        self.assertTrue(by_id["id0"].liked_by_me)
+        self.assertEqual(by_id["mine"].like_count, 0)
+        self.assertFalse(by_id["mine"].liked_by_me)
+
+    def test_feed_excludes_unfollowed_users(self):
+        """Test that posts from users the viewer does not follow are left out."""
+        stranger = User(username="stranger", email="stranger@example.com", password="hashed")
+        db.session.add(stranger)
+        db.session.commit()
+        post = Post(user_id=stranger.id, spotify_id="x", spotify_name="Hidden")
+        db.session.add(post)
+        db.session.flush()
+        timeline.enqueue_fan_out(post)
+        db.session.commit()
+
+        posts, _ = self.count_feed_queries()
+        self.assertEqual(posts, [])
+
+    def test_feed_query_count_is_constant(self):
+        """Test that the number of queries does not grow with the number of posts."""
+        self.add_posts(2)
+        posts, small_count = self.count_feed_queries()
+        self.assertEqual(len(posts), 2)
+
+        self.add_posts(20)
+        posts, large_count = self.count_feed_queries()
+        self.assertEqual(len(posts), 22)
+
+        self.assertEqual(small_count, large_count)
+
+    def test_feed_pages_follow_cursor(self):
+        """Test that walking the cursor visits every post exactly once, newest first."""
+        self.add_posts(7)
+
+        seen = []
+        posts, cursor = get_feed_page(self.viewer, limit=3)
+        seen.extend(posts)
+        while cursor:
+            posts, cursor = get_feed_page(self.viewer, cursor=cursor, limit=3)
+            seen.extend(posts)
+
+        self.assertEqual(len(seen), 7)
+        self.assertEqual(len({post.id for post in seen}), 7)
+        keys = [(post.timestamp, post.id) for post in seen]
+        self.assertEqual(keys, sorted(keys, reverse=True))
+
+    def test_invalid_cursor(self):
+        """Test that a malformed cursor is rejected."""
+        with self.assertRaises(ValueError):
+            decode_cursor("not-a-cursor")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+import unittest
+from app import app
+from models import db, User, Post, Like, Comment, Follower, TimelineEntry, Job
+from fragments import card_cache
+from identity import user_cache
+
+class PostCardCacheTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        """Set up the app context and database."""
+        cls.app = app
+        cls.app.config['TESTING'] = True
+        cls.app_context = cls.app.app_context()
+        cls.app_context.push()
+        db.create_all()
+
+    @classmethod
+    def tearDownClass(cls):
+        """Clean up the database."""
+        db.session.remove()
+        db.drop_all()
+        cls.app_context.pop()
+
+    def setUp(self):
+        """Create an author with one post and a follower who has liked it."""
+        user_cache.clear()
+        card_cache.clear()
+        author = User(username="author", email="author@example.com", password="hashed")
+        fan = User(username="fan", email="fan@example.com", password="hashed")
+        db.session.add_all([author, fan])
+        db.session.commit()
+        fan.follow(author)
+        post = Post(user_id=author.id, spotify_id="x", spotify_name="Song", caption="<slot:like_form> & more")
+        db.session.add(post)
+        db.session.commit()
+        fan.like_post(post)
+        db.session.commit()
+        self.author_id, self.fan_id, self.post_id = author.id, fan.id, post.id
+        db.session.remove()
+
+        self.client = self.app.test_client()
+        self.profile = f'/profile/{self.author_id}'
+
+    def tearDown(self):
+        """Remove any data after each test."""
+        db.session.rollback()
+        for model in (Job, TimelineEntry, Comment, Like, Post, Follower, User):
+            model.query.delete()
+        db.session.commit()
+        db.session.remove()
+
+    def page(self, user_id, url):
+        # a fresh app context per request, so no user or ORM state carries over between them
+        with self.client.session_transaction() as sess:
+            sess['_user_id'] = str(user_id)
+        with self.app.app_context():
+            response = self.client.get(url)
+            db.session.remove()
+        self.assertEqual(response.status_code, 200)
+        return response.get_data(as_text=True)
+
+    def test_viewer_parts_are_rendered_per_viewer(self):
+        """Test that viewers share the cached card but get their own like and delete buttons."""
+        before = card_cache.stats()
+        as_author = self.page(self.author_id, self.profile)
+        as_fan = self.page(self.fan_id, self.profile)
+
+        after = card_cache.stats()
+        self.assertEqual(after['misses'] - before['misses'], 1)
+        self.assertEqual(after['hits'] - before['hits'], 1)
+        self.assertIn('Delete</button>', as_author)
+        self.assertNotIn('Delete</button>', as_fan)
+        self.assertIn('>Like</button>', as_author)
+        self.assertIn('>Unlike</button>', as_fan)
+        self.assertIn('Song', as_fan)
+
+    def test_user_content_is_not_a_slot(self):
+        """Test that a caption that looks like a slot marker is shown escaped, not filled in."""
+        html = self.page(self.author_id, self.profile)
+        self.assertIn('&lt;slot:like_form&gt; &amp; more', html)
+        self.assertEqual(html.count('class="like-form"'), 1)
+
+    def test_like_and_comment_refresh_the_card(self):
+        """Test that likes and comments drop the cached card and the new counts are shown."""
+        self.page(self.author_id, self.profile)
+        self.assertIsNotNone(card_cache.peek(self.post_id))
+
+        with self.client.session_transaction() as sess:
+            sess['_user_id'] = str(self.author_id)
+        with self.app.app_context():
+            self.client.post(f'/post/{self.post_id}/like')
+            db.session.remove()
+        self.assertIsNone(card_cache.peek(self.post_id))
+        self.assertIn('<span class="like-count">2</span>', self.page(self.author_id, self.profile))
+
+        with self.app.app_context():
+            self.client.post(f'/post/{self.post_id}/comment', data={'content': 'Nice'})
+            db.session.remove()
+        self.assertIsNone(card_cache.peek(self.post_id))
+        self.assertIn('<span class="comment-count">1</span>', self.page(self.author_id, self.profile))
+
+    def test_changed_counts_are_not_served_from_cache(self):
+        """Test that a card cached before a change made elsewhere is re-rendered."""
+        self.page(self.author_id, self.profile)
+
+        # a like recorded by another process, which cannot drop this process's copy
+        other = User(username="other", email="other@example.com", password="hashed")
+        db.session.add(other)
+        db.session.commit()
+        other.like_post(db.session.get(Post, self.post_id))
+        db.session.commit()
+        db.session.remove()
+
+        self.assertIsNotNone(card_cache.peek(self.post_id))
+        self.assertIn('<span class="like-count">2</span>', self.page(self.author_id, self.profile))
+
+    def test_deleted_post_is_dropped(self):
+        """Test that deleting a post removes its cached card."""
+        self.page(self.author_id, self.profile)
+        with self.client.session_transaction() as sess:
+            sess['_user_id'] = str(self.author_id)
+        with self.app.app_context():
+            self.client.post(f'/delete_post/{self.post_id}')
+            db.session.remove()
+        self.assertIsNone(card_cache.peek(self.post_id))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+import unittest
+from sqlalchemy import event
+from app import app
+from models import db, User, Follower, increment
+from identity import load_identity, user_cache
+
+class IdentityTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        """Set up the app context and database."""
+        cls.app = app
+        cls.app.config['TESTING'] = True
+        cls.app_context = cls.app.app_context()
+        cls.app_context.push()
+        db.create_all()
+
+    @classmethod
+    def tearDownClass(cls):
+        """Clean up the database."""
+        db.session.remove()
+        db.drop_all()
+        cls.app_context.pop()
+
+    def setUp(self):
+        """Create a user who follows one other user."""
+        user_cache.clear()
+        self.viewer = User(username="viewer", email="viewer@example.com", password="hashed")
+        self.other = User(username="other", email="other@example.com", password="hashed")
+        self.third = User(username="third", email="third@example.com", password="hashed")
+        db.session.add_all([self.viewer, self.other, self.third])
+        db.session.commit()
+        db.session.add(Follower(follower_id=self.viewer.id, followed_id=self.other.id))
+        db.session.commit()
+        self.viewer_id, self.other_id, self.third_id = self.viewer.id, self.other.id, self.third.id
+
+    def tearDown(self):
+        """Remove any data after each test."""
+        db.session.rollback()
+        for model in (Follower, User):
+            model.query.delete()
+        db.session.commit()
+        db.session.remove()
+        user_cache.clear()
+
+    def record_statements(self):
+        statements = []
+
+        def record(*args):
+            statements.append(args[2])
+
+        event.listen(db.engine, 'before_cursor_execute', record)
+        self.addCleanup(event.remove, db.engine, 'before_cursor_execute', record)
+        return statements
+
+    def test_cached_user_needs_no_queries(self):
+        """Test that a second load of the same user is served from the cache."""
+        load_identity(self.viewer_id)
+        db.session.remove()
+
+        statements = self.record_statements()
+        user = load_identity(self.viewer_id)
+        self.assertEqual(user.username, "viewer")
+        self.assertEqual(statements, [])
+
+    def test_counters_are_read_fresh(self):
+        """Test that counters on a cached user come from the database, not the cache."""
+        load_identity(self.viewer_id)
+        db.session.remove()
+        increment(User.follower_count, self.viewer_id, 5)
+        db.session.commit()
+        db.session.remove()
+
+        user = load_identity(self.viewer_id)
+        self.assertEqual(user.follower_count, 5)
+
+    def test_identity_does_not_load_follows(self):
+        """Test that loading a user does not read their follows, and a cached user sees new ones."""
+        statements = self.record_statements()
+        user = load_identity(self.viewer_id)
+        self.assertEqual(len([s for s in statements if "FROM followers" in s]), 0)
+
+        third = db.session.get(User, self.third_id)
+        self.assertFalse(user.is_following(third))
+        user.follow(third)
+        db.session.commit()
+        db.session.remove()
+
+        self.assertTrue(load_identity(self.viewer_id).is_following(db.session.get(User, self.third_id)))
+
+    def test_unknown_user(self):
+        """Test that a missing user loads as None and is not cached."""
+        self.assertIsNone(load_identity(999999))
+        self.assertEqual(len(user_cache), 0)
+
+    def test_request_loads_user_once(self):
+        """Test that an authenticated request loads the user at most once, and not at all when cached."""
+        with self.app.test_client() as client:
+            with client.session_transaction() as sess:
+                sess['_user_id'] = str(self.viewer_id)
+
+            def user_lookups():
+                return len([s for s in statements if "WHERE users.id = ?" in s])
+
+            # requests share this test's app context, so start each one with an empty session
+            db.session.remove()
+
+            statements = self.record_statements()
+            client.get(f'/profile/{self.other_id}/followers')
+            self.assertEqual(user_lookups(), 2)  # the viewer, then the profile owner
+
+            del statements[:]
+            db.session.remove()
+            client.get(f'/profile/{self.other_id}/followers')
+            self.assertEqual(user_lookups(), 1)  # the viewer came from the cache
+
+            client.post(f'/follow/{self.third_id}')
+            self.assertTrue(Follower.query.filter_by(follower_id=self.viewer_id,
+                                                     followed_id=self.third_id).count())
+
+            # follow state is read from the database, so the next request sees it
+            db.session.remove()
+            resp = client.get(f'/profile/{self.third_id}')
+            self.assertIn(b'Unfollow', resp.data)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+import re
+import unittest
+from app import app
+from models import db, User, Post, Like, Comment, Follower, TimelineEntry
+from identity import user_cache
+
+JSON = {'Accept': 'application/json'}
+
+class InteractionTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        """Set up the app context and database."""
+        cls.app = app
+        cls.app.config['TESTING'] = True
+        cls.app_context = cls.app.app_context()
+        cls.app_context.push()
+        db.create_all()
+
+    @classmethod
+    def tearDownClass(cls):
+        """Clean up the database."""
+        db.session.remove()
+        db.drop_all()
+        cls.app_context.pop()
+
+    def setUp(self):
+        """Log a user in with a test client and give them a post to interact with."""
+        user_cache.clear()
+        viewer = User(username="viewer", email="viewer@example.com", password="hashed")
+        author = User(username="author", email="author@example.com", password="hashed")
+        db.session.add_all([viewer, author])
+        db.session.commit()
+        post = Post(user_id=author.id, spotify_id="12345", spotify_name="Test Song")
+        db.session.add(post)
+        db.session.commit()
+        self.viewer_id, self.author_id, self.post_id = viewer.id, author.id, post.id
+        db.session.remove()
+
+        self.client = self.app.test_client()
+        with self.client.session_transaction() as sess:
+            sess['_user_id'] = str(self.viewer_id)
+
+    def tearDown(self):
+        """Remove any data after each test."""
+        self.app.config['WTF_CSRF_ENABLED'] = False
+        db.session.rollback()
+        for model in (TimelineEntry, Comment, Like, Post, Follower, User):
+            model.query.delete()
+        db.session.commit()
+        db.session.remove()
+        user_cache.clear()
+
+    def post_json(self, url, **data):
+        # requests share this test's app context, so start each one with an empty session
+        db.session.remove()
+        return self.client.post(url, data=data, headers=JSON)
+
+    def test_like_and_unlike(self):
+        """Test that like/unlike return the new state and count instead of a redirect."""
+        resp = self.post_json(f'/post/{self.post_id}/like')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.get_json(), {'post_id': self.post_id, 'liked': True, 'like_count': 1})
+
+        resp = self.post_json(f'/post/{self.post_id}/like')  # liking twice changes nothing
+        self.assertEqual(resp.get_json()['like_count'], 1)
+
+        resp = self.post_json(f'/post/{self.post_id}/unlike')
+        self.assertEqual(resp.get_json(), {'post_id': self.post_id, 'liked': False, 'like_count': 0})
+
+    def test_comment(self):
+        """Test that a comment returns the comment and the new count."""
+        resp = self.post_json(f'/post/{self.post_id}/comment', content="great song")
+        self.assertEqual(resp.status_code, 200)
+        data = resp.get_json()
+        self.assertEqual(data['comment_count'], 1)
+        self.assertEqual(data['comment']['content'], "great song")
+        self.assertEqual(data['comment']['username'], "viewer")
+
+        resp = self.post_json(f'/post/{self.post_id}/comment', content="")
+        self.assertEqual(resp.status_code, 400)
+        self.assertIn('content', resp.get_json()['errors'])
+
+    def test_follow_and_unfollow(self):
+        """Test that follow/unfollow return the new state and follower count."""
+        resp = self.post_json(f'/follow/{self.author_id}')
+        self.assertEqual(resp.get_json(), {'user_id': self.author_id, 'following': True, 'follower_count': 1})
+
+        resp = self.post_json(f'/unfollow/{self.author_id}')
+        self.assertEqual(resp.get_json(), {'user_id': self.author_id, 'following': False, 'follower_count': 0})
+
+    def test_form_posts_still_redirect(self):
+        """Test that a normal form post (no JSON requested) still redirects."""
+        db.session.remove()
+        resp = self.client.post(f'/post/{self.post_id}/like', headers={'Accept': 'text/html'})
+        self.assertEqual(resp.status_code, 302)
+
+    def test_csrf_required(self):
+        """Test that the JSON endpoints are protected by the same CSRF token as the forms."""
+        self.app.config['WTF_CSRF_ENABLED'] = True
+
+        resp = self.post_json(f'/post/{self.post_id}/like')
+        self.assertEqual(resp.status_code, 400)
+
+        db.session.remove()
+        page = self.client.get(f'/profile/{self.author_id}').get_data(as_text=True)
+        token = re.search(r'name="csrf_token"[^>]*value="([^"]+)"', page).group(1)
+
+        resp = self.post_json(f'/post/{self.post_id}/like', csrf_token=token)
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp.get_json()['liked'])
+
+if __name__ == '__main__':
+    unittest.main()
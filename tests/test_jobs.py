@@ -0,0 +1,175 @@
+import unittest
+from datetime import datetime, timedelta
+from app import app
+from models import db, User, Post, Follower, TimelineEntry, Job
+import jobs
+import timeline
+
+calls = []
+
+@jobs.handler('test_record')
+def record(value):
+    calls.append(value)
+
+@jobs.handler('test_fail')
+def fail(value):
+    db.session.add(User(username=value, email=f"{value}@example.com", password="hashed"))
+    db.session.flush()
+    raise RuntimeError("boom")
+
+class JobTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        """Set up the app context and database."""
+        cls.app = app
+        cls.app.config['TESTING'] = True
+        cls.app_context = cls.app.app_context()
+        cls.app_context.push()
+        db.create_all()
+
+    @classmethod
+    def tearDownClass(cls):
+        """Clean up the database."""
+        db.session.remove()
+        db.drop_all()
+        cls.app_context.pop()
+
+    def setUp(self):
+        """Queue jobs for a worker; the testing profile runs them inline."""
+        del calls[:]
+        self.app.config['JOBS_INLINE'] = False
+
+    def tearDown(self):
+        """Remove any data after each test."""
+        self.app.config['JOBS_INLINE'] = True
+        db.session.rollback()
+        for model in (Job, TimelineEntry, Post, Follower, User):
+            model.query.delete()
+        db.session.commit()
+
+    def test_enqueue_and_run(self):
+        """Test that a queued job is run once by a worker and marked done."""
+        jobs.enqueue('test_record', value=1)
+        db.session.commit()
+        self.assertEqual(calls, [])
+
+        self.assertEqual(jobs.work_once('test-worker'), 1)
+        self.assertEqual(calls, [1])
+        job = Job.query.one()
+        self.assertEqual(job.status, jobs.DONE)
+        self.assertEqual(job.attempts, 1)
+        self.assertEqual(jobs.work_once('test-worker'), 0)
+
+    def test_idempotency_key(self):
+        """Test that enqueueing the same key twice creates one job."""
+        self.assertTrue(jobs.enqueue('test_record', key="once", value=1))
+        self.assertFalse(jobs.enqueue('test_record', key="once", value=2))
+        db.session.commit()
+        self.assertEqual(Job.query.count(), 1)
+
+    def test_claimed_job_is_not_claimed_again(self):
+        """Test that a running job is not handed to a second worker."""
+        jobs.enqueue('test_record', value=1)
+        db.session.commit()
+        self.assertEqual(len(jobs.claim('worker-1')), 1)
+        self.assertEqual(jobs.claim('worker-2'), [])
+
+    def test_delayed_job_waits(self):
+        """Test that a job is not run before its run_at time."""
+        jobs.enqueue('test_record', delay=60, value=1)
+        db.session.commit()
+        self.assertEqual(jobs.work_once('test-worker'), 0)
+
+    def test_failure_is_retried_then_dead(self):
+        """Test that a failing job backs off, keeps none of its writes and ends up dead."""
+        jobs.enqueue('test_fail', max_attempts=2, value="ghost")
+        db.session.commit()
+
+        jobs.work_once('test-worker')
+        job = Job.query.one()
+        self.assertEqual(job.status, jobs.QUEUED)
+        self.assertGreater(job.run_at, datetime.utcnow())
+        self.assertIn("boom", job.last_error)
+        self.assertEqual(User.query.filter_by(username="ghost").count(), 0)
+
+        job.run_at = datetime.utcnow()
+        db.session.commit()
+        jobs.work_once('test-worker')
+        job = Job.query.one()
+        self.assertEqual(job.status, jobs.DEAD)
+        self.assertEqual(job.attempts, 2)
+
+        self.assertEqual(jobs.retry_dead(), 1)
+        job = Job.query.one()
+        self.assertEqual((job.status, job.attempts), (jobs.QUEUED, 0))
+
+    def test_stale_running_job_is_requeued(self):
+        """Test that a job left running by a dead worker goes back to the queue."""
+        jobs.enqueue('test_record', value=1)
+        db.session.commit()
+        jobs.claim('dead-worker')
+        Job.query.update({Job.started_at: datetime.utcnow() - timedelta(hours=1)})
+        db.session.commit()
+
+        self.assertEqual(jobs.requeue_stale(), 1)
+        self.assertEqual(jobs.work_once('test-worker'), 1)
+        self.assertEqual(calls, [1])
+
+    def test_queue_stats(self):
+        """Test that stats report depth by status and latency of finished jobs."""
+        jobs.enqueue('test_record', value=1)
+        jobs.enqueue('test_record', value=2)
+        db.session.commit()
+        jobs.work_once('test-worker', batch=1)
+
+        stats = jobs.queue_stats()
+        self.assertEqual(stats['depth'][jobs.QUEUED], 1)
+        self.assertEqual(stats['depth'][jobs.DONE], 1)
+        self.assertIsNotNone(stats['run_p50'])
+
+    def test_inline_mode(self):
+        """Test that JOBS_INLINE runs the handler immediately without a queue row."""
+        self.app.config['JOBS_INLINE'] = True
+        jobs.enqueue('test_record', value=1)
+        self.assertEqual(calls, [1])
+        self.assertEqual(Job.query.count(), 0)
+
+    def test_inline_failure_keeps_the_callers_writes(self):
+        """Test that an inline job that fails is rolled back and logged without undoing the caller's writes."""
+        self.app.config['JOBS_INLINE'] = True
+        db.session.add(User(username="caller", email="caller@example.com", password="hashed"))
+        db.session.flush()
+        with self.assertLogs('jobs', level='WARNING') as logs:
+            self.assertTrue(jobs.enqueue('test_fail', value="handler"))
+        db.session.commit()
+
+        self.assertEqual([user.username for user in User.query], ["caller"])
+        self.assertIn('RuntimeError: boom', logs.output[0])
+
+    def test_post_fans_out_in_background(self):
+        """Test that a new post reaches followers once the fan-out job has run, and a rerun is harmless."""
+        author = User(username="author", email="author@example.com", password="hashed")
+        reader = User(username="reader", email="reader@example.com", password="hashed")
+        db.session.add_all([author, reader])
+        db.session.commit()
+        reader.follow(author)
+        db.session.commit()
+
+        post = Post(user_id=author.id, spotify_id="x", spotify_name="Fresh")
+        db.session.add(post)
+        db.session.flush()
+        timeline.enqueue_fan_out(post)
+        db.session.commit()
+        self.assertEqual(TimelineEntry.query.filter_by(user_id=reader.id).count(), 0)
+        self.assertEqual(TimelineEntry.query.filter_by(user_id=author.id).count(), 1)
+
+        jobs.work_once('test-worker')
+        self.assertEqual(TimelineEntry.query.filter_by(user_id=reader.id).count(), 1)
+
+        timeline.fan_out_post_job(post.id)  # e.g. a worker died after committing
+        db.session.commit()
+        self.assertEqual(TimelineEntry.query.filter_by(user_id=reader.id).count(), 1)
+
+if __name__ == '__main__':
+    unittest.main()
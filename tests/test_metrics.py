@@ -0,0 +1,129 @@
+import json
+import logging
+import unittest
+from app import app
+from models import db, User
+import metrics
+from metrics import Counter, Histogram, Registry
+
+class RegistryTests(unittest.TestCase):
+
+    def test_render_counter_and_histogram(self):
+        """Test that counters and histograms render in Prometheus text format."""
+        registry = Registry()
+        hits = registry.register(Counter('hits_total', 'Hits.', ('page',)))
+        latency = registry.register(Histogram('latency_seconds', 'Latency.', buckets=(0.1, 1.0)))
+        hits.inc(page="home")
+        hits.inc(2, page="home")
+        latency.observe(0.05)
+        latency.observe(0.5)
+
+        text = registry.render()
+        self.assertIn('# TYPE muse_hits_total counter', text)
+        self.assertIn('muse_hits_total{page="home"} 3', text)
+        self.assertIn('muse_latency_seconds_bucket{le="0.1"} 1', text)
+        self.assertIn('muse_latency_seconds_bucket{le="1.0"} 2', text)
+        self.assertIn('muse_latency_seconds_bucket{le="+Inf"} 2', text)
+        self.assertIn('muse_latency_seconds_count 2', text)
+
+    def test_collector(self):
+        """Test that a component's stats() are published as gauges, and a failing one is skipped."""
+        registry = Registry()
+        registry.collector('cache', lambda: {'hits': 4, 'state': 'open', 'depth': {'queued': 2}, 'p50': None})
+        registry.collector('broken', lambda: 1 / 0)
+
+        text = registry.render()
+        self.assertIn('muse_cache_hits 4', text)
+        self.assertIn('muse_cache_state{value="open"} 1', text)
+        self.assertIn('muse_cache_depth{key="queued"} 2', text)
+        self.assertNotIn('p50', text)
+        self.assertNotIn('broken', text)
+
+class RequestMetricsTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        """Set up the app context and database."""
+        cls.app = app
+        cls.app.config['TESTING'] = True
+        cls.app_context = cls.app.app_context()
+        cls.app_context.push()
+        db.create_all()
+
+    @classmethod
+    def tearDownClass(cls):
+        """Clean up the database."""
+        db.session.remove()
+        db.drop_all()
+        cls.app_context.pop()
+
+    def setUp(self):
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        metrics.SLOW_REQUEST_SECONDS = self.app.config['SLOW_REQUEST_MS'] / 1000
+        db.session.remove()
+        User.query.delete()
+        db.session.commit()
+
+    def samples(self, text, name):
+        return [line for line in text.splitlines() if line.startswith(name)]
+
+    def test_request_recorded(self):
+        """Test that a request's latency and SQL statement count end up at /metrics."""
+        user = User(username="metrics", email="metrics@example.com", password="hashed")
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+        db.session.remove()
+
+        with self.client.session_transaction() as sess:
+            sess['_user_id'] = str(user_id)
+        # a fresh app context, so no anonymous user is left in g by an earlier test's request
+        with self.app.app_context():
+            self.assertEqual(self.client.get(f'/profile/{user_id}/summary').status_code, 200)
+        text = self.client.get('/metrics').get_data(as_text=True)
+
+        self.assertTrue(self.samples(text, 'muse_http_request_duration_seconds_count{endpoint="main.profile_summary",method="GET",status="200"}'))
+        sql_count = self.samples(text, 'muse_http_request_sql_statements_sum{endpoint="main.profile_summary"}')
+        self.assertTrue(sql_count)
+        self.assertGreaterEqual(float(sql_count[0].split()[-1]), 1)
+        self.assertNotIn('endpoint="metrics"', text)
+        self.assertIn('muse_password_pool_workers', text)
+
+    def test_metrics_local_only(self):
+        """Test that /metrics is hidden from non-local addresses."""
+        self.assertEqual(self.client.get('/metrics').status_code, 200)
+        response = self.client.get('/metrics', environ_base={'REMOTE_ADDR': '10.0.0.1'})
+        self.assertEqual(response.status_code, 404)
+        # proxied from outside, though the proxy connects from 127.0.0.1
+        response = self.client.get('/metrics', headers={'X-Forwarded-For': '203.0.113.7'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_metrics_token(self):
+        """Test that with METRICS_TOKEN set, /metrics needs the token from any address."""
+        self.app.config['METRICS_TOKEN'] = 'scrape-secret'
+        try:
+            self.assertEqual(self.client.get('/metrics').status_code, 404)
+            response = self.client.get('/metrics', headers={'Authorization': 'Bearer wrong'})
+            self.assertEqual(response.status_code, 404)
+            response = self.client.get('/metrics', headers={'Authorization': 'Bearer scrape-secret',
+                                                            'X-Forwarded-For': '203.0.113.7'},
+                                       environ_base={'REMOTE_ADDR': '10.0.0.1'})
+            self.assertEqual(response.status_code, 200)
+        finally:
+            self.app.config['METRICS_TOKEN'] = None
+
+    def test_slow_request_logged(self):
+        """Test that a slow request is logged as one JSON line."""
+        metrics.SLOW_REQUEST_SECONDS = 0
+        with self.assertLogs('muse.requests', level=logging.INFO) as logs:
+            self.client.get('/login')
+        event = json.loads(logs.records[-1].getMessage())
+        self.assertEqual(event['event'], 'request')
+        self.assertEqual(event['endpoint'], 'main.login')
+        self.assertEqual(event['status'], 200)
+        self.assertIn('sql_count', event)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import os
+import tempfile
+import unittest
+import sqlalchemy as sa
+import migrate
+
+class MigrationTests(unittest.TestCase):
+
+    def setUp(self):
+        """Use a throwaway SQLite database file."""
+        handle, self.path = tempfile.mkstemp(suffix='.db')
+        os.close(handle)
+        self.engine = sa.create_engine(f"sqlite:///{self.path}")
+
+    def tearDown(self):
+        self.engine.dispose()
+        os.remove(self.path)
+
+    def index_names(self, table):
+        return {index['name'] for index in sa.inspect(self.engine).get_indexes(table)}
+
+    def test_upgrade_creates_schema(self):
+        """Test that upgrading an empty database creates every table and hot-path index."""
+        applied = migrate.upgrade(self.engine, log=lambda message: None)
+        self.assertEqual(applied, [version for version, _ in migrate.load_migrations()])
+
+        inspector = sa.inspect(self.engine)
+        for table in ('users', 'posts', 'likes', 'comments', 'followers', 'timeline', 'tracks', 'playlists'):
+            self.assertTrue(inspector.has_table(table), table)
+
+        self.assertIn('like_count', {column['name'] for column in inspector.get_columns('posts')})
+        self.assertIn('ix_posts_user_id_timestamp', self.index_names('posts'))
+        self.assertIn('uq_likes_user_post', self.index_names('likes'))
+        self.assertIn('ix_followers_followed_id_id', self.index_names('followers'))
+        self.assertNotIn('ix_followers_followed_id', self.index_names('followers'))
+
+    def test_upgrade_is_recorded(self):
+        """Test that applied migrations are not run again."""
+        migrate.upgrade(self.engine, log=lambda message: None)
+        self.assertEqual(migrate.pending_migrations(self.engine), [])
+        self.assertEqual(migrate.upgrade(self.engine, log=lambda message: None), [])
+
+    def test_duplicates_removed_before_unique_index(self):
+        """Test that an existing database with duplicate likes can be upgraded."""
+        versions = dict(migrate.load_migrations())
+        with self.engine.begin() as conn:
+            versions['0001_baseline'].upgrade(conn)
+            conn.execute(sa.text("INSERT INTO users (id, username, email, password) VALUES (1, 'a', 'a@x.com', 'x')"))
+            conn.execute(sa.text("INSERT INTO posts (id, user_id, spotify_id, spotify_name) VALUES (1, 1, 's', 'Song')"))
+            conn.execute(sa.text("INSERT INTO likes (user_id, post_id) VALUES (1, 1), (1, 1)"))
+
+        migrate.upgrade(self.engine, log=lambda message: None)
+
+        with self.engine.begin() as conn:
+            self.assertEqual(conn.execute(sa.text("SELECT COUNT(*) FROM likes")).scalar(), 1)
+            with self.assertRaises(sa.exc.IntegrityError):
+                conn.execute(sa.text("INSERT INTO likes (user_id, post_id) VALUES (1, 1)"))
+
+    def test_existing_posts_reach_feeds_and_counters(self):
+        """Test that upgrading a database with posts fills the timelines and counters the feed reads."""
+        versions = dict(migrate.load_migrations())
+        with self.engine.begin() as conn:
+            versions['0001_baseline'].upgrade(conn)
+            conn.execute(sa.text("INSERT INTO users (id, username, email, password) "
+                                 "VALUES (1, 'a', 'a@x.com', 'x'), (2, 'b', 'b@x.com', 'x')"))
+            conn.execute(sa.text("INSERT INTO followers (follower_id, followed_id) VALUES (2, 1), (2, 1)"))
+            conn.execute(sa.text("INSERT INTO posts (id, user_id, spotify_id, spotify_name, timestamp) "
+                                 "VALUES (1, 1, 's', 'Song', '2024-01-01 00:00:00')"))
+            conn.execute(sa.text("INSERT INTO likes (user_id, post_id) VALUES (2, 1)"))
+
+        migrate.upgrade(self.engine, log=lambda message: None)
+
+        with self.engine.begin() as conn:
+            self.assertEqual(conn.execute(sa.text("SELECT user_id, post_id, author_id FROM timeline "
+                                                  "ORDER BY user_id")).all(), [(1, 1, 1), (2, 1, 1)])
+            self.assertEqual(conn.execute(sa.text("SELECT like_count FROM posts")).scalar(), 1)
+            self.assertEqual(conn.execute(sa.text("SELECT follower_count, following_count, liked_count "
+                                                  "FROM users ORDER BY id")).all(), [(1, 0, 0), (0, 1, 1)])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,6 @@
 import os
 import unittest
-from app import app
+from app import create_app
 from models import db, User, Post, Follower, Like, Comment
 
 class ModelsTestCase(unittest.TestCase):
@@ -0,0 +1,99 @@
+import threading
+import unittest
+from app import app
+from models import db, User
+from passwords import PasswordHasher, PasswordHasherBusy, hasher, hash_rounds, MIN_ROUNDS
+
+class PasswordHasherTests(unittest.TestCase):
+
+    def test_hash_and_check(self):
+        """Test that a hash made on the pool verifies, and uses the configured cost."""
+        pool = PasswordHasher(rounds=4)
+        password_hash = pool.hash("secret")
+        self.assertEqual(hash_rounds(password_hash), 4)
+        self.assertTrue(pool.check(password_hash, "secret"))
+        self.assertFalse(pool.check(password_hash, "wrong"))
+
+        stats = pool.stats()
+        self.assertEqual(stats['hash_count'], 1)
+        self.assertEqual(stats['check_count'], 2)
+        self.assertEqual(stats['accepted'], 3)
+
+    def test_calibration_respects_floor(self):
+        """Test that calibration never goes below the minimum cost."""
+        pool = PasswordHasher(target_seconds=0.0001)
+        self.assertEqual(pool.calibrate(), MIN_ROUNDS)
+
+    def test_needs_rehash(self):
+        """Test that hashes below the current cost are flagged for upgrade."""
+        pool = PasswordHasher(rounds=5)
+        self.assertTrue(pool.needs_rehash(PasswordHasher(rounds=4).hash("secret")))
+        self.assertFalse(pool.needs_rehash(pool.hash("secret")))
+
+    def test_back_pressure(self):
+        """Test that callers are turned away once the pool and its queue are full."""
+        pool = PasswordHasher(workers=1, max_queue=0, queue_timeout=0.01, rounds=4)
+        release = threading.Event()
+        started = threading.Event()
+
+        def slow():
+            started.set()
+            release.wait(5)
+            return True
+
+        worker = threading.Thread(target=pool._submit, args=('check', slow))
+        worker.start()
+        started.wait(5)
+        try:
+            self.assertEqual(pool.stats()['utilisation'], 1.0)
+            with self.assertRaises(PasswordHasherBusy):
+                pool.check(pool._bcrypt.generate_password_hash("x", 4), "x")
+            self.assertEqual(pool.stats()['rejected'], 1)
+        finally:
+            release.set()
+            worker.join()
+        self.assertEqual(pool.stats()['running'], 0)
+
+
+class RehashOnLoginTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        """Set up the app context and database."""
+        cls.app = app
+        cls.app.config['TESTING'] = True
+        cls.app_context = cls.app.app_context()
+        cls.app_context.push()
+        db.create_all()
+
+    @classmethod
+    def tearDownClass(cls):
+        """Clean up the database."""
+        db.session.remove()
+        db.drop_all()
+        cls.app_context.pop()
+
+    def tearDown(self):
+        db.session.rollback()
+        User.query.delete()
+        db.session.commit()
+        hasher.configure(rounds=self.app.config['PASSWORD_HASH_ROUNDS'])
+
+    def test_old_hash_upgraded_on_login(self):
+        """Test that a successful login re-hashes a password made with a lower cost."""
+        hasher.configure(rounds=4)
+        user = User.signup("rehash", "rehash@example.com", "secret")
+        db.session.commit()
+        self.assertEqual(hash_rounds(user.password), 4)
+
+        hasher.configure(rounds=5)
+        self.assertIsNone(User.authenticate("rehash", "wrong"))
+        self.assertEqual(hash_rounds(User.query.filter_by(username="rehash").one().password), 4)
+
+        user = User.authenticate("rehash", "secret")
+        db.session.commit()
+        self.assertEqual(hash_rounds(user.password), 5)
+        self.assertIsNotNone(User.authenticate("rehash", "secret"))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,187 @@
+import unittest
+from sqlalchemy import event
+from app import app
+from models import db, User, Post, Like, Follower
+from profiles import (get_profile_summary, get_profile_posts, get_liked_posts, get_followers,
+                      get_following, decode_id_cursor)
+
+class ProfileTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        """Set up the app context and database."""
+        cls.app = app
+        cls.app.config['TESTING'] = True
+        cls.app_context = cls.app.app_context()
+        cls.app_context.push()
+        db.create_all()
+
+    @classmethod
+    def tearDownClass(cls):
+        """Clean up the database."""
+        db.session.remove()
+        db.drop_all()
+        cls.app_context.pop()
+
+    def setUp(self):
+        """Create a profile owner and a viewer."""
+        self.owner = User(username="owner", email="owner@example.com", password="hashed")
+        self.viewer = User(username="viewer", email="viewer@example.com", password="hashed")
+        db.session.add_all([self.owner, self.viewer])
+        db.session.commit()
+
+    def tearDown(self):
+        """Remove any data after each test."""
+        db.session.rollback()
+        for model in (Like, Post, Follower, User):
+            model.query.delete()
+        db.session.commit()
+        db.session.remove()
+
+    def add_posts(self, count):
+        """Add `count` posts by the owner."""
+        posts = [Post(user_id=self.owner.id, spotify_id=f"id{i}", spotify_name=f"Song {i}") for i in range(count)]
+        db.session.add_all(posts)
+        db.session.commit()
+        return posts
+
+    def count_queries(self, fn, *args, **kwargs):
+        statements = []
+
+        def count(*args):
+            statements.append(args[2])
+
+        event.listen(db.engine, 'before_cursor_execute', count)
+        try:
+            result = fn(*args, **kwargs)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', count)
+        return result, len(statements)
+
+    def test_summary_in_one_query(self):
+        """Test that counts and follow state come back in a single query."""
+        self.viewer.follow(self.owner)
+        db.session.commit()
+
+        summary, queries = self.count_queries(get_profile_summary, self.owner.id, self.viewer.id)
+        self.assertEqual(queries, 1)
+        self.assertEqual(summary.username, "owner")
+        self.assertEqual(summary.follower_count, 1)
+        self.assertTrue(summary.viewer_follows)
+        self.assertFalse(summary.follows_viewer)
+
+        summary = get_profile_summary(self.viewer.id, self.owner.id)
+        self.assertFalse(summary.viewer_follows)
+        self.assertTrue(summary.follows_viewer)
+        self.assertEqual(summary.following_count, 1)
+
+    def test_summary_missing_user(self):
+        """Test that an unknown user has no summary."""
+        self.assertIsNone(get_profile_summary(999999, self.viewer.id))
+
+    def test_profile_posts_pages(self):
+        """Test that walking the posts cursor visits every post once, newest first."""
+        self.add_posts(7)
+
+        seen = []
+        posts, cursor = get_profile_posts(self.owner.id, self.viewer.id, limit=3)
+        seen.extend(posts)
+        while cursor:
+            posts, cursor = get_profile_posts(self.owner.id, self.viewer.id, cursor=cursor, limit=3)
+            seen.extend(posts)
+
+        self.assertEqual(len({post.id for post in seen}), 7)
+        keys = [(post.timestamp, post.id) for post in seen]
+        self.assertEqual(keys, sorted(keys, reverse=True))
+
+    def test_liked_posts_pages(self):
+        """Test that liked posts page through only the user's likes, with the viewer's like state."""
+        posts = self.add_posts(5)
+        for post in posts[:4]:
+            self.owner.like_post(post)
+        self.viewer.like_post(posts[0])
+        db.session.commit()
+
+        seen = []
+        page, cursor = get_liked_posts(self.owner.id, self.viewer.id, limit=3)
+        seen.extend(page)
+        self.assertIsNotNone(cursor)
+        page, cursor = get_liked_posts(self.owner.id, self.viewer.id, cursor=cursor, limit=3)
+        seen.extend(page)
+        self.assertIsNone(cursor)
+
+        self.assertEqual([post.id for post in seen], sorted((post.id for post in posts[:4]), reverse=True))
+        liked_by_viewer = {post.id for post in seen if post.liked_by_me}
+        self.assertEqual(liked_by_viewer, {posts[0].id})
+
+    def test_invalid_id_cursor(self):
+        """Test that a malformed list cursor is rejected."""
+        with self.assertRaises(ValueError):
+            decode_id_cursor("not-a-cursor")
+
+    def add_followers(self, count):
+        """Add `count` users who follow the owner; return them oldest follow first."""
+        fans = [User(username=f"fan{i}", email=f"fan{i}@example.com", password="hashed") for i in range(count)]
+        db.session.add_all(fans)
+        db.session.commit()
+        for fan in fans:
+            fan.follow(self.owner)
+        db.session.commit()
+        return fans
+
+    def test_followers_pages(self):
+        """Test that walking the followers cursor visits every follower once, newest follow first."""
+        fans = self.add_followers(7)
+
+        seen = []
+        entries, cursor = get_followers(self.owner.id, self.viewer.id, limit=3)
+        seen.extend(entries)
+        while cursor:
+            entries, cursor = get_followers(self.owner.id, self.viewer.id, cursor=cursor, limit=3)
+            seen.extend(entries)
+
+        self.assertEqual([entry.id for entry in seen], [fan.id for fan in reversed(fans)])
+
+    def test_follow_state_in_one_query(self):
+        """Test that a page is annotated with the viewer's follow state in one extra query."""
+        fans = self.add_followers(5)
+        self.viewer.follow(fans[0])
+        fans[1].follow(self.viewer)
+        self.viewer.follow(fans[2])
+        fans[2].follow(self.viewer)
+        db.session.commit()
+
+        (entries, _), queries = self.count_queries(get_followers, self.owner.id, self.viewer.id)
+        self.assertEqual(queries, 2)  # the page, then the follow state for the whole page
+
+        state = {entry.username: (entry.viewer_follows, entry.follows_viewer) for entry in entries}
+        self.assertEqual(state["fan0"], (True, False))
+        self.assertEqual(state["fan1"], (False, True))
+        self.assertEqual(state["fan2"], (True, True))
+        self.assertEqual(state["fan3"], (False, False))
+
+    def test_following_list(self):
+        """Test that the following list holds the users a user follows."""
+        fans = self.add_followers(2)
+        entries, cursor = get_following(fans[0].id, self.viewer.id)
+        self.assertEqual([entry.username for entry in entries], ["owner"])
+        self.assertIsNone(cursor)
+
+    def test_summary_route(self):
+        """Test the JSON profile header."""
+        owner_id = self.owner.id
+        with self.app.test_client() as client:
+            with client.session_transaction() as sess:
+                sess['_user_id'] = str(self.viewer.id)
+            db.session.remove()
+
+            resp = client.get(f'/profile/{owner_id}/summary')
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual(resp.get_json()['username'], "owner")
+
+            self.assertEqual(client.get('/profile/999999/summary').status_code, 404)
+            self.assertEqual(client.get(f'/profile/{owner_id}/likes/page?cursor=bad!').status_code, 400)
+            self.assertEqual(client.get(f'/profile/{owner_id}/followers/page?cursor=bad!').status_code, 400)
+
+if __name__ == '__main__':
+    unittest.main()
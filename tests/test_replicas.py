@@ -0,0 +1,127 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+from sqlalchemy import insert, update, select
+from sqlalchemy.exc import OperationalError
+from app import create_app
+from config import TestingConfig
+from models import db, User, Post
+from identity import user_cache
+from fragments import card_cache
+import replicas
+
+class ReplicaRoutingTests(unittest.TestCase):
+    """Two SQLite files stand in for the primary and a replica that replication has not caught up on."""
+
+    @classmethod
+    def setUpClass(cls):
+        """Build an app with a replica bind and create the schema in both databases."""
+        cls.directory = tempfile.mkdtemp()
+        config = type('ReplicaTestingConfig', (TestingConfig,), {
+            'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(cls.directory, 'primary.db')}",
+            'SQLALCHEMY_BINDS': {'replica_1': f"sqlite:///{os.path.join(cls.directory, 'replica.db')}"},
+        })
+        cls.app = create_app(config)
+        cls.app_context = cls.app.app_context()
+        cls.app_context.push()
+        cls.primary, cls.replica = db.engines[None], db.engines['replica_1']
+        db.metadata.create_all(cls.primary)
+        db.metadata.create_all(cls.replica)
+
+    @classmethod
+    def tearDownClass(cls):
+        """Drop both databases."""
+        db.session.remove()
+        cls.primary.dispose()
+        cls.replica.dispose()
+        cls.app_context.pop()
+        db.metadatas.pop('replica_1')  # registered on the shared db by init_app; other tests' apps have no such bind
+        shutil.rmtree(cls.directory)
+
+    def setUp(self):
+        """Replicate a user and a post, then change the post's caption on the primary only."""
+        user_cache.clear()
+        card_cache.clear()
+        replicas.health.reset()
+        for engine in (self.primary, self.replica):
+            with engine.begin() as conn:
+                conn.execute(insert(User.__table__).values(id=1, username="user", email="user@example.com",
+                                                           password="hashed"))
+                conn.execute(insert(Post.__table__).values(id=1, user_id=1, spotify_id="x", spotify_name="Song",
+                                                           caption="replicated"))
+        with self.primary.begin() as conn:
+            conn.execute(update(Post.__table__).values(caption="not replicated yet"))
+
+        self.client = self.app.test_client()
+        with self.client.session_transaction() as sess:
+            sess['_user_id'] = '1'
+
+    def tearDown(self):
+        """Empty both databases."""
+        db.session.remove()
+        for engine in (self.primary, self.replica):
+            with engine.begin() as conn:
+                for table in reversed(db.metadata.sorted_tables):
+                    conn.execute(table.delete())
+
+    def request(self, method, url, **kwargs):
+        # a fresh app context per request, so no user or ORM state carries over between them
+        with self.app.app_context():
+            response = self.client.open(url, method=method, **kwargs)
+            db.session.remove()
+        return response
+
+    def caption_shown(self):
+        card_cache.clear()  # captions never change for real, so cached cards do not track them
+        html = self.request('GET', '/profile/1').get_data(as_text=True)
+        return 'not replicated yet' if 'not replicated yet' in html else 'replicated'
+
+    def test_reads_go_to_the_replica(self):
+        """Test that a GET request reads from the replica."""
+        self.assertEqual(self.caption_shown(), 'replicated')
+        self.assertEqual(replicas.health.stats()['usable'], 1)
+
+    def test_writes_go_to_the_primary(self):
+        """Test that a write lands on the primary and not the replica."""
+        self.request('POST', '/post/1/like', headers={'Accept': 'application/json'})
+        with self.primary.connect() as conn:
+            self.assertEqual(conn.execute(select(Post.like_count)).scalar(), 1)
+        with self.replica.connect() as conn:
+            self.assertEqual(conn.execute(select(Post.like_count)).scalar(), 0)
+
+    def test_reads_after_a_write_go_to_the_primary(self):
+        """Test that the user reads their own writes for a while after writing."""
+        self.request('POST', '/post/1/like')
+        self.assertEqual(self.caption_shown(), 'not replicated yet')
+
+        # once the marker has expired, reads go back to the replica
+        with self.client.session_transaction() as sess:
+            sess[replicas.PRIMARY_UNTIL] -= self.app.config['READ_YOUR_WRITES_SECONDS'] + 1
+        self.assertEqual(self.caption_shown(), 'replicated')
+        with self.client.session_transaction() as sess:
+            self.assertNotIn(replicas.PRIMARY_UNTIL, sess)
+
+    def test_lagging_replica_falls_back_to_the_primary(self):
+        """Test that a replica further behind than the limit is not read from."""
+        with mock.patch('replicas.replica_lag', return_value=self.app.config['REPLICA_MAX_LAG_SECONDS'] + 1):
+            self.assertEqual(self.caption_shown(), 'not replicated yet')
+        self.assertEqual(self.caption_shown(), 'not replicated yet')  # until the next check
+
+        replicas.health.reset()
+        self.assertEqual(self.caption_shown(), 'replicated')
+
+    def test_unreachable_replica_falls_back_to_the_primary(self):
+        """Test that a replica that cannot be reached is skipped."""
+        down = OperationalError('SELECT 1', {}, Exception('connection refused'))
+        with mock.patch('replicas.replica_lag', side_effect=down):
+            self.assertEqual(self.caption_shown(), 'not replicated yet')
+        self.assertGreaterEqual(replicas.health.stats()['unreachable'], 1)
+
+    def test_reads_outside_requests_go_to_the_primary(self):
+        """Test that CLI commands and jobs read from the primary."""
+        self.assertEqual(db.session.scalar(select(Post.caption)), 'not replicated yet')
+
+if __name__ == '__main__':
+    unittest.main()
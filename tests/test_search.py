@@ -0,0 +1,76 @@
+import unittest
+from app import app
+from models import db, User
+from search import search_users, user_index
+
+class UserSearchTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        """Set up the app context and database."""
+        cls.app = app
+        cls.app.config['TESTING'] = True
+        cls.app_context = cls.app.app_context()
+        cls.app_context.push()
+        db.create_all()
+
+    @classmethod
+    def tearDownClass(cls):
+        """Clean up the database."""
+        db.session.remove()
+        db.drop_all()
+        cls.app_context.pop()
+
+    def setUp(self):
+        """Create users whose names contain 'jazz' in different positions."""
+        for name in ['smoothjazz', 'jazzfan', 'Jazz', 'jazzy_j', 'rockfan', 'acidjazzer']:
+            db.session.add(User(username=name, email=f"{name}@example.com", password="hashed"))
+        db.session.commit()
+        user_index.invalidate()
+
+    def tearDown(self):
+        db.session.rollback()
+        User.query.delete()
+        db.session.commit()
+        user_index.invalidate()
+
+    def usernames(self, query, **kwargs):
+        users, _ = search_users(query, **kwargs)
+        return [user.username for user in users]
+
+    def test_exact_then_prefix_then_substring(self):
+        """Test that exact matches rank before prefix matches, and both before other matches."""
+        self.assertEqual(self.usernames('jazz'),
+                         ['Jazz', 'jazzfan', 'jazzy_j', 'acidjazzer', 'smoothjazz'])
+
+    def test_short_query_matches_prefixes_only(self):
+        """Test that queries shorter than an n-gram only match the start of usernames."""
+        self.assertEqual(self.usernames('ro'), ['rockfan'])
+
+    def test_results_are_paginated(self):
+        """Test that pages follow the ranking and report whether more exist."""
+        first, has_next = search_users('jazz', page=1, per_page=2)
+        self.assertEqual([user.username for user in first], ['Jazz', 'jazzfan'])
+        self.assertTrue(has_next)
+
+        last, has_next = search_users('jazz', page=3, per_page=2)
+        self.assertEqual([user.username for user in last], ['smoothjazz'])
+        self.assertFalse(has_next)
+
+    def test_wildcards_match_literally(self):
+        """Test that LIKE wildcards in the query are not treated as patterns."""
+        self.assertEqual(self.usernames('y_j'), ['jazzy_j'])
+        self.assertEqual(self.usernames('%'), [])
+
+    def test_new_user_is_searchable(self):
+        """Test that users added after the index was built are found."""
+        self.usernames('jazz')  # builds the index
+        user = User(username='jazzhands', email='hands@example.com', password='hashed')
+        db.session.add(user)
+        db.session.commit()
+        user_index.add(user)
+
+        self.assertIn('jazzhands', self.usernames('jazz'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import unittest
+from app import app
+from models import db, User, Follower, Post, Like, Comment, TimelineEntry, Track, reconcile_counters
+import seed
+
+class SeedTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        """Set up the app context and database, and seed a small dataset."""
+        cls.app = app
+        cls.app.config['TESTING'] = True
+        cls.app_context = cls.app.app_context()
+        cls.app_context.push()
+        db.create_all()
+        cls.written = seed.generate(users=200, follows=2000, posts=500, likes=2000, comments=300, tracks=20)
+
+    @classmethod
+    def tearDownClass(cls):
+        """Clean up the database."""
+        db.session.remove()
+        db.drop_all()
+        cls.app_context.pop()
+
+    def test_sizes(self):
+        """Test that the requested rows are written, without self-follows or duplicate likes."""
+        self.assertEqual(User.query.count(), 200)
+        self.assertEqual(Post.query.count(), 500)
+        self.assertEqual(Comment.query.count(), 300)
+        self.assertEqual(Track.query.count(), 20)
+        self.assertEqual(Follower.query.count(), self.written['follows'])
+        self.assertGreater(self.written['follows'], 1800)
+        self.assertEqual(Like.query.count(), self.written['likes'])
+        self.assertEqual(Follower.query.filter(Follower.follower_id == Follower.followed_id).count(), 0)
+
+    def test_counters_match_rows(self):
+        """Test that the counter columns agree with the rows they count."""
+        self.assertEqual(set(reconcile_counters().values()), {0})
+
+    def test_follow_graph_is_skewed(self):
+        """Test that a few users have far more followers than the typical user."""
+        counts = sorted(count for (count,) in db.session.query(User.follower_count))
+        self.assertGreater(counts[-1], 5 * counts[len(counts) // 2])
+
+    def test_timelines_filled(self):
+        """Test that every post is in its author's timeline and its followers' timelines."""
+        post = Post.query.order_by(Post.id).first()
+        follower_ids = {f.follower_id for f in Follower.query.filter_by(followed_id=post.user_id)}
+        timeline_ids = {entry.user_id for entry in TimelineEntry.query.filter_by(post_id=post.id)}
+        self.assertEqual(timeline_ids, follower_ids | {post.user_id})
+
+class SeedAgainTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        """Set up the app context and database."""
+        cls.app = app
+        cls.app.config['TESTING'] = True
+        cls.app_context = cls.app.app_context()
+        cls.app_context.push()
+        db.create_all()
+
+    @classmethod
+    def tearDownClass(cls):
+        """Clean up the database."""
+        db.session.remove()
+        db.drop_all()
+        cls.app_context.pop()
+
+    def test_seeding_again_adds(self):
+        """Test that a second run continues after the existing ids and keeps counters right."""
+        seed.generate(users=20, follows=50, posts=20, likes=50, comments=5, tracks=5)
+        seed.generate(users=5, follows=5, posts=5, likes=5, comments=1, tracks=2, seed=2)
+        self.assertEqual(User.query.count(), 25)
+        self.assertEqual(Post.query.count(), 25)
+        self.assertEqual(Track.query.count(), 7)
+        self.assertEqual(set(reconcile_counters().values()), {0})
+
+if __name__ == '__main__':
+    unittest.main()
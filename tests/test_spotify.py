@@ -0,0 +1,150 @@
+import threading
+import unittest
+from unittest import mock
+import spotify
+from spotify import SpotifyTokenManager, SpotifyClient
+
+def token_response(token, expires_in=3600, status_code=200):
+    response = mock.Mock(status_code=status_code)
+    response.json.return_value = {'access_token': token, 'expires_in': expires_in}
+    return response
+
+class TokenManagerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.manager = SpotifyTokenManager('id', 'secret', refresh_margin=60)
+
+    def test_token_is_cached(self):
+        """Test that a fresh token is reused instead of fetched again."""
+        with mock.patch('spotify.requests.post', return_value=token_response('abc')) as post:
+            self.assertEqual(self.manager.get_token(), 'abc')
+            self.assertEqual(self.manager.get_token(), 'abc')
+        self.assertEqual(post.call_count, 1)
+        self.assertEqual(self.manager.stats()['refresh_count'], 1)
+
+    def test_token_refreshed_before_expiry(self):
+        """Test that a token inside the refresh margin is replaced."""
+        responses = [token_response('old', expires_in=30), token_response('new')]
+        with mock.patch('spotify.requests.post', side_effect=responses):
+            self.assertEqual(self.manager.get_token(), 'old')
+            self.assertEqual(self.manager.get_token(), 'new')
+
+    def test_failed_refresh_returns_none(self):
+        """Test that a refused refresh is counted and returns no token."""
+        with mock.patch('spotify.requests.post', return_value=token_response(None, status_code=400)):
+            self.assertIsNone(self.manager.get_token())
+        self.assertEqual(self.manager.stats()['refresh_failures'], 1)
+
+    def test_concurrent_callers_share_one_refresh(self):
+        """Test that threads racing on an empty cache trigger a single refresh."""
+        gate = threading.Event()
+
+        def slow_post(*args, **kwargs):
+            gate.wait(1)
+            return token_response('shared')
+
+        with mock.patch('spotify.requests.post', side_effect=slow_post) as post:
+            results = []
+            threads = [threading.Thread(target=lambda: results.append(self.manager.get_token()))
+                       for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            gate.set()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(results, ['shared'] * 8)
+        self.assertEqual(post.call_count, 1)
+
+    def test_unauthorized_response_retries_with_new_token(self):
+        """Test that a 401 from the API invalidates the token and retries once."""
+        unauthorized = mock.Mock(status_code=401)
+        ok = mock.Mock(status_code=200)
+        session = mock.Mock()
+        session.get.side_effect = [unauthorized, ok]
+        client = SpotifyClient(self.manager, session=session)
+
+        with mock.patch('spotify.requests.post', side_effect=[token_response('revoked'), token_response('fresh')]):
+            response = client.get('/search', params={'q': 'song'})
+
+        self.assertIs(response, ok)
+        self.assertEqual(session.get.call_args_list[1].kwargs['headers']['Authorization'], 'Bearer fresh')
+
+    def test_no_token_fails_without_calling_the_api(self):
+        """Test that when no token can be had the call fails fast instead of sending "Bearer None"."""
+        session = mock.Mock()
+        client = SpotifyClient(self.manager, session=session)
+
+        with mock.patch.object(self.manager, 'get_token', return_value=None) as get_token:
+            with self.assertRaises(spotify.SpotifyUnavailable):
+                client.get('/search', params={'q': 'song'})
+
+        session.get.assert_not_called()
+        self.assertEqual(get_token.call_count, 1)
+
+    def test_item_errors_are_typed(self):
+        """Test that an unknown item type or a missing item raises ValueError, and a server error SpotifyUnavailable."""
+        with self.assertRaises(ValueError):
+            spotify._get_item('x', 'album')
+        with mock.patch('spotify.spotify_get', return_value=mock.Mock(status_code=404)):
+            with self.assertRaises(ValueError):
+                spotify._get_item('x', 'track')
+        with mock.patch('spotify.spotify_get', return_value=mock.Mock(status_code=502)):
+            with self.assertRaises(spotify.SpotifyUnavailable):
+                spotify._get_item('x', 'playlist')
+
+def search_response(tracks, playlists=(), total=None):
+    """Build a Spotify search response; `total` defaults to the number of items returned."""
+    return {
+        'tracks': {'items': [{'id': name, 'name': name, 'artists': [{'name': artist}]} for name, artist in tracks],
+                   'total': len(tracks) if total is None else total},
+        'playlists': {'items': [{'id': name, 'name': name} for name in playlists],
+                      'total': len(playlists)},
+    }
+
+class AutocompleteTests(unittest.TestCase):
+
+    def setUp(self):
+        spotify.autocomplete_cache.clear()
+
+    def test_repeated_query_is_cached(self):
+        """Test that the same query (up to case and spacing) only goes upstream once."""
+        data = search_response([('Hello', 'Adele')])
+        with mock.patch('spotify.search_spotify_api', return_value=data) as search:
+            first = spotify.autocomplete('hello')
+            second = spotify.autocomplete('  HELLO ')
+
+        self.assertEqual(first, second)
+        self.assertEqual(first['tracks'][0]['artist'], 'Adele')
+        self.assertEqual(search.call_count, 1)
+
+    def test_longer_query_filters_complete_prefix(self):
+        """Test that a complete result for a prefix answers a longer query without going upstream."""
+        data = search_response([('Hello', 'Adele'), ('Help', 'The Beatles')], ['Hello World'])
+        with mock.patch('spotify.search_spotify_api', return_value=data) as search:
+            spotify.autocomplete('hel')
+            results = spotify.autocomplete('hell')
+
+        self.assertEqual(search.call_count, 1)
+        self.assertEqual([track['name'] for track in results['tracks']], ['Hello'])
+        self.assertEqual([playlist['name'] for playlist in results['playlists']], ['Hello World'])
+
+    def test_incomplete_prefix_goes_upstream(self):
+        """Test that a truncated prefix result is not used to answer a longer query."""
+        data = search_response([('Hello', 'Adele')], total=500)
+        with mock.patch('spotify.search_spotify_api', return_value=data) as search:
+            spotify.autocomplete('hel')
+            spotify.autocomplete('hell')
+
+        self.assertEqual(search.call_count, 2)
+
+    def test_upstream_failure_is_not_cached(self):
+        """Test that a failed Spotify search returns None and is retried next time."""
+        with mock.patch('spotify.search_spotify_api', return_value=None) as search:
+            self.assertIsNone(spotify.autocomplete('hello'))
+            self.assertIsNone(spotify.autocomplete('hello'))
+
+        self.assertEqual(search.call_count, 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,140 @@
+import json
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from spotify import SpotifyClient, SpotifyUnavailable, CircuitBreaker, RateLimiter, make_session
+
+class StubSpotify(BaseHTTPRequestHandler):
+    """Replays the responses queued on the server: (status, headers, delay)."""
+
+    protocol_version = 'HTTP/1.1'  # keep-alive, like api.spotify.com
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append(self.path)
+        server.connections.add(self.client_address)
+        status, headers, delay = server.responses.pop(0) if server.responses else (200, {}, 0)
+        if delay:
+            time.sleep(delay)
+
+        body = json.dumps({'path': self.path}).encode()
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        try:
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # the client timed out and went away
+
+    def log_message(self, *args):
+        pass
+
+class FakeTokens:
+    def get_token(self):
+        return 'token'
+
+    def invalidate(self, token):
+        pass
+
+class SpotifyClientTests(unittest.TestCase):
+
+    def setUp(self):
+        """Start a local stub of the Spotify API."""
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StubSpotify)
+        self.server.responses = []
+        self.server.requests = []
+        self.server.connections = set()
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+        self.session = make_session()
+        self.client = SpotifyClient(FakeTokens(),
+                                    session=self.session,
+                                    api_url=f"http://127.0.0.1:{self.server.server_port}/v1",
+                                    timeout=(1, 0.3),
+                                    backoff=0.01,
+                                    breaker=CircuitBreaker(failure_threshold=2, reset_timeout=60))
+
+    def tearDown(self):
+        self.session.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_connections_are_reused(self):
+        """Test that consecutive calls share one keep-alive connection."""
+        for _ in range(3):
+            self.assertEqual(self.client.get('/search').status_code, 200)
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(len(self.server.connections), 1)
+
+    def test_server_errors_are_retried(self):
+        """Test that a 5xx is retried and the later success returned."""
+        self.server.responses = [(503, {}, 0), (200, {}, 0)]
+        self.assertEqual(self.client.get('/search').status_code, 200)
+        self.assertEqual(self.client.stats()['retries'], 1)
+
+    def test_retry_after_is_respected(self):
+        """Test that a 429 waits for Retry-After before retrying."""
+        self.server.responses = [(429, {'Retry-After': '0.2'}, 0), (200, {}, 0)]
+        started = time.monotonic()
+        self.assertEqual(self.client.get('/search').status_code, 200)
+        self.assertGreaterEqual(time.monotonic() - started, 0.2)
+        self.assertEqual(self.client.stats()['rate_limited'], 1)
+
+    def test_long_retry_after_fails_fast(self):
+        """Test that a Retry-After longer than the limiter allows fails fast."""
+        self.server.responses = [(429, {'Retry-After': '30'}, 0)]
+        with self.assertRaises(SpotifyUnavailable):
+            self.client.get('/search')
+        # everyone else is held back too, without calling Spotify
+        with self.assertRaises(SpotifyUnavailable):
+            self.client.get('/search')
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(self.client.breaker.state, 'closed')
+
+    def test_slow_responses_time_out_and_open_the_circuit(self):
+        """Test that read timeouts trip the breaker, which then fails fast."""
+        self.server.responses = [(200, {}, 1)] * 6
+        for _ in range(2):
+            with self.assertRaises(SpotifyUnavailable):
+                self.client.get('/search')
+        self.assertEqual(self.client.breaker.state, 'open')
+
+        calls = len(self.server.requests)
+        with self.assertRaises(SpotifyUnavailable):
+            self.client.get('/search')
+        self.assertEqual(len(self.server.requests), calls)
+
+class RateLimiterTests(unittest.TestCase):
+
+    def test_bucket_limits_bursts(self):
+        """Test that callers beyond the burst wait for new tokens."""
+        limiter = RateLimiter(rate=20, burst=2, max_wait=1)
+        started = time.monotonic()
+        for _ in range(4):
+            limiter.acquire()
+        self.assertGreaterEqual(time.monotonic() - started, 0.09)
+
+class CircuitBreakerTests(unittest.TestCase):
+
+    def test_half_open_trial_closes_circuit(self):
+        """Test that a successful trial after the reset timeout closes the circuit."""
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+        breaker.record_failure()
+        self.assertEqual(breaker.state, 'open')
+        with self.assertRaises(SpotifyUnavailable):
+            breaker.before_call()
+
+        time.sleep(0.06)
+        breaker.before_call()  # the trial call
+        with self.assertRaises(SpotifyUnavailable):
+            breaker.before_call()  # only one trial at a time
+        breaker.record_success()
+        self.assertEqual(breaker.state, 'closed')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+import unittest
+from unittest import mock
+from app import app
+from models import db, User, Post, Follower, TimelineEntry
+from feed import get_feed_page
+import timeline
+
+class TimelineTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        """Set up the app context and database."""
+        cls.app = app
+        cls.app.config['TESTING'] = True
+        cls.app_context = cls.app.app_context()
+        cls.app_context.push()
+        db.create_all()
+
+    @classmethod
+    def tearDownClass(cls):
+        """Clean up the database."""
+        db.session.remove()
+        db.drop_all()
+        cls.app_context.pop()
+
+    def setUp(self):
+        """Create a reader and an author."""
+        self.reader = User(username="reader", email="reader@example.com", password="hashed")
+        self.author = User(username="author", email="author@example.com", password="hashed")
+        db.session.add_all([self.reader, self.author])
+        db.session.commit()
+
+    def tearDown(self):
+        """Remove any data after each test."""
+        db.session.rollback()
+        for model in (TimelineEntry, Post, Follower, User):
+            model.query.delete()
+        db.session.commit()
+
+    def follow(self):
+        self.reader.follow(self.author)
+        timeline.backfill(self.reader, self.author)
+        db.session.commit()
+
+    def add_post(self, name):
+        post = Post(user_id=self.author.id, spotify_id=name, spotify_name=name)
+        db.session.add(post)
+        db.session.flush()
+        timeline.enqueue_fan_out(post)
+        db.session.commit()
+        return post
+
+    def feed_names(self):
+        posts, _ = get_feed_page(self.reader)
+        return [post.spotify_name for post in posts]
+
+    def test_new_post_fans_out_to_followers(self):
+        """Test that a new post lands in the author's and followers' timelines."""
+        self.follow()
+        self.add_post("Fresh")
+
+        self.assertEqual(self.feed_names(), ["Fresh"])
+        self.assertEqual(TimelineEntry.query.filter_by(user_id=self.author.id).count(), 1)
+
+    def test_follow_backfills_and_unfollow_prunes(self):
+        """Test that following copies existing posts in and unfollowing removes them."""
+        self.add_post("Old")
+        self.assertEqual(self.feed_names(), [])
+
+        self.follow()
+        self.assertEqual(self.feed_names(), ["Old"])
+
+        self.reader.unfollow(self.author)
+        timeline.prune(self.reader, self.author)
+        db.session.commit()
+        self.assertEqual(self.feed_names(), [])
+
+    def test_deleted_post_is_removed_from_timelines(self):
+        """Test that deleting a post removes it from every timeline."""
+        self.follow()
+        post = self.add_post("Gone")
+
+        timeline.remove_post(post)
+        db.session.delete(post)
+        db.session.commit()
+
+        self.assertEqual(TimelineEntry.query.count(), 0)
+        self.assertEqual(self.feed_names(), [])
+
+    def test_popular_author_is_merged_on_read(self):
+        """Test that authors over the fan-out limit are read from posts instead of timelines."""
+        self.follow()
+
+        with mock.patch.object(timeline, 'FANOUT_LIMIT', 0):
+            self.add_post("Popular")
+
+        self.assertTrue(self.author.fanout_on_read)
+        self.assertEqual(TimelineEntry.query.filter_by(user_id=self.reader.id).count(), 0)
+        self.assertEqual(self.feed_names(), ["Popular"])
+
+        # back under the limit, the author stays on fan-out on read so "Popular" stays in the feed
+        self.add_post("Later")
+        self.assertTrue(self.author.fanout_on_read)
+        self.assertEqual(self.feed_names(), ["Later", "Popular"])
+
+if __name__ == '__main__':
+    unittest.main()
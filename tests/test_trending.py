@@ -0,0 +1,131 @@
+import unittest
+from datetime import datetime, timedelta
+from sqlalchemy import event
+from app import app
+from models import db, User, Post, Like, Comment, Follower, TimelineEntry, Job, TrackActivity
+from identity import user_cache
+import trending
+
+class TrendingTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        """Set up the app context and database."""
+        cls.app = app
+        cls.app.config['TESTING'] = True
+        cls.app_context = cls.app.app_context()
+        cls.app_context.push()
+        db.create_all()
+
+    @classmethod
+    def tearDownClass(cls):
+        """Clean up the database."""
+        db.session.remove()
+        db.drop_all()
+        cls.app_context.pop()
+
+    def setUp(self):
+        """Create a user and start with empty leaderboards."""
+        user_cache.clear()
+        trending.leaderboards.clear()
+        user = User(username="listener", email="listener@example.com", password="hashed")
+        db.session.add(user)
+        db.session.commit()
+        self.user_id = user.id
+        self.client = self.app.test_client()
+        with self.client.session_transaction() as sess:
+            sess['_user_id'] = str(self.user_id)
+
+    def tearDown(self):
+        """Remove any data after each test."""
+        db.session.rollback()
+        for model in (TrackActivity, Job, TimelineEntry, Comment, Like, Post, Follower, User):
+            model.query.delete()
+        db.session.commit()
+        db.session.remove()
+
+    def request(self, method, url, **kwargs):
+        # a fresh app context per request, so no user or ORM state carries over between them
+        with self.app.app_context():
+            response = self.client.open(url, method=method, **kwargs)
+            db.session.remove()
+        return response
+
+    def top(self, window):
+        trending.leaderboards.clear()
+        return [(item.spotify_id, item.posts, item.likes) for item in trending.get_trending(window)]
+
+    def test_posts_outweigh_likes(self):
+        """Test that items are ranked by posts and likes, a post counting POST_WEIGHT likes."""
+        trending.record('liked', "Liked", likes=trending.POST_WEIGHT - 1)
+        trending.record('posted', "Posted", posts=1)
+        trending.record('posted', "Posted", likes=1)
+        db.session.commit()
+
+        self.assertEqual(self.top('1h'), [('posted', 1, 1), ('liked', 0, trending.POST_WEIGHT - 1)])
+        self.assertEqual(TrackActivity.query.filter_by(spotify_id='posted').count(), 2)  # one row per bucket width
+
+    def test_windows(self):
+        """Test that each window only counts activity inside it."""
+        now = datetime.utcnow()
+        trending.record('recent', "Recent", posts=1, at=now)
+        trending.record('today', "Today", posts=1, at=now - timedelta(hours=3))
+        trending.record('this_week', "This week", posts=1, at=now - timedelta(days=3))
+        trending.record('old', "Old", posts=1, at=now - timedelta(days=8))
+        db.session.commit()
+
+        self.assertEqual([item for item, _, _ in self.top('1h')], ['recent'])
+        self.assertEqual(sorted(item for item, _, _ in self.top('24h')), ['recent', 'today'])
+        self.assertEqual(sorted(item for item, _, _ in self.top('7d')), ['recent', 'this_week', 'today'])
+
+        self.assertEqual(trending.prune(), 2)
+        self.assertEqual(sorted(item for item, _, _ in self.top('7d')), ['recent', 'this_week', 'today'])
+
+    def test_leaderboard_is_cached(self):
+        """Test that a cached leaderboard is served without touching the database."""
+        trending.record('a', "A", posts=1)
+        db.session.commit()
+        trending.get_trending('24h')
+
+        statements = []
+        count = lambda *args: statements.append(args[2])
+        event.listen(db.engine, 'before_cursor_execute', count)
+        try:
+            items = trending.get_trending('24h', limit=5)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', count)
+        self.assertEqual(statements, [])
+        self.assertEqual([item.spotify_id for item in items], ['a'])
+
+    def test_post_like_and_unlike_are_counted(self):
+        """Test that adding a post and liking and unliking it update the counters."""
+        self.request('POST', '/add_post', data={'selected_spotify_id': 'track1', 'spotify_name': 'Song',
+                                                'artist_name': 'Artist', 'caption': ''})
+        post_id = Post.query.filter_by(spotify_id='track1').one().id
+        self.assertEqual(self.top('1h'), [('track1', 1, 0)])
+
+        self.request('POST', f'/post/{post_id}/like')
+        self.assertEqual(self.top('1h'), [('track1', 1, 1)])
+
+        self.request('POST', f'/post/{post_id}/unlike')
+        self.request('POST', f'/post/{post_id}/unlike')  # not liked any more, so not counted again
+        self.assertEqual(self.top('1h'), [('track1', 1, 0)])
+
+    def test_trending_page_and_api(self):
+        """Test the trending page and its JSON."""
+        trending.record('track1', "Song", "Artist", posts=2, likes=1)
+        db.session.commit()
+
+        page = self.request('GET', '/trending?window=7d')
+        self.assertEqual(page.status_code, 200)
+        self.assertIn('Song', page.get_data(as_text=True))
+        self.assertEqual(self.request('GET', '/trending?window=1y').status_code, 404)
+
+        data = self.request('GET', '/trending/top?window=24h&limit=5').get_json()
+        self.assertEqual(data['items'], [{'rank': 1, 'spotify_id': 'track1', 'spotify_name': 'Song',
+                                          'artist_name': 'Artist', 'posts': 2, 'likes': 1,
+                                          'score': 2 * trending.POST_WEIGHT + 1}])
+        self.assertEqual(self.request('GET', '/trending/top?window=1y').status_code, 400)
+
+if __name__ == '__main__':
+    unittest.main()
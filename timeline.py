@@ -0,0 +1,131 @@
+"""Materialised per-user timelines (fan-out on write).
+
+When a post is created it is copied into the timeline of every follower, so
+reading a feed is a single range scan on `timeline` instead of an `IN (...)`
+over everyone the user follows. Following backfills the followed user's recent
+posts and unfollowing prunes them again.
+
+Accounts with more than FANOUT_LIMIT followers (users.follower_count) are
+switched to fan-out on read: their posts only go into their own timeline and
+are merged into followers' feeds when the feed is read (see
+feed.get_feed_page). The switch is one-way. Posts made after it were never
+copied into timelines, so an account that later drops below the limit stays
+on fan-out on read.
+
+The copies into followers' timelines run as background jobs (see jobs.py), so
+posting and following return without waiting for them. The inserts skip
+entries that already exist, so a retried or overlapping job is harmless.
+"""
+
+from sqlalchemy import select, insert, literal, exists
+
+from models import db, User, Follower, Post, TimelineEntry, bump_versions
+import jobs
+
+# above this many followers an author's posts are merged in at read time instead
+FANOUT_LIMIT = 5000
+
+# how many of a newly followed user's posts are copied into the follower's timeline
+BACKFILL_LIMIT = 200
+
+
+def add_to_own_timeline(post):
+    """Put a new post in its author's own timeline."""
+    db.session.add(TimelineEntry(user_id=post.user_id,
+                                 post_id=post.id,
+                                 author_id=post.user_id,
+                                 timestamp=post.timestamp))
+
+
+def enqueue_fan_out(post):
+    """Put a new post in its author's timeline now and in their followers' timelines from a job."""
+    add_to_own_timeline(post)
+    jobs.enqueue('fan_out_post', key=f"fan_out_post:{post.id}", post_id=post.id)
+
+
+def fan_out_to_followers(post):
+    """Copy a post into the timelines of the author's followers, unless the author is too popular."""
+    author = post.author
+
+    # one-way: posts made in pull mode were never copied, so switching back would drop them from feeds
+    if not author.fanout_on_read and author.follower_count > FANOUT_LIMIT:
+        author.fanout_on_read = True
+
+    if author.fanout_on_read:
+        return
+
+    followers = (select(Follower.follower_id,
+                        literal(post.id),
+                        literal(post.user_id),
+                        literal(post.timestamp))
+                 .where(Follower.followed_id == post.user_id,
+                        Follower.follower_id != post.user_id,
+                        ~exists().where(TimelineEntry.user_id == Follower.follower_id,
+                                        TimelineEntry.post_id == post.id))
+                 .distinct())
+
+    db.session.execute(insert(TimelineEntry).from_select(
+        ['user_id', 'post_id', 'author_id', 'timestamp'], followers))
+    bump_versions(select(Follower.follower_id).where(Follower.followed_id == post.user_id))
+
+
+def backfill(follower, followed):
+    """Copy the followed user's most recent posts into the follower's timeline."""
+    if followed.fanout_on_read:
+        return  # their posts are merged in at read time
+
+    recent_posts = (select(literal(follower.id), Post.id, Post.user_id, Post.timestamp)
+                    .where(Post.user_id == followed.id,
+                           ~exists().where(TimelineEntry.user_id == follower.id,
+                                           TimelineEntry.post_id == Post.id))
+                    .order_by(Post.timestamp.desc())
+                    .limit(BACKFILL_LIMIT))
+
+    db.session.execute(insert(TimelineEntry).from_select(
+        ['user_id', 'post_id', 'author_id', 'timestamp'], recent_posts))
+    bump_versions([follower.id])
+
+
+def enqueue_backfill(follower, followed):
+    jobs.enqueue('backfill', follower_id=follower.id, followed_id=followed.id)
+
+
+@jobs.handler('fan_out_post')
+def fan_out_post_job(post_id):
+    post = db.session.get(Post, post_id)
+    if post is not None:  # deleted before the job ran
+        fan_out_to_followers(post)
+
+
+@jobs.handler('backfill')
+def backfill_job(follower_id, followed_id):
+    still_following = db.session.scalar(select(exists().where(Follower.follower_id == follower_id,
+                                                              Follower.followed_id == followed_id)))
+    if still_following:  # an unfollow may have pruned the timeline since
+        backfill(db.session.get(User, follower_id), db.session.get(User, followed_id))
+
+
+def prune(follower, followed):
+    """Remove the followed user's posts from the follower's timeline."""
+    TimelineEntry.query.filter_by(user_id=follower.id, author_id=followed.id).delete()
+
+
+def remove_post(post):
+    """Remove a post from every timeline it was copied into."""
+    bump_versions(select(TimelineEntry.user_id).where(TimelineEntry.post_id == post.id))
+    TimelineEntry.query.filter_by(post_id=post.id).delete()
+
+
+def rebuild_timeline(user):
+    """Rebuild a user's timeline from scratch (own posts plus recent posts of everyone they follow)."""
+    TimelineEntry.query.filter_by(user_id=user.id).delete()
+
+    own_posts = (select(literal(user.id), Post.id, Post.user_id, Post.timestamp)
+                 .where(Post.user_id == user.id))
+
+    db.session.execute(insert(TimelineEntry).from_select(
+        ['user_id', 'post_id', 'author_id', 'timestamp'], own_posts))
+
+    for follow in user.followed:
+        if follow.followed_id != user.id:
+            backfill(user, follow.followed)
@@ -0,0 +1,153 @@
+"""Trending tracks: Spotify items ranked by recent posts and likes.
+
+Posting, liking and unliking add to per-item counters in `track_activity`,
+one row per item and time bucket. Each event is a single upsert of two rows:
+a 5-minute bucket, which the 1h leaderboard sums, and an hourly bucket, which
+the 24h and 7d leaderboards sum. Nothing ever groups the posts or likes tables.
+
+A leaderboard is the TOP_K items of one window by score (a post counts
+POST_WEIGHT likes). It is built from the window's buckets, which scales with
+the items active in the window rather than with the total number of posts and
+likes. The result is kept for LEADERBOARD_TTL seconds, so a request is
+answered from memory. Concurrent misses share one build.
+
+Likes are not timestamped, so an unlike is taken off the current bucket even
+when the like was older. Sums are floored at zero. Deleting a post leaves its
+activity in place until the buckets age out. `flask trending prune` deletes
+buckets older than the longest window.
+"""
+
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, func
+
+from cache import TTLCache, SingleFlight
+from models import db, TrackActivity
+
+POST_WEIGHT = 3
+TOP_K = 50
+LEADERBOARD_TTL = 60  # seconds; how stale a leaderboard can be
+
+FINE_BUCKET = 300     # seconds
+COARSE_BUCKET = 3600
+
+# window name -> (length, bucket width it sums)
+WINDOWS = {
+    '1h': (timedelta(hours=1), FINE_BUCKET),
+    '24h': (timedelta(hours=24), COARSE_BUCKET),
+    '7d': (timedelta(days=7), COARSE_BUCKET),
+}
+DEFAULT_WINDOW = '24h'
+
+EPOCH = datetime(1970, 1, 1)
+
+leaderboards = TTLCache(maxsize=len(WINDOWS), ttl=LEADERBOARD_TTL)
+leaderboard_flight = SingleFlight()
+
+
+class TrendingItem:
+    """One row of a leaderboard. Shaped like a post card's item, so catalog.hydrate() can add album art."""
+
+    __slots__ = ('rank', 'spotify_id', 'spotify_name', 'artist_name', 'posts', 'likes', 'score', 'catalog')
+
+    def __init__(self, **fields):
+        for name in self.__slots__:
+            setattr(self, name, fields.get(name))
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__ if name != 'catalog'}
+
+    def __repr__(self):
+        return f"<TrendingItem {self.rank} {self.spotify_id}>"
+
+
+def bucket_start(at, width):
+    """The start of the `width`-second bucket that `at` falls in."""
+    return EPOCH + timedelta(seconds=int((at - EPOCH).total_seconds()) // width * width)
+
+
+def _upsert():
+    if db.session.get_bind().dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert
+
+
+def record(spotify_id, name, artist_name=None, posts=0, likes=0, at=None):
+    """Add `posts` and `likes` (either may be negative) to the item's current buckets. The caller commits."""
+    at = at or datetime.utcnow()
+    rows = [{'spotify_id': spotify_id, 'width': width, 'bucket': bucket_start(at, width),
+             'name': name, 'artist_name': artist_name, 'posts': posts, 'likes': likes}
+            for width in (FINE_BUCKET, COARSE_BUCKET)]
+
+    table = TrackActivity.__table__
+    statement = _upsert()(table).values(rows)
+    statement = statement.on_conflict_do_update(
+        index_elements=['spotify_id', 'width', 'bucket'],
+        set_={'posts': table.c.posts + statement.excluded.posts,
+              'likes': table.c.likes + statement.excluded.likes,
+              'name': statement.excluded.name,
+              'artist_name': statement.excluded.artist_name})
+    db.session.execute(statement)
+
+
+def record_post(post):
+    record(post.spotify_id, post.spotify_name, post.artist_name, posts=1)
+
+
+def record_like(post, amount=1):
+    """Count a like (or, with -1, an unlike) of `post`."""
+    record(post.spotify_id, post.spotify_name, post.artist_name, likes=amount)
+
+
+def build_leaderboard(window, now=None):
+    """Compute the TOP_K items of `window` from its buckets, as dicts."""
+    length, width = WINDOWS[window]
+    now = now or datetime.utcnow()
+
+    posts = func.sum(TrackActivity.posts)
+    likes = func.sum(TrackActivity.likes)
+    score = posts * POST_WEIGHT + likes
+    rows = db.session.execute(
+        select(TrackActivity.spotify_id,
+               func.max(TrackActivity.name).label('spotify_name'),
+               func.max(TrackActivity.artist_name).label('artist_name'),
+               posts.label('posts'),
+               likes.label('likes'),
+               score.label('score'))
+        .where(TrackActivity.width == width,
+               TrackActivity.bucket > now - length)
+        .group_by(TrackActivity.spotify_id)
+        .having(score > 0)
+        .order_by(score.desc(), TrackActivity.spotify_id)
+        .limit(TOP_K))
+
+    return [dict(row._mapping, rank=rank, posts=max(row.posts, 0), likes=max(row.likes, 0))
+            for rank, row in enumerate(rows, 1)]
+
+
+def get_trending(window=DEFAULT_WINDOW, limit=TOP_K):
+    """The top `limit` (at most TOP_K) items of `window` as TrendingItems. Raises KeyError for an unknown window."""
+    if window not in WINDOWS:
+        raise KeyError(window)
+
+    entries = leaderboards.get(window)
+    if entries is None:
+        entries = leaderboard_flight.do(window, build_leaderboard, window)
+        leaderboards.set(window, entries)
+
+    # fresh objects per request; the cached dicts are shared between threads
+    return [TrendingItem(**entry) for entry in entries[:max(0, min(limit, TOP_K))]]
+
+
+def prune(now=None):
+    """Delete buckets older than the longest window. Returns the number of rows deleted."""
+    now = now or datetime.utcnow()
+    oldest = now - max(length for length, _ in WINDOWS.values()) - timedelta(seconds=COARSE_BUCKET)
+    return TrackActivity.query.filter(TrackActivity.bucket < oldest).delete(synchronize_session=False)
+
+
+def stats():
+    """Leaderboard cache and build counters, for monitoring."""
+    return dict(leaderboards.stats(), builds=leaderboard_flight.calls, collapsed=leaderboard_flight.collapsed)